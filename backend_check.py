@@ -0,0 +1,171 @@
+import numpy as np
+import datetime
+import sys
+import time
+
+import bert
+import filters
+import find_suggestions
+import models
+
+# FILEPATH VARIABLES FOR EASE:
+SAMPLES : str = "./datafiles/all_samples.csv"
+
+LIMIT : int = 200       # masked sentences compared (one per complex word)
+TOP_K : int = bert.TOP_K
+
+# Backends compared with FP32 / models checked by default:
+BACKENDS : list[str] = ["INT8", "ONNX"]
+MODELS : list[str] = ["MODERN", "BIO"]
+
+def get_masked_sentences(samples : str, limit : int = LIMIT) -> list[tuple[str, str]]:
+    """
+    Masks each complex word of the sample sentences, as the BERT searches do.
+
+    RETURNS : up to limit (BERT formatted sentence, masked sentence) pairs
+    """
+    ngsl : list[str] = filters.get_freq(filters.FREQ_FILE).keys()
+    masked : list[tuple[str, str]] = []
+
+    for sentence, words, formatted in filters.parse_sentences(find_suggestions.get_samples(samples)):
+        for original in words:
+            if (not filters.skip(original, ngsl) and original.word in formatted.split()):
+                masked.append((formatted, bert.add_mask(formatted, original.word)))
+
+            if (len(masked) == limit):
+                return masked
+
+    return masked
+
+
+def run_fill_mask(pipeline, masked : list[str], top_k : int = TOP_K) -> tuple[list, float]:
+    """
+    RETURNS : predictions for the first mask of each sentence, seconds taken
+    """
+    start : float = time.perf_counter()
+    outputs = pipeline(masked, batch_size = bert.FILL_BATCH_SIZE, top_k = top_k)
+
+    return ([bert.first_mask(output) for output in outputs], time.perf_counter() - start)
+
+
+def compare_fill_mask(name : str, backend : str, masked : list[str],
+                      top_k : int = TOP_K) -> tuple[dict, list[str]]:
+    """
+    Compares the top-k predictions of a fill-mask model run with the backend
+    against FP32 : how often the first token matches, how many of the k tokens
+    are shared and how far apart the scores of shared tokens are.
+
+    RETURNS : result row, and the FP32 top sequence of each sentence (to score)
+    """
+    model : str = models.BIO_BERT if (name == "BIO") else models.MODERN_BERT
+
+    baseline, fp32_seconds = run_fill_mask(models.load_fill_mask(model, "FP32"), masked, top_k)
+    compared, seconds = run_fill_mask(models.load_fill_mask(model, backend), masked, top_k)
+
+    top_1 : int = 0
+    overlap : list[float] = []
+    errors : list[float] = []
+
+    for expected, found in zip(baseline, compared):
+        expected_scores : dict = {item["token_str"] : item["score"] for item in expected}
+        found_scores : dict = {item["token_str"] : item["score"] for item in found}
+        shared : set[str] = set(expected_scores) & set(found_scores)
+
+        top_1 += (expected[0]["token_str"] == found[0]["token_str"])
+        overlap.append(len(shared) / top_k)
+        errors += [abs(expected_scores[token] - found_scores[token]) for token in shared]
+
+    row : dict = {"OPTION" : f"{name}BERT {backend}", "TOP-1" : top_1 / len(masked),
+                  "OVERLAP" : float(np.mean(overlap)),
+                  "ERROR" : float(np.mean(errors)) if (len(errors) > 0) else 0.0,
+                  "MAX ERROR" : float(np.max(errors)) if (len(errors) > 0) else 0.0,
+                  "SPEEDUP" : fp32_seconds / seconds}
+
+    return (row, [predictions[0]["sequence"] for predictions in baseline])
+
+
+def compare_scoring(backend : str, pairs : list[tuple[str, str]]) -> dict:
+    """
+    Compares BERTScore run with the backend against FP32 : how far apart the
+    scores are and how often the order of two consecutive pairs is kept.
+    """
+    scores : dict[str : list[float]] = {}
+    timings : dict[str : float] = {}
+
+    for option in ["FP32", backend]:
+        metric = models.load_bertscore(option)
+        start : float = time.perf_counter()
+
+        results = metric.compute(predictions = [pair[1] for pair in pairs],
+                                 references = [pair[0] for pair in pairs],
+                                 lang = "en", batch_size = bert.SCORE_BATCH_SIZE)
+        timings[option] = time.perf_counter() - start
+        scores[option] = results["precision"]
+
+    expected = np.array(scores["FP32"])
+    found = np.array(scores[backend])
+    errors = np.abs(expected - found)
+    same_order = np.sign(np.diff(expected)) == np.sign(np.diff(found))
+
+    return {"OPTION" : f"BERTSCORE {backend}", "TOP-1" : float(np.mean(same_order)),
+            "OVERLAP" : 1.0, "ERROR" : float(np.mean(errors)), "MAX ERROR" : float(np.max(errors)),
+            "SPEEDUP" : timings["FP32"] / timings[backend]}
+
+
+def check(samples : str, backends : list[str] = BACKENDS, names : list[str] = MODELS,
+          limit : int = LIMIT) -> list[dict]:
+    """
+    Compares every backend with FP32 for the fill-mask models and BERTScore,
+    on the complex words of the samples.
+
+    RETURNS : list of result rows
+    """
+    masked : list[tuple[str, str]] = get_masked_sentences(samples, limit)
+    print(f"> Comparing backends with FP32 on {len(masked)} masked sentences from {samples}")
+
+    rows : list[dict] = []
+    pairs : list[tuple[str, str]] = []
+
+    for backend in backends:
+        for name in names:
+            row, sequences = compare_fill_mask(name, backend, [pair[1] for pair in masked])
+            rows.append(row)
+
+            # score the FP32 suggestions against their original sentence
+            if (len(pairs) == 0):
+                pairs = [(sentence, sequence) for (sentence, mask), sequence in zip(masked, sequences)]
+
+        rows.append(compare_scoring(backend, pairs))
+
+    return rows
+
+
+def record_check(rows : list[dict]):
+    timestamp = datetime.datetime.now()
+
+    with open(f"./output/BACKEND-CHECK-{timestamp}.txt", "a") as log:
+        log.write(f"TIMESTAMP : {timestamp}\n")
+        log.write(f"(TOP-1 : same first token for fill-mask, same order of consecutive pairs "
+                  f"for BERTScore; OVERLAP : share of the top-{TOP_K} tokens kept)\n")
+        log.write(f"{'OPTION':<20}{'TOP-1':>10}{'OVERLAP':>10}{'ERROR':>12}{'MAX ERROR':>12}"
+                  f"{'SPEEDUP':>10}\n")
+
+        for row in rows:
+            line = (f"{row['OPTION']:<20}{row['TOP-1']:>10.4f}{row['OVERLAP']:>10.4f}"
+                    f"{row['ERROR']:>12.5f}{row['MAX ERROR']:>12.5f}{row['SPEEDUP']:>9.2f}x")
+            print(line)
+            log.write(f"{line}\n")
+
+
+# python3 backend_check.py [int8] [onnx] [modern] [bio] [--limit N] [--offline]
+if __name__ == "__main__":
+    args, options = find_suggestions.parse_options(sys.argv[1:])
+    backends : list[str] = [arg.upper() for arg in args if arg.upper() in BACKENDS]
+    names : list[str] = [arg.upper() for arg in args if arg.upper() in MODELS]
+    limit : int = int(options.get("--limit", LIMIT))
+
+    if ("--offline" in options):
+        models.set_offline(True)
+
+    rows = check(SAMPLES, backends or BACKENDS, names or MODELS, limit)
+    record_check(rows)
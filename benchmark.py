@@ -0,0 +1,435 @@
+import numpy as np
+import datetime
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+from word import Word
+import bert
+import features
+import filters
+import find_suggestions
+import glove
+import lexicon
+import models
+import wordnet
+
+# Stages are timed at each (vocabulary size, number of sentences):
+SIZES : list[tuple[int, int]] = [(5000, 10), (20000, 40), (80000, 160)]
+QUICK_SIZES : list[tuple[int, int]] = [(2000, 5), (5000, 10)]
+DEPTH : int = 50                # depth of the generated vectors
+QUERY_WORDS : int = 200         # complex words searched by the per-word stages
+REPEATS : int = 3               # each stage is run this many times, keeping the fastest
+
+# JSON baseline compared against (python3 benchmark.py --save to replace it):
+BASELINE : str = "./datafiles/benchmark_baseline.json"
+REGRESSION_FACTOR : float = 1.5     # slower than baseline by this much = regression
+MIN_SECONDS : float = 0.05          # ignore differences below this (timer noise)
+
+SEED : int = 0
+SYLLABLES : list[str] = ["ab", "ra", "sion", "con", "tu", "lo", "mi", "ter", "na", "phy",
+                         "cal", "gen", "tic", "der", "ma", "os", "is", "pro", "cy", "te"]
+FUNCTION_WORDS : dict[str : str] = {
+    "the" : "DET", "a" : "DET", "an" : "DET", "her" : "PRON", "his" : "PRON",
+    "she" : "PRON", "he" : "PRON", "on" : "ADP", "in" : "ADP", "of" : "ADP",
+    "was" : "AUX", "had" : "VERB", "to" : "PART", "and" : "CCONJ"
+}
+CONTENT_TAGS : list[str] = ["NOUN", "VERB", "ADJ", "ADV"]
+
+def stable_hash(text : str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+# STUB MODELS (registered in place of the real ones, see use_stubs):
+class StubToken:
+    text : str
+    pos_ : str
+
+    def __init__(self, text : str, pos : str):
+        self.text = text
+        self.pos_ = pos
+
+
+class StubNLP:
+    """
+    Stands in for Spacy : splits words / punctuation and tags each word with a
+    fixed POS (function words) or one picked by hashing the word.
+    """
+    def __call__(self, text : str) -> list[StubToken]:
+        tokens : list[StubToken] = []
+
+        for part in re.findall(r"\w[\w-]*|[^\w\s]", text):
+            if (not part[0].isalnum()):
+                tokens.append(StubToken(part, "PUNCT"))
+            elif (part.lower() in FUNCTION_WORDS):
+                tokens.append(StubToken(part, FUNCTION_WORDS[part.lower()]))
+            else:
+                tokens.append(StubToken(part, CONTENT_TAGS[stable_hash(part.lower()) % 4]))
+
+        return tokens
+
+    def pipe(self, texts, as_tuples : bool = False, batch_size : int = 1, n_process : int = 1):
+        for item in texts:
+            if (as_tuples):
+                yield (self(item[0]), item[1])
+            else:
+                yield self(item)
+
+
+class StubFillMask:
+    """
+    Stands in for a fill-mask pipeline : fills each mask with top_k words of
+    the vocabulary picked by hashing the sentence.
+    """
+    words : list[str]
+
+    def __init__(self, words : list[str]):
+        self.words = words
+
+    def fill(self, sentence : str, top_k : int) -> list:
+        rng = np.random.default_rng(stable_hash(sentence))
+        masks : list[list[dict]] = []
+
+        for mask in range(max(1, sentence.count("[MASK]"))):
+            options : list[dict] = []
+            for i in rng.choice(len(self.words), top_k, replace = False):
+                word : str = self.words[i]
+                options.append({"token_str" : f" {word}", "score" : 1 / (len(options) + 1),
+                                "sequence" : sentence.replace("[MASK]", word, 1)})
+            masks.append(options)
+
+        return masks[0] if (len(masks) == 1) else masks
+
+    def __call__(self, inputs, batch_size : int = 1, top_k : int = 5):
+        if (type(inputs) == str):
+            return self.fill(inputs, top_k)
+
+        return [self.fill(sentence, top_k) for sentence in inputs]
+
+
+class StubBERTScore:
+    """
+    Stands in for the BERTScore metric : precision = share of the prediction's
+    words found in the reference.
+    """
+    def compute(self, predictions : list[str], references : list[str], lang : str = "en",
+                batch_size : int = 64) -> dict:
+        precision : list[float] = []
+
+        for prediction, reference in zip(predictions, references):
+            words : list[str] = prediction.split()
+            found : set[str] = set(reference.split())
+            precision.append(sum(word in found for word in words) / max(1, len(words)))
+
+        return {"precision" : precision}
+
+
+class StubSynset:
+    names : list[str]
+    tag : str
+
+    def __init__(self, names : list[str], tag : str):
+        self.names = names
+        self.tag = tag
+
+    def pos(self) -> str:
+        return self.tag
+
+    def lexname(self) -> str:
+        return f"{wordnet.TAGS[self.tag].lower()}.all"
+
+    def lemma_names(self) -> list[str]:
+        return self.names
+
+
+class StubWordNet:
+    """
+    Stands in for the NLTK WordNet corpus : the vocabulary split at random into
+    synsets of 2 - 6 words, each with a random POS.
+    """
+    lemmas : dict[str : list[StubSynset]]
+
+    def __init__(self, words : list[str]):
+        rng = np.random.default_rng(SEED)
+        order = rng.permutation(len(words))
+        self.lemmas = {}
+        start : int = 0
+
+        while (start < len(order)):
+            size : int = int(rng.integers(2, 7))
+            names : list[str] = [words[i] for i in order[start : start + size]]
+            synset = StubSynset(names, "nvar"[int(rng.integers(0, 4))])
+
+            for name in names:
+                self.lemmas.setdefault(name, []).append(synset)
+            start += size
+
+    def all_lemma_names(self) -> list[str]:
+        return list(self.lemmas.keys())
+
+    def synsets(self, lemma : str) -> list[StubSynset]:
+        return self.lemmas.get(lemma, [])
+
+    def open(self, filename : str) -> list[str]:
+        # no morphy exception lists
+        return []
+
+
+def use_stubs(words : list[str]):
+    """
+    Registers the stub models in the model registry, so nothing is downloaded
+    or loaded from disk.
+    """
+    models.register("spacy", StubNLP)
+    models.register("modern_bert", lambda : StubFillMask(words))
+    models.register("bio_bert", lambda : StubFillMask(words))
+    models.register("bertscore", StubBERTScore)
+    models.register("wordnet", lambda : StubWordNet(words))
+
+
+# FIXTURES:
+def make_vocabulary(ngsl : list[str], size : int) -> list[str]:
+    """
+    Returns NGSL words followed by made-up words of 2 - 5 syllables, size in
+    total (most 'frequent' first, as in GloVe).
+    """
+    rng = np.random.default_rng(SEED)
+    words : list[str] = list(ngsl)[: size // 4]
+    seen : set[str] = set(words)
+
+    while (len(words) < size):
+        parts = rng.choice(SYLLABLES, int(rng.integers(2, 6)))
+        word : str = "".join(parts)
+
+        if (word not in seen):
+            seen.add(word)
+            words.append(word)
+
+    return words
+
+
+def make_glove_file(directory : str, words : list[str]) -> str:
+    """
+    Writes random vectors for the words in the GloVe text format.
+
+    RETURNS : filepath of the file
+    """
+    rng = np.random.default_rng(SEED)
+    filepath : str = os.path.join(directory, f"glove.bench{len(words)}.{DEPTH}d.txt")
+
+    with open(filepath, "w") as data:
+        for word in words:
+            vector = rng.normal(size = DEPTH).astype("float32")
+            data.write(f"{word} {' '.join(f'{value:.5f}' for value in vector)}\n")
+
+    return filepath
+
+
+def make_sentences(words : list[str], count : int) -> list[str]:
+    """
+    Returns sentences mixing function words, common words and made-up words.
+    """
+    rng = np.random.default_rng(SEED)
+    sentences : list[str] = []
+    common : list[str] = words[: len(words) // 4]
+    complex : list[str] = words[len(words) // 4 :]
+
+    for i in range(count):
+        parts : list[str] = ["The", str(rng.choice(complex)), "was", "on", "her"]
+        for j in range(int(rng.integers(3, 9))):
+            parts.append(str(rng.choice(common if (j % 2 == 0) else complex)))
+        sentences.append(" ".join(parts) + ".")
+
+    return sentences
+
+
+def time_stage(results : dict, stage : str, size : str, function, *args,
+               repeats : int = REPEATS):
+    """
+    Runs function(*args) repeats times, recording the fastest run under
+    results[stage][size] (the fastest run is the least disturbed by the rest of
+    the machine).
+
+    - repeats : 1 for stages which change their input (e.g. add_scores)
+
+    RETURNS : whatever the function returns
+    """
+    fastest : float = float("inf")
+
+    for repeat in range(repeats):
+        start : float = time.perf_counter()
+        output = function(*args)
+        fastest = min(fastest, time.perf_counter() - start)
+
+    results.setdefault(stage, {})[size] = round(fastest, 4)
+    print(f"> {stage} @ {size} : {results[stage][size]}s")
+
+    return output
+
+
+def benchmark_size(results : dict, directory : str, ngsl : list[str], vocab_size : int,
+                   sentence_count : int):
+    """
+    Times every stage on fixtures with the given vocabulary size / number of
+    sentences.
+    """
+    size : str = f"{vocab_size}x{sentence_count}"
+    words : list[str] = make_vocabulary(ngsl, vocab_size)
+    sentences : list[str] = make_sentences(words, sentence_count)
+    use_stubs(words)
+
+    filepath : str = make_glove_file(directory, words)
+
+    # GloVe loading : text file, conversion, memory-mapped cache
+    time_stage(results, "get_faiss_vectors (text)", size, glove.get_faiss_vectors, filepath)
+    time_stage(results, "convert_vectors", size, glove.convert_vectors, filepath)
+    glove_data : tuple = time_stage(results, "get_faiss_vectors (cached)", size,
+                                    glove.get_faiss_vectors, filepath)
+    index, embeddings, ids = glove_data
+
+    # WordNet lexicon compiled from the stub corpus
+    wordnet.entries = {}
+    wordnet.compiled = time_stage(results, "wordnet lexicon", size, lexicon.build_lexicon,
+                                  models.get_wordnet(), wordnet.TAGS)
+
+    # Complex words of the corpus, as find_suggestions would search them
+    originals : list[Word] = []
+    seen : set[tuple] = set()
+    for sentence, tokens, formatted in filters.parse_sentences(sentences):
+        for original in tokens:
+            if (not filters.skip(original, ngsl) and (original.word, original.type) not in seen):
+                seen.add((original.word, original.type))
+                originals.append(original)
+    originals = originals[:QUERY_WORDS]
+
+    neighbours : list[list[str]] = time_stage(
+        results, "find_k_closest", size,
+        lambda : [glove.find_k_closest(index, embeddings, ids, original.word, glove.K_FIRST)
+                  for original in originals])
+
+    time_stage(results, "sort_suggestions", size,
+               lambda : [filters.sort_suggestions(found, ngsl, original)
+                         for found, original in zip(neighbours, originals)])
+
+    columns : dict = features.build_features(words, filters.get_freq(filters.FREQ_FILE))
+    table = features.FeatureTable(embeddings.rows, columns)
+    time_stage(results, "sort_suggestions (table)", size,
+               lambda : [filters.sort_suggestions(found, ngsl, original, table)
+                         for found, original in zip(neighbours, originals)])
+
+    first : list[list[Word]] = time_stage(results, "wordnet.word_search", size,
+                                          lambda : [wordnet.word_search(ngsl, original)
+                                                    for original in originals])
+    time_stage(results, "wordnet.list_search", size,
+               lambda : [wordnet.list_search(ngsl, current, original)
+                         for current, original in zip(first, originals)])
+
+    # BERT : every complex word of every sentence
+    parsed : list[tuple] = list(filters.parse_sentences(sentences))
+    time_stage(results, "bert.word_search", size,
+               lambda : [bert.word_search(ngsl, sentence, original, "MODERN", formatted)
+                         for sentence, tokens, formatted in parsed
+                         for original in tokens if not filters.skip(original, ngsl)])
+
+    # Whole pipeline : search, scoring, output
+    suggestions = time_stage(results, "find_suggestions (GLOVE-GLOVE)", size,
+                             find_suggestions.find_suggestions, glove_data, ngsl, sentences,
+                             "GLOVE", "GLOVE")
+    time_stage(results, "add_scores", size, find_suggestions.add_scores, suggestions,
+               embeddings, "BERT", repeats = 1)
+
+    # record_results appends to its files, so each run writes to a fresh root
+    os.makedirs(os.path.join(directory, "output"), exist_ok = True)
+    roots = (os.path.join(directory, "output", f"GLOVE-GLOVE-{size}-{run}") for run in range(REPEATS))
+    time_stage(results, "record_results", size,
+               lambda : find_suggestions.record_results(suggestions, size, 15, "GLOVE", "GLOVE",
+                                                        "BERT", next(roots)))
+
+
+def run_benchmark(sizes : list[tuple[int, int]]) -> dict:
+    """
+    Times every stage at each size on generated fixtures, with stub models.
+
+    RETURNS : dictionary of stage -> size ("{vocabulary}x{sentences}") -> seconds
+    """
+    results : dict = {}
+    ngsl : list[str] = filters.get_freq(filters.FREQ_FILE).keys()
+    directory : str = tempfile.mkdtemp(prefix = "benchmark-")
+
+    try:
+        for vocab_size, sentence_count in sizes:
+            print(f"> Benchmarking {vocab_size} words, {sentence_count} sentences")
+            benchmark_size(results, directory, ngsl, vocab_size, sentence_count)
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+def compare(results : dict, baseline : dict) -> list[str]:
+    """
+    Compares the results with a baseline.
+
+    RETURNS : a line per stage + size timed in both, marking regressions
+    """
+    lines : list[str] = []
+
+    for stage, timings in results.items():
+        for size, seconds in timings.items():
+            before : float = baseline.get(stage, {}).get(size)
+            if (before is None):
+                continue
+
+            ratio : float = seconds / before if (before > 0) else float("inf")
+            slower : bool = (ratio > REGRESSION_FACTOR and seconds - before > MIN_SECONDS)
+            flag : str = "  REGRESSION" if (slower) else ""
+            lines.append(f"{stage:<32}{size:>12}{before:>10.3f}{seconds:>10.3f}{ratio:>8.2f}x{flag}")
+
+    return lines
+
+
+def record_benchmark(results : dict, sizes : list[tuple[int, int]], baseline : str = BASELINE,
+                     save : bool = False):
+    timestamp = datetime.datetime.now()
+    data : dict = {"timestamp" : str(timestamp), "sizes" : sizes, "results" : results}
+
+    with open(f"./output/BENCHMARK-{timestamp}.json", "w") as log:
+        json.dump(data, log, indent = 2)
+
+    if (os.path.exists(baseline)):
+        with open(baseline, "r") as previous:
+            lines : list[str] = compare(results, json.load(previous)["results"])
+
+        print(f"{'STAGE':<32}{'SIZE':>12}{'BEFORE':>10}{'NOW':>10}{'RATIO':>9}")
+        for line in lines:
+            print(line)
+
+        regressions : int = sum(line.endswith("REGRESSION") for line in lines)
+        print(f"> {regressions} regressions against {baseline}")
+
+    if (save or not os.path.exists(baseline)):
+        with open(baseline, "w") as output:
+            json.dump(data, output, indent = 2)
+        print(f"> Baseline saved to {baseline}")
+
+    print(f"> Results have been saved to ./output/BENCHMARK-{timestamp}.json")
+
+
+# python3 benchmark.py [quick] [--save]
+if __name__ == "__main__":
+    args, options = find_suggestions.parse_options(sys.argv[1:])
+    sizes : list[tuple[int, int]] = SIZES
+
+    if (len(args) > 0 and args[0].lower() == "quick"):
+        sizes = QUICK_SIZES
+
+    # Nothing is downloaded : every model is a stub
+    models.set_offline(True)
+
+    results : dict = run_benchmark(sizes)
+    record_benchmark(results, sizes, BASELINE, "--save" in options)
@@ -0,0 +1,128 @@
+import numpy as np
+import datetime
+import time
+import sys
+
+import glove
+
+# FILEPATH VARIABLES FOR EASE:
+GLOVE_VECTORS : str = "./data_files/commoncrawl.840B.300d.txt"
+SAMPLES : str = "./datafiles/all_samples.csv"
+
+K : int = 50    # same number of neighbours as glove.word_search
+
+# Search settings swept for each approximate index:
+NPROBES : list[int] = [1, 4, 16, 64, 256]
+EF_SEARCHES : list[int] = [16, 32, 64, 128, 256, 512]
+
+def get_query_words(samples : str, embeddings : glove.Embeddings) -> list[str]:
+    """
+    Returns every distinct (lowercase) word in the sample sentences that has a
+    GloVe vector, in order of first appearance.
+    """
+    words : list[str] = []
+    seen : set[str] = set()
+
+    with open(samples, "r") as data:
+        for line in data:
+            for token in line.split():
+                word : str = token.strip(".,;:!?()[]\"'").lower()
+
+                if (len(word) > 0 and word not in seen and word in embeddings):
+                    seen.add(word)
+                    words.append(word)
+
+    return words
+
+
+def run_queries(faiss_index, queries, k : int) -> tuple:
+    """
+    Searches the index once per query (as find_k_closest does).
+
+    RETURNS : ids found for each query and the queries per second.
+    """
+    results = np.empty((len(queries), k + 1), dtype = "int64")
+
+    start : float = time.perf_counter()
+    for i in range(len(queries)):
+        results[i] = faiss_index.search(queries[i : i + 1], k + 1)[1][0]
+    elapsed : float = time.perf_counter() - start
+
+    return (results, len(queries) / elapsed)
+
+
+def recall(found, truth) -> float:
+    """
+    Average fraction of the exact k nearest neighbours that were also found
+    by the approximate index (recall@k).
+    """
+    total : int = 0
+
+    for row_found, row_truth in zip(found, truth):
+        total += len(set(row_found.tolist()) & set(row_truth.tolist()))
+
+    return total / truth.size
+
+
+def benchmark(filepath : str, samples : str, index_types : list[str], k : int = K) -> list[dict]:
+    """
+    Benchmarks each approximate index type against the flat index for every
+    setting of nprobe / efSearch.
+
+    RETURNS : list of result rows (index type, setting, recall@k, QPS).
+    """
+    flat_data : tuple = glove.get_faiss_vectors(filepath, "FLAT")
+    embeddings : glove.Embeddings = flat_data[1]
+
+    words : list[str] = get_query_words(samples, embeddings)
+    queries = np.ascontiguousarray(embeddings.get_vectors(words), "float32")
+    print(f"> Benchmarking with {len(words)} query words from {samples}")
+
+    truth, flat_qps = run_queries(flat_data[0], queries, k)
+    rows : list[dict] = [{"INDEX" : "FLAT", "SETTING" : "-", "RECALL" : 1.0, "QPS" : flat_qps}]
+
+    for index_type in index_types:
+        faiss_index = glove.get_faiss_vectors(filepath, index_type)[0]
+
+        if (index_type == "HNSW"):
+            settings = [("efSearch", ef) for ef in EF_SEARCHES]
+        elif (index_type in ["IVF", "IVFPQ"]):
+            settings = [("nprobe", nprobe) for nprobe in NPROBES]
+        else:
+            settings = [("-", None)]    # SQ / PQ indexes have no search settings
+
+        for name, value in settings:
+            if (name == "efSearch"):
+                glove.set_search_params(faiss_index, ef_search = value)
+            elif (name == "nprobe"):
+                glove.set_search_params(faiss_index, nprobe = value)
+
+            found, qps = run_queries(faiss_index, queries, k)
+            setting : str = f"{name}={value}" if (value is not None) else "-"
+            rows.append({"INDEX" : index_type, "SETTING" : setting,
+                         "RECALL" : recall(found, truth), "QPS" : qps})
+
+    return rows
+
+
+def record_benchmark(rows : list[dict], k : int):
+    timestamp = datetime.datetime.now()
+
+    with open(f"./output/INDEX-BENCHMARK-{timestamp}.txt", "a") as log:
+        log.write(f"TIMESTAMP : {timestamp}\n")
+        log.write(f"{'INDEX':<8}{'SETTING':<16}{f'RECALL@{k}':>12}{'QPS':>12}\n")
+
+        for row in rows:
+            line = f"{row['INDEX']:<8}{row['SETTING']:<16}{row['RECALL']:>12.4f}{row['QPS']:>12.1f}"
+            print(line)
+            log.write(f"{line}\n")
+
+
+# python3 benchmark_index.py [ivf/hnsw/ivfpq/sq8/sq16/pq ...]
+if __name__ == "__main__":
+    index_types : list[str] = [arg.upper() for arg in sys.argv[1:]]
+    if (len(index_types) == 0):
+        index_types = ["IVF", "HNSW", "IVFPQ"]
+
+    rows = benchmark(GLOVE_VECTORS, SAMPLES, index_types)
+    record_benchmark(rows, K)
@@ -1,12 +1,28 @@
-from transformers import pipeline
-from evaluate import load
+import re
+import threading
 
 from word import Word
 import filters
+import metrics
+import models
 
-modern_bert = pipeline("fill-mask", model = "answerdotai/ModernBERT-large")
-bio_bert = pipeline("fill-mask", model = "dmis-lab/biobert-base-cased-v1.2")
-bertscore = load("bertscore")
+# Models (ModernBERT, BioBERT, BERTScore) are loaded on first use; see models.py
+
+# BERTScore batching (pairs of similar length are scored together):
+SCORE_BATCH_SIZE : int = 64
+
+# Fill-mask batching (masked sentences run through the pipeline at once):
+FILL_BATCH_SIZE : int = 32
+TOP_K : int = 5     # suggestions per mask (pipeline default)
+
+# MLM scoring (sort_by MLM) : model whose log-probabilities rank alternatives,
+# and number of masked sequences per forward pass
+MLM_MODEL : str = "MODERN"
+MLM_BATCH_SIZE : int = 32
+
+# BERTScore runs one comparison at a time (e.g. with stages.py, both the BERT
+# search and the scoring stage use it)
+score_lock = threading.Lock()
 
 def substitute(sentence : str, old : str, new : str) -> str:
     """
@@ -35,12 +51,49 @@ def get_ids(words : list, to_mask : str) -> list[int]:
     return ids
 
 
-def mask_particle(sentence : str, word : str) -> list[str]:
+def get_model(model : str = "MODERN"):
     """
-    Given a sentence and a word, masks the word preceding it as well.
+    Returns the fill-mask pipeline of the given model of BERT.
+    """
+    return models.get_fill_mask(model)
+
+
+def first_mask(output : list) -> list[dict]:
+    """
+    Given the pipeline output for one sentence, returns the predictions for
+    its first mask (sentences with several masks get a list per mask).
+    """
+    if (len(output) > 0 and type(output[0]) == list):
+        return output[0]
+
+    return output
+
+
+def fill_masks(masked_sentences : list[str], model : str = "MODERN",
+               batch_size : int = FILL_BATCH_SIZE, top_k : int = TOP_K) -> dict[str : list[dict]]:
+    """
+    Runs the fill-mask pipeline over a list of masked sentences in batches; each
+    distinct sentence is only run once.
+
+    RETURNS : dictionary of masked sentence -> predictions for its first mask
+    """
+    unique : list[str] = list(dict.fromkeys(masked_sentences))
+
+    if (len(unique) == 0):
+        return {}
+
+    with metrics.stage(f"bert.fill_mask ({model.upper()})", len(unique)):
+        outputs = get_model(model)(unique, batch_size = batch_size, top_k = top_k)
+
+    return {masked : first_mask(output) for masked, output in zip(unique, outputs)}
+
+
+def particle_mask(sentence : str, word : str) -> tuple[str, str]:
+    """
+    Given a sentence and a word, masks the word and the word preceding it.
+
+    RETURNS : the masked sentence and the preceding word
     """
-    variant : list[str] = []
-    
     to_check : list[str] = sentence.split()
     idx = to_check.index(word)
 
@@ -48,16 +101,34 @@ def mask_particle(sentence : str, word : str) -> list[str]:
 
     masked_1 : str = add_mask(sentence, word) # Mask original word
     masked_2 : str = add_mask(masked_1, split_pt) # Mask the preceding word
-    output = modern_bert(masked_2)
-    particles = output[0]
+
+    return (masked_2, split_pt)
+
+
+def particle_variants(sentence : str, split_pt : str, particles : list[dict]) -> list[str]:
+    """
+    Given the predictions for the masked preceding word, builds a variant of
+    the sentence for each particle suggested.
+    """
+    variant : list[str] = []
 
     for option in particles:
-        particle = option["token_str"][1:]
+        particle = option["token_str"].strip()
         variant.append(particle.join(sentence.split(split_pt)))
     
     return variant
 
 
+def mask_particle(sentence : str, word : str, model : str = "MODERN") -> list[str]:
+    """
+    Given a sentence and a word, masks the word preceding it as well.
+    """
+    masked, split_pt = particle_mask(sentence, word)
+    particles = fill_masks([masked], model)[masked]
+
+    return particle_variants(sentence, split_pt, particles)
+
+
 def add_mask(sentence : str, to_mask : str) -> str:
     """
     Given a sentence and a word to mask, substitutes word with [MASK] for BERT.
@@ -108,23 +179,152 @@ def get_score(original : str, alt : str) -> float:
     Given two sentences (original and alternative), compares the semantic 
     similarity and returns the score.
     """
-    results = bertscore.compute(predictions = [alt], references = [original], 
-                                lang = "en")
-    
-    return round(results["precision"][0], 3)
+    return get_scores([(original, alt)])[0]
 
 
-def get_suggestions(masked_sentence : str, model : str = "MODERN") -> list[tuple]:
+def get_scores(pairs : list[tuple[str, str]], batch_size : int = SCORE_BATCH_SIZE) -> list[float]:
     """
-    Given a sentence (masked & formatted for BERT), finds alternative sentences
-    using the relevant model of BERT.
+    Batched get_score : given (original, alternative) sentence pairs, compares
+    the semantic similarity of each. Pairs are sorted by length and scored in
+    buckets of batch_size, so each batch needs little padding; duplicate pairs
+    are only scored once.
+
+    RETURNS : list of scores in the same order as pairs.
     """
-    suggestions : list[tuple] = []
+    unique : list[tuple[str, str]] = list(dict.fromkeys(pairs))
+    unique.sort(key = lambda pair : len(pair[0].split()) + len(pair[1].split()))
+    scores : dict[tuple : float] = {}
+
+    for start in range(0, len(unique), batch_size):
+        bucket = unique[start : start + batch_size]
 
-    if (model.upper().strip() == "BIO"):
-        output = bio_bert(masked_sentence)
-    else:
-        output = modern_bert(masked_sentence)
+        with score_lock, metrics.stage("bertscore", len(bucket)):
+            results = models.get_bertscore().compute(predictions = [pair[1] for pair in bucket],
+                                                     references = [pair[0] for pair in bucket],
+                                                     lang = "en", batch_size = batch_size)
+
+        for pair, precision in zip(bucket, results["precision"]):
+            scores[pair] = round(precision, 3)
+
+    return [scores[pair] for pair in pairs]
+
+
+def split_at(sentence : str, word : str) -> tuple[str, str]:
+    """
+    RETURNS : the text before and after the first whole-word occurrence of word
+    (in any case), or None if the sentence doesn't contain it
+    """
+    found = re.search(rf"(?<!\w){re.escape(word)}(?!\w)", sentence, re.IGNORECASE)
+
+    if (found is None):
+        return None
+
+    return (sentence[:found.start()], sentence[found.end():])
+
+
+def mlm_sequences(tokenizer, sentence : str, word : str, alts : list[str]) -> list[tuple]:
+    """
+    Builds the masked token sequences needed to score the alternatives of a
+    word : one sequence with the word masked, read by every single-token
+    alternative, and for each multi-token alternative one sequence per token
+    with only that token masked (pseudo-log-likelihood).
+
+    RETURNS : list of (token ids, mask position, [(alternative index, token id
+    to read at the mask)]); empty if the sentence doesn't contain the word
+    """
+    parts : tuple[str, str] = split_at(sentence, word)
+    if (parts is None):
+        return []
+
+    left, right = parts
+    left_ids : list[int] = tokenizer.encode(left.rstrip(), add_special_tokens = False)
+    right_ids : list[int] = tokenizer.encode(right, add_special_tokens = False)
+    space : str = " " if (left != left.rstrip()) else ""    # keeps BPE word boundaries
+    mask : int = tokenizer.mask_token_id
+
+    # position of the word, after any special tokens added in front (e.g. [CLS])
+    start : int = tokenizer.build_inputs_with_special_tokens([mask]).index(mask) + len(left_ids)
+
+    def build(middle : list[int]) -> list[int]:
+        return tokenizer.build_inputs_with_special_tokens(left_ids + middle + right_ids)
+
+    single : list[tuple[int, int]] = []
+    sequences : list[tuple] = []
+
+    for i, alt in enumerate(alts):
+        alt_ids : list[int] = tokenizer.encode(space + alt, add_special_tokens = False)
+
+        if (len(alt_ids) == 1):
+            single.append((i, alt_ids[0]))
+            continue
+
+        for j, token in enumerate(alt_ids):
+            sequences.append((build(alt_ids[:j] + [mask] + alt_ids[j + 1:]), start + j, [(i, token)]))
+
+    if (len(single) > 0):
+        sequences.append((build([mask]), start, single))
+
+    return sequences
+
+
+def mlm_scores(queries : list[tuple[str, str, list[str]]], model : str = MLM_MODEL,
+               batch_size : int = MLM_BATCH_SIZE) -> list[list[float]]:
+    """
+    Scores alternatives by how likely the masked language model finds them in
+    place of the word : the word is masked once and the log-probability of
+    every single-token alternative is read from that one output; multi-token
+    alternatives get their pseudo-log-likelihood (each of their tokens masked
+    in turn, log-probabilities summed). The sequences of every query are run
+    together in batches.
+
+    - queries : (sentence, word, alternatives) triples
+
+    RETURNS : log-probability (rounded to 3 d.p., higher = better) of each
+    alternative of each query; None if the sentence doesn't contain the word
+    """
+    import torch
+
+    pipeline = get_model(model)
+    tokenizer = pipeline.tokenizer
+    pad : int = tokenizer.pad_token_id if (tokenizer.pad_token_id is not None) else 0
+
+    scores : list[list[float]] = []
+    jobs : list[tuple] = []     # (query index, token ids, mask position, targets)
+
+    for q, (sentence, word, alts) in enumerate(queries):
+        sequences : list[tuple] = mlm_sequences(tokenizer, sentence, word, alts)
+        scores.append([0.0 if (len(sequences) > 0) else None for alt in alts])
+        jobs += [(q,) + sequence for sequence in sequences]
+
+    # sequences of similar length together, so batches need little padding
+    jobs.sort(key = lambda job : len(job[1]))
+
+    with metrics.stage(f"bert.mlm ({model.upper()})", len(jobs)):
+        for begin in range(0, len(jobs), batch_size):
+            batch : list[tuple] = jobs[begin : begin + batch_size]
+            length : int = max(len(job[1]) for job in batch)
+
+            ids = torch.tensor([job[1] + [pad] * (length - len(job[1])) for job in batch])
+            attention = torch.tensor([[1] * len(job[1]) + [0] * (length - len(job[1]))
+                                      for job in batch])
+
+            with torch.no_grad():
+                logits = pipeline.model(input_ids = ids, attention_mask = attention).logits
+
+            # logits at each sequence's mask only
+            positions = torch.tensor([job[2] for job in batch])
+            log_probs = torch.log_softmax(logits[torch.arange(len(batch)), positions], dim = -1)
+
+            for row, (q, tokens, position, targets) in enumerate(batch):
+                for i, token in targets:
+                    scores[q][i] += float(log_probs[row][token])
+
+    return [[round(score, 3) if (score is not None) else None for score in query]
+            for query in scores]
+
+
+def to_suggestions(output : list[dict]) -> list[tuple]:
+    suggestions : list[tuple] = []
 
     for item in output:
         word = item["token_str"]    # -> suggested word
@@ -132,51 +332,112 @@ def get_suggestions(masked_sentence : str, model : str = "MODERN") -> list[tuple
         suggestions.append((word, sequence))
 
     return suggestions
+
+
+def get_suggestions(masked_sentence : str, model : str = "MODERN") -> list[tuple]:
+    """
+    Given a sentence (masked & formatted for BERT), finds alternative sentences
+    using the relevant model of BERT.
+    """
+    output = fill_masks([masked_sentence], model)[masked_sentence]
+
+    return to_suggestions(output)
+
+
+def suggest_batch(queries : list[tuple[str, str]], model : str = "MODERN",
+                  batch_size : int = FILL_BATCH_SIZE, top_k : int = TOP_K) -> dict[tuple : list[tuple]]:
+    """
+    Batched candidate generation : given (BERT formatted sentence, word) pairs,
+    builds the masked variants of every pair and runs them through the
+    pipeline together, in two passes (the particle masks, then the variants).
+
+    RETURNS : dictionary of (sentence, word) -> list of (suggested word, sequence)
+    """
+    queries = list(dict.fromkeys(queries))
+
+    # (1) Mask each word with the word preceding it, fill all at once
+    particle_masks : dict[tuple : tuple[str, str]] = {}
+    for sentence, word in queries:
+        try:
+            particle_masks[(sentence, word)] = particle_mask(sentence, word)
+        except ValueError:
+            # The word isn't a token of the sentence : no particle variants (so
+            # no suggestions) for it, rather than failing the whole batch
+            particle_masks[(sentence, word)] = None
+
+    particles = fill_masks([mask[0] for mask in particle_masks.values() if mask is not None],
+                           model, batch_size, top_k)
+
+    # (2) Mask the word in every variant, fill all variants at once
+    variations : dict[tuple : list[str]] = {}
+    for sentence, word in queries:
+        if (particle_masks[(sentence, word)] is None):
+            variants = []
+        else:
+            masked, split_pt = particle_masks[(sentence, word)]
+            variants = particle_variants(sentence, split_pt, particles[masked])
+        variations[(sentence, word)] = add_masks(variants, word)
+
+    filled = fill_masks([variant for variants in variations.values() for variant in variants],
+                        model, batch_size, top_k)
+
+    if (metrics.VERBOSE):
+        print(f"> BERT ({model}) filled {len(particles) + len(filled)} masked sentences for {len(queries)} words")
+
+    return {query : [suggestion for variant in variations[query] 
+                     for suggestion in to_suggestions(filled[variant])]
+            for query in queries}
     
 
-def word_search(ngsl : list[str], sentence : str, original : Word, model : str = "MODERN") -> list[Word]:
+def word_search(ngsl : list[str], sentence : str, original : Word, model : str = "MODERN",
+                bert_format : str = None, suggestions : list[tuple] = None) -> list[Word]:
     """
     Given the original sentence and word to find alternatives for, uses specified
     model of BERT to find and score alternatives.
+
+    - bert_format : sentence already formatted by filters.parse_sentences
+      (optional; saves parsing the sentence again)
+    - suggestions : (suggested word, sequence) pairs already found for the word
+      by suggest_batch (optional; saves running BERT again)
     """
-    alternatives : list[str] = []
+    alternatives : list[Word] = []
+    sequences : list[str] = []  # sequence generated by BERT for each alternative
     
     # Format sentence to be read by BERT
-    bert_format = filters.bert_format(sentence)
-    masked = add_mask(bert_format, original.word)
-
-    # Find possible variations of sentence to increase possibilities
-    variations = [masked]
-    particle_mask = mask_particle(bert_format, original.word)
-    variations = add_masks(particle_mask, original.word)
-    # Do a second parse to make sure BERT hasn't affected the original sentence:
-
-    for variant in variations:
-        initial_alts = get_suggestions(variant, model)
-        # Make sure word hasn't been added already
-        current_words = [added.word for added in alternatives] 
-
-        for alt in initial_alts:
-            if (alt[0] not in current_words):
-                # Extract the word only from sentence
-                word : str = extract_word(alt[1], alt[0])
-
-                # DO A SECOND CHECK:
-                if (word not in current_words):
-
-                    # FILTER :
-                    formatted = filters.valid_format(word)
-                    simple = filters.is_simple(original.word, word, ngsl)
-                    type_match = filters.same_type(original.type, word)
-                    not_same = (word.lower() != original.word.lower())
-
-                    if (formatted and simple and type_match and not_same):
-                        new_word = Word(word, original.type) # Create Word obj
-
-                        # Find score based on sequence generated by BERT:
-                        b_score : float = get_score(sentence, alt[1])
-                        new_word.set_b_score(b_score)
-                        alternatives.append(new_word) # Add to alternatives
+    if (bert_format is None):
+        bert_format = filters.bert_format(sentence)
+
+    # Find possible variations of sentence to increase possibilities, and the
+    # suggestions for each
+    if (suggestions is None):
+        suggestions = suggest_batch([(bert_format, original.word)], model)[(bert_format, original.word)]
+
+    # Each word is only checked once, whichever variant suggested it
+    checked : set[str] = set()
+
+    for alt in suggestions:
+        # Extract the word only from sentence
+        word : str = extract_word(alt[1], alt[0])
+
+        if (word in checked):
+            continue
+        checked.add(word)
+
+        # FILTER :
+        formatted = filters.valid_format(word)
+        simple = filters.is_simple(original.word, word, ngsl)
+        type_match = filters.same_type(original.type, word)
+        not_same = (word.lower() != original.word.lower())
+
+        if (formatted and simple and type_match and not_same):
+            new_word = Word(word, original.type) # Create Word obj
+            alternatives.append(new_word) # Add to alternatives
+            sequences.append(alt[1])
+
+    # Find scores based on sequences generated by BERT (one batched call):
+    b_scores : list[float] = get_scores([(sentence, sequence) for sequence in sequences])
+    for new_word, b_score in zip(alternatives, b_scores):
+        new_word.set_b_score(b_score)
     
     return alternatives
 
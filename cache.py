@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from word import Word
+
+# On-disk cache of filtered candidates per (method, word, POS):
+CACHE_FILE : str = "./datafiles/candidates.sqlite"
+MAX_ENTRIES : int = 200000  # least recently used entries are evicted past this
+
+# Table precomputed for the whole vocabulary by precompute.py (never evicted):
+TABLE_FILE : str = "./datafiles/simplifications.sqlite"
+
+class CandidateCache:
+    """
+    Persistent cache of the (valid, invalid) alternatives found for a word,
+    which only depend on the word, its POS and the search method - not on the
+    sentence. Stored in SQLite and keyed by method, word, POS, k and a
+    fingerprint of the data files; least recently used entries are evicted
+    once the cache holds more than max_entries (0 = never evicted, in which
+    case lookups aren't tracked either).
+    """
+    filepath : str
+    fingerprint : str
+    max_entries : int
+    hits : int
+    misses : int
+    connection : sqlite3.Connection
+
+    def __init__(self, filepath : str = CACHE_FILE, fingerprint : str = "",
+                 max_entries : int = MAX_ENTRIES):
+        self.filepath = filepath
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # timeout : workers of a pool may write to the cache at the same time
+        self.connection = sqlite3.connect(filepath, timeout = 60)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS candidates (
+                                       method TEXT, word TEXT, pos TEXT, k TEXT,
+                                       fingerprint TEXT, alternatives TEXT,
+                                       last_used REAL,
+                                       PRIMARY KEY (method, word, pos, k, fingerprint))""")
+        self.connection.execute("""CREATE INDEX IF NOT EXISTS candidates_last_used
+                                   ON candidates (last_used)""")
+        self.connection.commit()
+
+    # SETTERS & GETTERS
+    def get(self, method : str, word : str, pos : str, k : str) -> tuple[list, list]:
+        """
+        RETURNS : (valid, invalid) alternatives as new Word objects, or None if
+        the word hasn't been cached.
+        """
+        key : tuple = (method, word.lower(), pos.upper(), k, self.fingerprint)
+        row = self.connection.execute("""SELECT alternatives FROM candidates WHERE method = ?
+                                         AND word = ? AND pos = ? AND k = ? AND fingerprint = ?""",
+                                      key).fetchone()
+
+        if (row is None):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if (self.max_entries > 0):
+            self.connection.execute("""UPDATE candidates SET last_used = ? WHERE method = ?
+                                       AND word = ? AND pos = ? AND k = ? AND fingerprint = ?""",
+                                    (time.time(),) + key)
+
+        valid, invalid = json.loads(row[0])
+
+        return (from_rows(valid), from_rows(invalid))
+
+    def contains(self, method : str, word : str, pos : str, k : str) -> bool:
+        key : tuple = (method, word.lower(), pos.upper(), k, self.fingerprint)
+        row = self.connection.execute("""SELECT 1 FROM candidates WHERE method = ?
+                                         AND word = ? AND pos = ? AND k = ? AND fingerprint = ?""",
+                                      key).fetchone()
+
+        return (row is not None)
+
+    def put(self, method : str, word : str, pos : str, k : str, valid : list, invalid : list):
+        alternatives : str = json.dumps([to_rows(valid), to_rows(invalid)])
+        self.connection.execute("INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (method, word.lower(), pos.upper(), k, self.fingerprint,
+                                 alternatives, time.time()))
+
+    def get_stats(self) -> str:
+        total : int = self.hits + self.misses
+        rate : float = (self.hits / total) if (total > 0) else 0
+
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1%} hit rate)"
+
+    # BASIC FUNCTIONALITIES
+    def evict(self):
+        """
+        Deletes the least recently used entries past max_entries.
+        """
+        count : int = self.connection.execute("SELECT COUNT(*) FROM candidates").fetchone()[0]
+
+        if (self.max_entries > 0 and count > self.max_entries):
+            self.connection.execute("""DELETE FROM candidates WHERE rowid IN (SELECT rowid
+                                       FROM candidates ORDER BY last_used LIMIT ?)""",
+                                    (count - self.max_entries,))
+
+    def commit(self):
+        self.evict()
+        self.connection.commit()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM candidates").fetchone()[0]
+
+
+def to_rows(alternatives : list) -> list:
+    """
+    Converts a list of alternatives (Words, or strings noting why there are
+    none) into JSON-friendly rows.
+    """
+    rows : list = []
+
+    for alt in alternatives:
+        if (type(alt) == Word):
+            rows.append([alt.word, alt.type, alt.glove_score, alt.bert_score])
+        else:
+            rows.append(alt)
+
+    return rows
+
+
+def from_rows(rows : list) -> list:
+    alternatives : list = []
+
+    for row in rows:
+        if (type(row) == list):
+            alt = Word(row[0], row[1])
+            alt.set_g_score(row[2])
+            alt.set_b_score(row[3])
+            alternatives.append(alt)
+        else:
+            alternatives.append(row)
+
+    return alternatives
+
+
+def get_fingerprint(filepaths : list[str], settings : dict) -> str:
+    """
+    Returns a short hash of the size and modification time of each data file
+    (missing files included as such) and of the given settings, so cached
+    candidates are ignored once any of them changes.
+    """
+    parts : list = []
+
+    for filepath in filepaths:
+        if (os.path.exists(filepath)):
+            stats = os.stat(filepath)
+            parts.append([filepath, stats.st_size, int(stats.st_mtime)])
+        else:
+            parts.append([filepath, None])
+
+    text : str = json.dumps([parts, settings], sort_keys = True)
+
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
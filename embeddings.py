@@ -0,0 +1,74 @@
+import numpy as np
+
+class Embeddings:
+    """
+    GloVe vectors stored as one contiguous matrix (one row per word) with a
+    compact word -> row mapping; behaves like the old word -> vector
+    dictionary for lookups.
+
+    The matrix may be stored as float32, float16 or as uint8 codes (8-bit
+    scalar quantization : vector = offset + code * scale, per dimension);
+    vectors are decoded to float32 only when they are looked up.
+    """
+    matrix : np.ndarray
+    words : list[str]
+    rows : dict[str : int]
+    owner : object
+    offset : np.ndarray     # uint8 codes only : value of code 0 per dimension
+    scale : np.ndarray      # uint8 codes only : step between codes per dimension
+
+    def __init__(self, matrix : np.ndarray, words : list[str], owner = None,
+                 offset : np.ndarray = None, scale : np.ndarray = None):
+        self.matrix = matrix
+        self.words = words
+        self.rows = {word : row for row, word in enumerate(words)}
+        # Object whose memory backs the matrix (e.g. a FAISS index) - kept
+        # alive for as long as the matrix is in use
+        self.owner = owner
+        self.offset = offset
+        self.scale = scale
+
+    # SETTERS & GETTERS
+    def get_row(self, word : str) -> int:
+        return self.rows[word]
+
+    def get_word(self, row : int) -> str:
+        return self.words[row]
+
+    def get_rows(self, words : list[str]) -> np.ndarray:
+        return np.array([self.rows[word] for word in words], "int64")
+
+    def get_vectors(self, words : list[str]) -> np.ndarray:
+        """
+        Returns the (float32) vectors of the given words stacked into a new
+        matrix.
+        """
+        return self.decode(self.matrix[self.get_rows(words)])
+
+    def get_depth(self) -> int:
+        return self.matrix.shape[1]
+
+    def get_nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    # BASIC FUNCTIONALITIES
+    def decode(self, stored : np.ndarray) -> np.ndarray:
+        """
+        Converts stored rows (any storage type) into float32 vectors.
+        """
+        if (self.scale is not None):
+            return self.offset + stored.astype("float32") * self.scale
+
+        return np.asarray(stored, "float32")
+
+    def __getitem__(self, word : str) -> np.ndarray:
+        return self.decode(self.matrix[self.rows[word]])
+
+    def __contains__(self, word : str) -> bool:
+        return word in self.rows
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def keys(self):
+        return self.rows.keys()
@@ -0,0 +1,205 @@
+import numpy as np
+import sys
+from syllables import estimate
+
+import filters
+import glove
+import models
+from wordnet import get_word_tags
+
+GLOVE_VECTORS : str = "./data_files/commoncrawl.840B.300d.txt"
+
+# Bit per POS tag in the pos column; 0 = no WordNet entry
+POS_BITS : dict[str : int] = {
+    "NOUN" : 1,
+    "VERB" : 2,
+    "ADJ" : 4,
+    "ADV" : 8,
+    "X" : 16
+}
+
+# Spacy POS tags, stored by position (+1) in the spacy_pos column; 0 = unknown
+SPACY_TAGS : list[str] = ["ADJ", "ADP", "ADV", "AUX", "CCONJ", "DET", "INTJ", "NOUN",
+                          "NUM", "PART", "PRON", "PROPN", "PUNCT", "SCONJ", "SYM",
+                          "VERB", "X"]
+
+class FeatureTable:
+    """
+    Lexical features of every GloVe vocabulary word used by
+    filters.sort_suggestions, stored column by column (one array per feature,
+    indexed by the word's row in the embedding matrix).
+    """
+    rows : dict[str : int]
+    valid : np.ndarray          # valid_format(word)
+    length : np.ndarray         # len(word)
+    syllables : np.ndarray      # estimate(word)
+    ngsl_rank : np.ndarray      # SFI rank in the NGSL; 0 if not in the NGSL
+    pos : np.ndarray            # bitmask of WordNet POS tags (POS_BITS)
+    spacy_pos : np.ndarray      # spacy POS for words WordNet doesn't know
+
+    def __init__(self, rows : dict[str : int], columns : dict[str : np.ndarray]):
+        self.rows = rows
+        self.valid = columns["valid"]
+        self.length = columns["length"]
+        self.syllables = columns["syllables"]
+        self.ngsl_rank = columns["ngsl_rank"]
+        self.pos = columns["pos"]
+        self.spacy_pos = columns["spacy_pos"]
+
+    # SETTERS & GETTERS
+    def get_rows(self, words : list[str]) -> np.ndarray:
+        """
+        Returns the row of each word; -1 for words not in the vocabulary.
+        """
+        return np.array([self.rows.get(word, -1) for word in words], "int64")
+
+    def get_pos_bit(self, type : str) -> int:
+        return POS_BITS.get(type.upper(), 0)
+
+    def get_spacy_code(self, type : str) -> int:
+        return spacy_code(type)
+
+    def get_columns(self) -> dict[str : np.ndarray]:
+        return {
+            "valid" : self.valid,
+            "length" : self.length,
+            "syllables" : self.syllables,
+            "ngsl_rank" : self.ngsl_rank,
+            "pos" : self.pos,
+            "spacy_pos" : self.spacy_pos
+        }
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+
+def features_path(filepath : str) -> str:
+    """
+    Returns the filepath of the feature table saved next to the GloVe cache.
+    """
+    return f"{filepath}.features.npz"
+
+
+def pos_mask(tags : list[str]) -> int:
+    mask : int = 0
+
+    for tag in tags:
+        mask |= POS_BITS.get(tag, POS_BITS["X"])
+
+    return mask
+
+
+def spacy_code(tag : str) -> int:
+    try:
+        return SPACY_TAGS.index(tag.upper()) + 1
+    except ValueError:
+        return 0
+
+
+def build_features(words : list[str], ngsl : dict, spacy : bool = False,
+                   batch_size : int = 1024) -> dict[str : np.ndarray]:
+    """
+    Computes the lexical features of every word in the vocabulary.
+
+    - words : vocabulary in row order
+    - ngsl : dictionary of NGSL word -> SFI rank (see filters.get_freq)
+    - spacy : also tag words WordNet doesn't know with Spacy (slow; otherwise
+      sort_suggestions falls back to Spacy for those words as before)
+
+    RETURNS : dictionary of column name -> array
+    """
+    print(f"> Computing lexical features for {len(words)} words")
+    count : int = len(words)
+
+    columns : dict[str : np.ndarray] = {
+        "valid" : np.zeros(count, "bool"),
+        "length" : np.zeros(count, "uint16"),
+        "syllables" : np.zeros(count, "uint8"),
+        "ngsl_rank" : np.zeros(count, "int32"),
+        "pos" : np.zeros(count, "uint8"),
+        "spacy_pos" : np.zeros(count, "uint8")
+    }
+
+    for row in range(count):
+        word : str = words[row]
+
+        columns["valid"][row] = filters.valid_format(word)
+        columns["length"][row] = min(len(word), 65535)
+        columns["syllables"][row] = min(estimate(word), 255)
+        columns["ngsl_rank"][row] = ngsl.get(word.lower(), 0)
+        columns["pos"][row] = pos_mask(get_word_tags(word))
+
+        if (row % 100000 == 0):
+            print(f"> ({row} / {count}) words processed")
+
+    if (spacy):
+        unknown : list[int] = np.flatnonzero(columns["pos"] == 0).tolist()
+        print(f"> Tagging {len(unknown)} words unknown to WordNet with Spacy")
+        docs = models.get_nlp().pipe([words[row] for row in unknown], batch_size = batch_size)
+
+        for row, doc in zip(unknown, docs):
+            if (len(doc) > 0):
+                columns["spacy_pos"][row] = spacy_code(doc[0].pos_)
+
+    return columns
+
+
+def save_features(filepath : str, columns : dict[str : np.ndarray]):
+    path : str = features_path(filepath)
+    stamp : dict = glove.build_stamp(filepath, True)
+
+    def write(temp : str):
+        with open(temp, "wb") as data:
+            np.savez(data, **columns)
+
+    glove.write_atomic(path, write)
+    glove.mark_built(path, stamp)
+
+    print(f"> Lexical features saved to {path}")
+
+
+def is_current(filepath : str) -> bool:
+    """
+    Checks whether the saved feature table was built from the current GloVe
+    cache and NGSL file.
+    """
+    if (not glove.cache_is_valid(filepath)):
+        return False
+
+    return glove.is_built(features_path(filepath), glove.build_stamp(filepath, True))
+
+
+def get_features(filepath : str, embeddings : glove.Embeddings) -> FeatureTable:
+    """
+    Loads the feature table saved next to the GloVe cache, sharing the word ->
+    row mapping of the given embeddings.
+
+    RETURNS : FeatureTable, or None if no up-to-date table has been built.
+    """
+    if (not is_current(filepath)):
+        print(f"> [NOTE] no lexical feature table for {filepath}; run 'python3 features.py'")
+        return None
+
+    with np.load(features_path(filepath)) as data:
+        columns : dict[str : np.ndarray] = {name : data[name] for name in data.files}
+
+    if (len(columns["valid"]) != len(embeddings)):
+        return None
+
+    print("> Lexical feature table loaded")
+
+    return FeatureTable(embeddings.rows, columns)
+
+
+# python3 features.py [spacy]
+if __name__ == "__main__":
+    spacy : bool = (len(sys.argv) > 1 and sys.argv[1].lower() == "spacy")
+
+    if (not glove.cache_is_valid(GLOVE_VECTORS)):
+        glove.convert_vectors(GLOVE_VECTORS)
+
+    words : list[str] = glove.read_vocab(GLOVE_VECTORS)
+    ngsl : dict = filters.get_freq(filters.FREQ_FILE)
+
+    columns = build_features(words, ngsl, spacy)
+    save_features(GLOVE_VECTORS, columns)
@@ -1,16 +1,31 @@
 import cmudict
-import spacy
 import csv
+import numpy as np
+import threading
+import time
 from syllables import estimate
 
 from wordnet import get_word_tags
 from word import Word
+import metrics
+import models
 
 # SET FILEPATH FOR FREQUENCY PATH HERE:
 FREQ_FILE : str = "./datafiles/NGSL_1.2_stats.csv"
 
-# Load in Spacy NLP For global access:
-nlp = spacy.load("en_core_web_trf")
+# Set to 2 as per Julie's suggestion, but alter as required:
+MAX_SYLLABLES : int = 2
+# Syllable limit for words kept in the GloVe candidate index (see is_candidate)
+CANDIDATE_SYLLABLES : int = MAX_SYLLABLES
+
+# Batching for parse_sentences (n_process > 1 uses multiple processes):
+PIPE_BATCH_SIZE : int = 64
+PIPE_PROCESSES : int = 1
+
+# A Spacy Language isn't safe to share between threads, and e.g. with stages.py
+# the parse stage runs nlp.pipe while the filter stage tags words (same_pos), so
+# every call holds this lock while Spacy runs (see parse)
+nlp_lock = threading.Lock()
 
 # https://stackoverflow.com/questions/49581705/using-cmudict-to-count-syllables
 def count_syllables(word : str) -> int:
@@ -29,8 +44,13 @@ def bert_format(sentence : str) -> str:
     """
     Formats a given sentence to be parsed by BERT.
     """
+    return doc_bert_format(parse(sentence))
+
+def doc_bert_format(doc) -> str:
+    """
+    Formats an already parsed sentence (Spacy Doc) to be parsed by BERT.
+    """
     parts : list[str] = []
-    doc = nlp(sentence)
     for token in doc:
         parts.append(token.text.lower())
     
@@ -63,14 +83,27 @@ def is_simple(original : str, alt : str, ngsl : list[str]) -> bool:
     """
     common : bool = alt.lower() in ngsl
     shorter : bool = (len(alt) <= len(original))
-    # Set to 2 as per Julie's suggestion, but alter as required:
-    few_syllables : bool = (estimate(alt) <= 2)
+    few_syllables : bool = (estimate(alt) <= MAX_SYLLABLES)
 
     if (shorter or common or few_syllables):
         return True
     
     return False
 
+def is_candidate(alt : str, ngsl : list[str]) -> bool:
+    """
+    Determines whether a word could be suggested as a simpler alternative for
+    any original word: lowercase, valid format and either in the NGSL or within
+    the syllable limit. The length check of is_simple depends on the original
+    word so is not applied here.
+
+    Returns True if the word should be kept in the GloVe candidate index.
+    """
+    if (alt != alt.lower() or not valid_format(alt)):
+        return False
+
+    return (alt in ngsl or estimate(alt) <= CANDIDATE_SYLLABLES)
+
 def skip(original : Word, ngsl : list[str]) -> bool:
     word : str = original.word
     type : str = original.type
@@ -96,7 +129,7 @@ def same_pos(pos : str, alt : str) -> bool:
 
     RETURNS : True if POS matches, False otherwise.
     """
-    doc = nlp(alt)
+    doc = parse(alt)
     alt_pos : str = doc[0].pos_
 
     if (alt_pos.lower() == pos.lower()):
@@ -138,14 +171,30 @@ def valid_format(string : str) -> bool:
     return True
 
 
-def sort_suggestions(suggested : list[str], ngsl : list[str], original : Word) -> list[Word]:
+def sort_suggestions(suggested : list[str], ngsl : list[str], original : Word,
+                     table = None) -> list[Word]:
+    """
+    Splits suggested words into valid and invalid alternatives for original.
+
+    - table : lexical FeatureTable (see features.py); if given, the checks are
+      looked up for every suggestion at once instead of one word at a time
+    """
+    if (table is not None):
+        with metrics.stage("filters.sort_suggestions (table)", len(suggested)):
+            return sort_suggestions_table(suggested, ngsl, original, table)
+
     valid : list[Word] = []
     invalid : list[Word] = []
+    start : float = time.perf_counter()
+    type_seconds : float = 0    # time spent in same_type (WordNet / Spacy lookups)
 
     for word in suggested:
         formatted = valid_format(word)
         simple = is_simple(original.word, word, ngsl)
+
+        type_start : float = time.perf_counter()
         type_match = same_type(original.type, word)
+        type_seconds += time.perf_counter() - type_start
         # MAKE SURE ORIGINAL WORD DOESN'T GET ADDED AGAIN...
         not_same = (word.lower() != original.word.lower())
 
@@ -156,9 +205,63 @@ def sort_suggestions(suggested : list[str], ngsl : list[str], original : Word) -
             # [TEMP] mark type as - to indicate diff type for now...
             new_word = Word(word, "-")
             invalid.append(new_word)
+
+    metrics.add("filters.sort_suggestions", time.perf_counter() - start, len(suggested))
+    metrics.add("filters.same_type", type_seconds, len(suggested))
     
     return (valid, invalid)
 
+def sort_suggestions_table(suggested : list[str], ngsl : list[str], original : Word,
+                           table) -> tuple[list[Word]]:
+    """
+    Vectorised sort_suggestions : reads the format, simplicity and type checks
+    of all suggestions from the precomputed FeatureTable in one go. Suggestions
+    missing from the table (or without any POS tag stored) are checked one at
+    a time as before.
+
+    RETURNS : tuple of valid and invalid alternatives, in the suggested order.
+    """
+    valid : list[Word] = []
+    invalid : list[Word] = []
+
+    rows = table.get_rows(suggested)
+    known = (rows >= 0)
+    safe = np.where(known, rows, 0)
+
+    formatted = table.valid[safe]
+    simple = ((table.ngsl_rank[safe] > 0) | (table.length[safe] <= len(original.word))
+              | (table.syllables[safe] <= MAX_SYLLABLES))
+    passed = known & formatted & simple
+
+    # WordNet tags where known, otherwise the stored Spacy tag (if any)
+    pos = table.pos[safe]
+    spacy_pos = table.spacy_pos[safe]
+    type_match = np.where(pos > 0, (pos & table.get_pos_bit(original.type)) > 0,
+                          spacy_pos == table.get_spacy_code(original.type))
+    untagged = (pos == 0) & (spacy_pos == 0)
+
+    for i, word in enumerate(suggested):
+        # MAKE SURE ORIGINAL WORD DOESN'T GET ADDED AGAIN...
+        not_same = (word.lower() != original.word.lower())
+
+        if (not known[i]):
+            keep = (valid_format(word) and is_simple(original.word, word, ngsl)
+                    and same_type(original.type, word) and not_same)
+        elif (not passed[i] or not not_same):
+            keep = False
+        elif (untagged[i]):
+            keep = same_pos(original.type, word)
+        else:
+            keep = bool(type_match[i])
+
+        if (keep):
+            valid.append(Word(word, original.type))
+        else:
+            # [TEMP] mark type as - to indicate diff type for now...
+            invalid.append(Word(word, "-"))
+
+    return (valid, invalid)
+
 def rm_punctuation(word : str) -> str:
     if (not word[-1].isalpha()):
         return word[:-1]
@@ -167,7 +270,7 @@ def rm_punctuation(word : str) -> str:
 
 def get_tokens(sentence : str) -> list[tuple]:
     tokens : list[tuple] = []
-    doc = nlp(sentence)
+    doc = parse(sentence)
 
     for token in doc:
         type : str = token.pos_ # get word POS
@@ -178,8 +281,10 @@ def get_tokens(sentence : str) -> list[tuple]:
     return tokens
 
 def get_words(sentence : str) -> list[Word]:
+    return doc_words(parse(sentence))
+
+def doc_words(doc) -> list[Word]:
     words : list[Word] = []
-    doc = nlp(sentence)
     
     for token in doc:
         word : str = token.text # get the word itself
@@ -189,3 +294,39 @@ def get_words(sentence : str) -> list[Word]:
         words.append(Word(word, type))
 
     return words
+
+def parse(text : str):
+    """
+    RETURNS : the Spacy Doc of the text (parsed while holding nlp_lock)
+    """
+    nlp = models.get_nlp()
+
+    with nlp_lock:
+        return nlp(text)
+
+def parse_sentences(sentences, batch_size : int = PIPE_BATCH_SIZE,
+                    n_process : int = PIPE_PROCESSES):
+    """
+    Lazily parses sentences in batches with nlp.pipe; each sentence is parsed
+    once and its Doc supplies both the Word tokens and the BERT format.
+
+    - sentences : any iterable of sentences (read lazily)
+
+    YIELDS : (sentence, list of Words, sentence formatted for BERT)
+    """
+    pairs = ((sentence, sentence) for sentence in sentences)
+
+    docs = iter(models.get_nlp().pipe(pairs, as_tuples = True, batch_size = batch_size,
+                                      n_process = n_process))
+
+    # Spacy only runs while the next Doc is fetched; the lock isn't held
+    # between sentences (so not while the caller works on each one)
+    while (True):
+        with nlp_lock:
+            parsed = next(docs, None)
+
+        if (parsed is None):
+            break
+
+        doc, sentence = parsed
+        yield (sentence, doc_words(doc), doc_bert_format(doc))
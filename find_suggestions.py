@@ -3,38 +3,266 @@ import glove
 import bert
 import filters
 import wordnet
+import features
+import models
+import cache
+import metrics
+import stages
 
 import csv
 import sys
 import datetime
+import multiprocessing
+import json
+import os
+import time
 
 # FILEPATH VARIABLES FOR EASE:
 GLOVE_VECTORS : str = "./data_files/commoncrawl.840B.300d.txt"
 SAMPLES : str = "./datafiles/all_samples.csv"
 
+# Worker pool (--workers N); sentences are handed out in shards of
+# len(sentences) / (workers * SHARDS_PER_WORKER) to balance the load:
+WORKERS : int = 1
+SHARDS_PER_WORKER : int = 4
+
+# Streaming mode (--stream) : sentences searched, scored and written per chunk
+CHUNK_SIZE : int = 100
+
+# Options taking a value (e.g. --workers 4 or --workers=4)
+VALUE_OPTIONS : list[str] = ["--workers", "--root", "--chunk-size", "--limit", "--backend",
+                             "--port", "--max-batch", "--max-wait", "--requests",
+                             "--concurrency", "--sentences"]
+
+# Loaded once per worker process by init_worker:
+worker_data : tuple = None
+worker_table = None
+worker_ngsl = None
+worker_cache : cache.CandidateCache = None
+worker_precomputed : cache.CandidateCache = None
+
 def wordnet_only(ngsl : list[str], sentences : list[str]):
     print(f"> Suggestions will be found using WordNet only")
 
-def find_suggestions(glove_data : tuple, ngsl : list[str], sentences : list[str],
-                     search_1 : str, search_2 : str):
-    
-    print(f"> Suggestions will be found using {search_1}-{search_2}")
+def plan_glove_search(glove_data : tuple, ngsl : list[str], 
+                      parsed : list[tuple[str, list[Word], str]],
+                      cached : set[tuple[str, str]] = set()) -> dict[str : list[tuple]]:
+    """
+    [PLANNING PASS] Collects every complex (non-skipped) word in the corpus
+    and finds the GloVe neighbours of all of them with one batched search.
+
+    - cached : (word, POS) pairs whose candidates are already cached
+
+    RETURNS : dictionary of word -> list of (neighbour, distance)
+    """
+    to_search : list[str] = []
+
+    for sentence, words, formatted in parsed:
+        for original in words:
+            if (not filters.skip(original, ngsl) and (original.word, original.type) not in cached):
+                to_search.append(original.word)
+
+    if (metrics.VERBOSE):
+        print(f"> Searching GloVe neighbours for {len(set(to_search))} complex words")
+
+    return glove.search_batch(glove_data[0], glove_data[1], glove_data[2],
+                              to_search, glove.K_FIRST)
+
+def plan_bert_search(ngsl : list[str], parsed : list[tuple[str, list[Word], str]],
+                     model : str) -> dict[tuple : list[tuple]]:
+    """
+    [PLANNING PASS] Collects every complex (non-skipped) word in the corpus
+    and generates the BERT suggestions of all of them in batches.
 
+    RETURNS : dictionary of (BERT formatted sentence, word) -> list of
+    (suggested word, sequence)
+    """
+    to_search : list[tuple[str, str]] = []
+
+    for sentence, words, formatted in parsed:
+        for original in words:
+            if (not filters.skip(original, ngsl)):
+                to_search.append((formatted, original.word))
+
+    if (metrics.VERBOSE):
+        print(f"> Generating BERT suggestions for {len(set(to_search))} complex words")
+
+    return bert.suggest_batch(to_search, model)
+
+def open_cache(filepath : str, cache_file : str = cache.CACHE_FILE,
+               max_entries : int = cache.MAX_ENTRIES) -> cache.CandidateCache:
+    """
+    Opens the candidate cache (or precomputed table), fingerprinted by the data
+    files and settings the GloVe / WordNet candidates depend on : the GloVe and
+    NGSL files, the WordNet corpus and the feature table (which the candidates
+    are sorted with). Files derived from these alone (e.g. the WordNet lexicon,
+    compiled during the first run) are left out, so they don't invalidate the
+    entries written before they appear.
+    """
+    filepaths : list[str] = [path for path in [filepath, filters.FREQ_FILE, wordnet.corpus_path(),
+                                               features.features_path(filepath)]
+                             if path is not None]
+    settings : dict = {
+        "index_type" : glove.INDEX_TYPE,
+        # index build parameters, and the storage queries are decoded from
+        "index" : [glove.NLIST, glove.HNSW_M, glove.PQ_M, glove.TRAIN_SIZE],
+        "storage" : glove.STORAGE,
+        "nprobe" : glove.NPROBE,
+        "ef_search" : glove.EF_SEARCH,
+        "candidates_only" : glove.CANDIDATES_ONLY,
+        "expand" : [glove.EXPAND_DEPTH, glove.BEAM_WIDTH, glove.MAX_DISTANCE],
+        "max_syllables" : filters.MAX_SYLLABLES
+    }
+
+    return cache.CandidateCache(cache_file, cache.get_fingerprint(filepaths, settings), max_entries)
+
+
+def open_table(filepath : str) -> cache.CandidateCache:
+    """
+    Opens the table precomputed by precompute.py; None if it hasn't been built.
+    """
+    if (not os.path.exists(cache.TABLE_FILE)):
+        return None
+
+    return open_cache(filepath, cache.TABLE_FILE, 0)
+
+
+def cache_key(search_1 : str, search_2 : str) -> tuple[str, str]:
+    """
+    RETURNS : the method and k the candidates of a search are cached under;
+    None for searches which depend on the sentence (BERT).
+    """
+    if (search_1 != "GLOVE" and search_1 != "WORDNET"):
+        return None
+
+    return (f"{search_1}-{search_2}", f"{glove.K_FIRST},{glove.K_SECOND}")
+
+
+def search_word(glove_data : tuple, ngsl : list[str], original : Word, search_1 : str,
+                search_2 : str, table = None, neighbours : list[tuple] = None,
+                sentence : str = None, formatted : str = None,
+                fills : list[tuple] = None, model : str = "MODERN") -> tuple[list, list]:
+    """
+    Finds the alternatives for one complex word with the given searches.
+
+    - neighbours : GloVe (neighbour, distance) pairs found by plan_glove_search
+      (optional)
+    - sentence, formatted, fills : the sentence, its BERT format and the
+      suggestions found by plan_bert_search (BERT searches only)
+
+    RETURNS : tuple of valid and invalid alternatives
+    """
+    valid : list = []
+    invalid : list = []
+
+    # Initial search for alternative words:
+    with metrics.stage(f"search.first ({search_1})", 1):
+        if (search_1 == "GLOVE"):
+            first = glove.word_search(glove_data, ngsl, original, neighbours, table)
+            valid = first[0]
+            invalid = first[1]
+        elif (search_1 == "WORDNET"):
+            valid = wordnet.word_search(ngsl, original)
+        elif (search_1 == "MODERNBERT" or search_1 == "BIOBERT"):
+            valid = bert.word_search(ngsl, sentence, original, model, formatted, fills)
+
+    # Conduct second search for more alternatives:
+    if (search_2 == "NONE"):
+        pass
+
+    elif (search_2 == "GLOVE" or search_2 == "MODERNBERT" or search_2 == "BIOBERT"):
+        with metrics.stage(f"search.second ({search_2})", 1):
+            second = glove.list_search(glove_data, ngsl, valid, original, table)
+        valid += second
+
+        if ((search_2 == "MODERNBERT" or search_2 == "BIOBERT") and metrics.VERBOSE):
+            print("Second search cannot be conducted using BERT; defaulting to GloVe.")
+    
+    elif (search_2 == "WORDNET"):
+        with metrics.stage(f"search.second ({search_2})", 1):
+            second = wordnet.list_search(ngsl, valid, original)
+        valid += second
+
+    return (valid, invalid)
+
+
+def search_model(search_1 : str) -> str:
+    """
+    RETURNS : the BERT model a search uses for fill-mask
+    """
+    return "BIO" if (search_1 == "BIOBERT") else "MODERN"
+
+
+def plan_search(glove_data : tuple, ngsl : list[str], parsed : list[tuple[str, list[Word], str]],
+                search_1 : str, search_2 : str,
+                stores : list[cache.CandidateCache] = []) -> tuple[dict, dict]:
+    """
+    [PLANNING PASS] For GloVe, finds the neighbours of every complex word of the
+    parsed sentences with one batched search (bar words already in one of the
+    stores); for BERT, fills every masked variant in batches.
+
+    RETURNS : GloVe neighbours (see plan_glove_search) and BERT suggestions
+    (see plan_bert_search); empty for other searches
+    """
+    key : tuple[str, str] = cache_key(search_1, search_2)
+    neighbours : dict[str : list[tuple]] = {}
+    fills : dict[tuple : list[tuple]] = {}
+
+    if (search_1 == "GLOVE"):
+        cached : set[tuple[str, str]] = set()
+
+        for store in stores:
+            cached |= {(original.word, original.type) for sentence, words, formatted in parsed
+                       for original in words
+                       if store.contains(key[0], original.word, original.type, key[1])}
+
+        with metrics.stage("plan.glove", len(parsed)):
+            neighbours = plan_glove_search(glove_data, ngsl, parsed, cached)
+
+    if (search_1 == "MODERNBERT" or search_1 == "BIOBERT"):
+        with metrics.stage("plan.bert", len(parsed)):
+            fills = plan_bert_search(ngsl, parsed, search_model(search_1))
+
+    return (neighbours, fills)
+
+
+def search_sentences(glove_data : tuple, ngsl : list[str], parsed, search_1 : str,
+                     search_2 : str, table = None, candidates : cache.CandidateCache = None,
+                     stores : list[cache.CandidateCache] = [], neighbours : dict = {},
+                     fills : dict = {}, count : int = 1, total : int = None):
+    """
+    Finds the alternatives of every complex word of the parsed sentences,
+    looking each word up in the stores first and saving those searched to the
+    candidate cache.
+
+    - parsed : (sentence, Words, BERT format) of each sentence, as yielded by
+      filters.parse_sentences (read lazily)
+    - neighbours, fills : found by plan_search
+    - count, total : number of the first sentence, and of all sentences (for
+      the progress output)
+
+    RETURNS : dictionary of sentence -> (valid alternatives, invalid
+    alternatives) of each of its words
+    """
     # SETUP TO STORE ALTERNATIVE WORDS:
     # sentence : tuple(valid_alts[Word : list[Word]], invalid_alts[...])
     suggestions : dict[str : tuple[dict]] = {}
-    count = 1
+    key : tuple[str, str] = cache_key(search_1, search_2)
+    model : str = search_model(search_1)
+    started : float = time.time()
+    first : int = count
 
-    for sentence in sentences:
+    for sentence, words, formatted in parsed:
         # SANITY CHECK:
-        print(f"({count}) FINDING SUGGESTIONS FOR: '{sentence}")
+        if (metrics.VERBOSE):
+            print(f"({count}) FINDING SUGGESTIONS FOR: '{sentence}")
         count += 1
+        sentence_start : float = time.perf_counter()
+        complex : int = 0
 
         valid_alts : dict[Word : list[Word]] = {}
         invalid_alts : dict[Word : list[Word]] = {} # List of invalid alternatives stored for reference (currently not used)
 
-        words = filters.get_words(sentence)
-
         for original in words:
             if (filters.skip(original, ngsl)):
                 valid_alts[original] = ["Word skipped ; considered common."]
@@ -42,51 +270,130 @@ def find_suggestions(glove_data : tuple, ngsl : list[str], sentences : list[str]
                 continue
 
             # ELSE; look for suggestions and store as required
-            # Initial search for alternative words:
-
-            if (search_1 == "GLOVE"):
-                first = glove.word_search(glove_data, ngsl, original)
-                valid_alts[original] = first[0]
-                invalid_alts[original] = first[1]
-            elif (search_1 == "WORDNET"):
-                valid_alts[original] = wordnet.word_search(ngsl, original)
-                invalid_alts[original] = []
-            elif (search_1 == "MODERNBERT"):
-                valid_alts[original] = bert.word_search(ngsl, sentence, original, "MODERN")
-                invalid_alts[original] = []
-            elif (search_1 == "BIOBERT"):
-                valid_alts[original] = bert.word_search(ngsl, sentence, original, "BIO")
-                invalid_alts[original] = []
-
-            # Conduct second search for more alternatives:
-            if (search_2 == "NONE"):
-                pass
-
-            elif (search_2 == "GLOVE" or search_2 == "MODERNBERT" or search_2 == "BIOBERT"):
-                second = glove.list_search(glove_data, ngsl, valid_alts[original], original)
-                valid_alts[original] += second
-
-                if (search_2 == "MODERNBERT" or search_2 == "BIOBERT"):
-                    print("Second search cannot be conducted using BERT; defaulting to GloVe.")
-            
-            elif (search_2 == "WORDNET"):
-                second = wordnet.list_search(ngsl, valid_alts[original], original)
-                valid_alts[original] += second
+            complex += 1
+            found = None
+            for store in stores:
+                found = store.get(key[0], original.word, original.type, key[1])
+                if (found is not None):
+                    break
+
+            if (found is not None):
+                metrics.count("words.cached")
+                valid_alts[original], invalid_alts[original] = found
+                continue
+
+            metrics.count("words.searched")
+
+            valid_alts[original], invalid_alts[original] = search_word(
+                glove_data, ngsl, original, search_1, search_2, table,
+                neighbours.get(original.word), sentence, formatted,
+                fills.get((formatted, original.word)), model)
+
+            if (candidates is not None and key is not None):
+                candidates.put(key[0], original.word, original.type, key[1],
+                               valid_alts[original], invalid_alts[original])
 
         # Once search is complete for each word of a sentence, store both valid 
         # & invalid alternatives found
         suggestions[sentence] = (valid_alts, invalid_alts)
+        metrics.add_sentence(sentence, len(words), complex, time.perf_counter() - sentence_start)
+
+        if (metrics.PROGRESS and (count - 1) % metrics.PROGRESS_EVERY == 0):
+            print(metrics.progress_line(count - 1, total, started, start = first - 1))
 
     return suggestions
 
 
-def add_scores(suggestions : dict[str : dict], embeddings : dict, sort_by : str):
-    print(f"> Adding scores to suggested alternatives and sorting by {sort_by}")
+def find_suggestions(glove_data : tuple, ngsl : list[str], sentences : list[str],
+                     search_1 : str, search_2 : str, table = None,
+                     candidates : cache.CandidateCache = None,
+                     precomputed : cache.CandidateCache = None):
+    """
+    - candidates : cache of the alternatives found per (word, POS) (optional;
+      only used for GloVe / WordNet searches)
+    - precomputed : table of alternatives built by precompute.py, looked up
+      before the cache (optional; likewise)
+    """
+    
+    if (metrics.VERBOSE):
+        print(f"> Suggestions will be found using {search_1}-{search_2}")
+
+    # Sentences are parsed lazily in batches (one parse per sentence)
+    parsed = metrics.timed_iter("spacy.parse", filters.parse_sentences(sentences))
+    total : int = len(sentences) if (hasattr(sentences, "__len__")) else None
+
+    # Candidates of GloVe / WordNet searches only depend on the word + POS, so
+    # are looked up in the precomputed table, then the cache
+    if (cache_key(search_1, search_2) is None):
+        candidates = None
+        precomputed = None
+
+    stores : list[cache.CandidateCache] = [store for store in [precomputed, candidates]
+                                           if store is not None]
+
+    # For GloVe / BERT, parse every sentence first so the complex words can be
+    # searched at once (bar those already cached) / masked variants filled in batches
+    if (search_1 == "GLOVE" or search_1 == "MODERNBERT" or search_1 == "BIOBERT"):
+        parsed = list(parsed)
+
+    neighbours, fills = plan_search(glove_data, ngsl, parsed, search_1, search_2, stores)
+
+    suggestions = search_sentences(glove_data, ngsl, parsed, search_1, search_2, table,
+                                   candidates, stores, neighbours, fills, 1, total)
+
+    if (precomputed is not None and metrics.VERBOSE):
+        print(f"> Precomputed table : {precomputed.get_stats()}")
+    if (candidates is not None):
+        candidates.commit()
+        if (metrics.VERBOSE):
+            print(f"> Candidate cache : {candidates.get_stats()}")
+
+    return suggestions
+
+
+def sort_alternatives(valid_alts : dict[Word : list[Word]], sort_by : str):
+    """
+    Sorts every list of scored alternatives by the given score.
+    """
+    for original in valid_alts.keys():
+        alts : list = valid_alts[original]
+
+        # Words w/o alternatives have a str indicating why - skip
+        if (len(alts) == 0 or type(alts[0]) != Word):
+            continue
+
+        # for GloVe, the smaller the distance, the more accurate
+        if (sort_by.upper() == "GLOVE"):
+            alts.sort(key = lambda x : x.glove_score)
+        # for BERT, the higher the % the more accurate
+        if (sort_by.upper() == "BERT"):
+            alts.sort(key = lambda x : x.bert_score, reverse = True)
+        # for MLM, the higher the log-probability the more likely (unscored last)
+        if (sort_by.upper() == "MLM"):
+            alts.sort(key = lambda x : x.mlm_score if (x.mlm_score is not None) else float("-inf"),
+                      reverse = True)
+
+
+def add_scores(suggestions : dict[str : dict], embeddings : glove.Embeddings, sort_by : str):
+    """
+    Adds GloVe and BERT scores to every alternative and sorts them by the given
+    score. With MLM, alternatives get the log-probability of the masked language
+    model instead of a BERTScore (one forward pass per complex word rather than
+    one comparison per alternative; see bert.mlm_scores).
+    """
+    if (metrics.VERBOSE):
+        print(f"> Adding scores to suggested alternatives and sorting by {sort_by}")
     count : int = 1
+    mlm : bool = (sort_by.upper() == "MLM")
+
+    # BERT scores are collected for the whole corpus, then computed in batches
+    to_score : list[tuple[Word, tuple[str, str]]] = []
+    to_rank : list[tuple[list[Word], tuple[str, str, list[str]]]] = []
 
     for sentence in suggestions.keys():
         # [NOTE] Sanity check to ensure algorithm is running for each sentence...
-        print(f"({count}) SCORING : '{sentence}'")
+        if (metrics.VERBOSE):
+            print(f"({count}) SCORING : '{sentence}'")
         count += 1 # increment
         
         # Get valid alts found
@@ -104,48 +411,199 @@ def add_scores(suggestions : dict[str : dict], embeddings : dict, sort_by : str)
                 continue
             
             # ELSE:
+            # (1) Add GloVe scores iff not alr scored (one batched operation;
+            #     -1 in the case a suggested word isn't in GloVe):
+            unscored : list[Word] = [alt for alt in alts if alt.get_g_score() == 99]
+            with metrics.stage("glove.get_scores", len(unscored)):
+                g_scores : list[float] = glove.get_scores(embeddings, original.word,
+                                                          [alt.word for alt in unscored])
+            for alt, g_score in zip(unscored, g_scores):
+                alt.set_g_score(g_score)
+
+            # (2) MLM : queue the alternatives not alr scored, one query per word
+            if (mlm):
+                unranked : list[Word] = [alt for alt in alts if alt.get_m_score() is None]
+                if (len(unranked) > 0):
+                    to_rank.append((unranked, (sentence, original.word,
+                                               [alt.word for alt in unranked])))
+                continue
+
             for alt in alts:
-                # (1) Add GloVe score iff not alr scored:
-                if (alt.get_g_score() == 99):
-                    try:
-                        g_score : float = glove.get_score(embeddings[original.word], embeddings[alt.word])
-                    except KeyError:
-                        # In the case a suggested word isn't in GloVe 
-                        g_score : float = -1
-                    alt.set_g_score(g_score)
-
-                # (2) Add BERT score iff not alr scored:
+                # (2) Queue BERT score iff not alr scored:
                 if (alt.get_b_score() == -1):
                     new_sentence : str = bert.substitute(sentence, original.word, alt.word)
-                    b_score : float = bert.get_score(sentence, new_sentence)
-
-                    alt.set_b_score(b_score)
-                
-            # SORT ONCE ALL SCORES HAVE BEEN SET
-            # for GloVe, the smaller the distance, the more accurate
-            if (sort_by.upper() == "GLOVE"):
-                valid_alts[original].sort(key = lambda x : x.glove_score)
-            # for BERT, the higher the % the more accurate
-            if (sort_by.upper() == "BERT"):
-                valid_alts[original].sort(key = lambda x : x.bert_score, reverse = True)
-    
-    print(f"> All alternatives scored and sorted by {sort_by}")
+                    to_score.append((alt, (sentence, new_sentence)))
 
+    # (2) Add every queued BERT score with batched calls
+    b_scores : list[float] = bert.get_scores([pair for alt, pair in to_score])
+    for (alt, pair), b_score in zip(to_score, b_scores):
+        alt.set_b_score(b_score)
 
-def record_results(suggestions : dict[str : dict], tumestamp, k : int,
-                     search_1 : str, search_2 : str, sort_by : str):
-    
-    root : str = f"./output/{search_1.upper()}-{search_2.upper()}-{timestamp}"
-    txtfile = open(f"{root}.txt", "a")
+    if (len(to_rank) > 0):
+        m_scores : list[list[float]] = bert.mlm_scores([query for alts, query in to_rank])
+        for (alts, query), scores in zip(to_rank, m_scores):
+            for alt, m_score in zip(alts, scores):
+                alt.set_m_score(m_score)
+
+    # SORT ONCE ALL SCORES HAVE BEEN SET
+    for sentence in suggestions.keys():
+        sort_alternatives(suggestions[sentence][0], sort_by)
     
+    if (metrics.VERBOSE):
+        print(f"> All alternatives scored and sorted by {sort_by}")
+
+
+def init_worker(filepath : str, offline : bool, threads : int, use_cache : bool,
+                backend : str = models.BACKEND):
+    """
+    Runs once in each worker process : memory-maps the cached GloVe vectors and
+    index (so every worker shares the same pages rather than a pickled copy)
+    and loads the feature table, NGSL and candidate cache.
+    """
+    global worker_data, worker_table, worker_ngsl, worker_cache, worker_precomputed
+
+    if (offline):
+        models.set_offline(True)
+    if (backend != models.BACKEND):
+        models.set_backend(backend)
+
+    glove.SEARCH_THREADS = threads  # share the cores between workers
+    worker_data = glove.get_faiss_vectors(filepath)
+    worker_table = features.get_features(filepath, worker_data[1])
+    worker_ngsl = filters.get_freq(filters.FREQ_FILE).keys()
+
+    if (use_cache):
+        worker_cache = open_cache(filepath)
+        worker_precomputed = open_table(filepath)
+
+
+def run_shard(shard : tuple) -> dict[str : tuple[dict]]:
+    """
+    Finds and scores the suggestions for one shard of sentences in a worker.
+
+    RETURNS : suggestions of the shard, and the metrics recorded for it
+    """
+    sentences, search_1, search_2, sort_by = shard
+    metrics.reset()
+
+    suggestions = find_suggestions(worker_data, worker_ngsl, sentences,
+                                   search_1, search_2, worker_table, worker_cache,
+                                   worker_precomputed)
+    add_scores(suggestions, worker_data[1], sort_by)
+
+    return (suggestions, metrics.get_metrics())
+
+
+def prepare_files(filepath : str, use_cache : bool = True, search_1 : str = None,
+                  sort_by : str = None):
+    """
+    Builds the files workers would otherwise each build on first use - the
+    GloVe cache, index and compressed vectors, the WordNet lexicon, the
+    candidate cache's tables and (with the ONNX backend) the ONNX graphs of
+    the fill-mask models the search / sort uses - so workers only read /
+    memory-map them (rather than all writing the same files at once).
+    """
+    glove.prepare_cache(filepath)
+
+    if (models.BACKEND == "ONNX"):
+        names : list[str] = []
+        if (search_1 == "MODERNBERT" or search_1 == "BIOBERT"):
+            names.append(search_model(search_1))
+        if (sort_by == "MLM"):
+            names.append(bert.MLM_MODEL)
+
+        for name in dict.fromkeys(names):
+            models.export_onnx(models.BIO_BERT if (name == "BIO") else models.MODERN_BERT)
+
+    if (not os.path.exists(wordnet.LEXICON)):
+        wordnet.get_lexicon()
+
+    if (use_cache):
+        for store in [open_cache(filepath), open_table(filepath)]:
+            if (store is not None):
+                store.close()
+
+
+def open_pool(filepath : str, workers : int = WORKERS, use_cache : bool = True,
+              search_1 : str = None, sort_by : str = None):
+    """
+    Starts a pool of worker processes, each memory-mapping the cached GloVe
+    vectors and index (see init_worker).
+
+    - search_1, sort_by : search / sort the workers will run (to prepare the
+      models they use, see prepare_files)
+    """
+    # Workers memory-map the binary cache (without it each would parse the
+    # whole text file) and only read the files derived from it
+    prepare_files(filepath, use_cache, search_1, sort_by)
+
+    threads : int = max(1, (os.cpu_count() or 1) // workers)
+
+    # spawn rather than fork : FAISS / torch threads don't survive a fork
+    context = multiprocessing.get_context("spawn")
+
+    return context.Pool(workers, init_worker, (filepath, models.OFFLINE, threads, use_cache,
+                                               models.BACKEND))
+
+
+def run_shards(pool, sentences : list[str], search_1 : str, search_2 : str,
+               sort_by : str, workers : int = WORKERS) -> dict[str : tuple[dict]]:
+    """
+    Shards the sentences across the pool, each worker finding and scoring the
+    suggestions for its shards (as find_suggestions + add_scores).
+
+    RETURNS : suggestions of every sentence, merged in the original order
+    (the metrics of each shard are merged into this process's).
+    """
+    size : int = max(1, -(-len(sentences) // (workers * SHARDS_PER_WORKER)))
+    shards : list[tuple] = [(sentences[i : i + size], search_1, search_2, sort_by)
+                            for i in range(0, len(sentences), size)]
+
+    print(f"> Running {len(shards)} shards of up to {size} sentences on {workers} workers")
+    results : list[tuple] = pool.map(run_shard, shards)
+
+    suggestions : dict[str : tuple[dict]] = {}
+    for result, recorded in results:
+        suggestions.update(result)
+        metrics.merge(recorded)
+
+    return suggestions
+
+
+def find_suggestions_parallel(filepath : str, sentences : list[str], search_1 : str,
+                              search_2 : str, sort_by : str, workers : int = WORKERS,
+                              use_cache : bool = True) -> dict[str : tuple[dict]]:
+    """
+    Finds and scores the suggestions for every sentence on a pool of worker
+    processes (see run_shards).
+    """
+    with open_pool(filepath, workers, use_cache, search_1, sort_by) as pool:
+        return run_shards(pool, sentences, search_1, search_2, sort_by, workers)
+
+
+def results_root(timestamp, search_1 : str, search_2 : str, sort_by : str = None) -> str:
+    # sort_by is only part of the name when a run records several sorts (matrix.py)
+    if (sort_by is not None):
+        return f"./output/{search_1.upper()}-{search_2.upper()}-{sort_by.upper()}-{timestamp}"
+
+    return f"./output/{search_1.upper()}-{search_2.upper()}-{timestamp}"
+
+
+def write_header(txtfile, timestamp, search_1 : str, search_2 : str, sort_by : str):
     txtfile.write(f"TIMESTAMP : {timestamp}\n")
     txtfile.write(f"SEARCH METHODS : {search_1.upper()}-{search_2.upper()}\n")
     txtfile.write(f"SORTED BY : {sort_by}\n")
     txtfile.write("--------------------------------------------------\n")
 
-    csvfile = open(f"{root}.csv", "a")
-    fields = ["WORD", "SUGGESTIONS"]
 
+def write_suggestions(txtfile, suggestions : dict[str : dict], k : int) -> tuple[int, int, list[dict]]:
+    """
+    Writes the first k suggestions for every word of every sentence to the
+    text file.
+
+    RETURNS : number of words identified as complex, number of complex words
+    with alternatives, and the rows for the csv file.
+    """
     identified : int = 0
     suggestions_made : int = 0
 
@@ -199,9 +657,30 @@ def record_results(suggestions : dict[str : dict], tumestamp, k : int,
 
         txtfile.write("--------------------------------------------------\n")
 
+    return (identified, suggestions_made, csv_data)
+
+
+def write_totals(txtfile, identified : int, suggestions_made : int):
     # note how many words were identified as complex + had alternatives found
     txtfile.write(f"{identified} words were identified as complex.\n"
                   f"Alternatives were found for {suggestions_made} complex words.\n")
+
+
+def record_results(suggestions : dict[str : dict], timestamp, k : int,
+                     search_1 : str, search_2 : str, sort_by : str, root : str = None):
+    
+    if (root is None):
+        root = results_root(timestamp, search_1, search_2)
+    txtfile = open(f"{root}.txt", "a")
+    
+    write_header(txtfile, timestamp, search_1, search_2, sort_by)
+
+    csvfile = open(f"{root}.csv", "a")
+    fields = ["WORD", "SUGGESTIONS"]
+
+    with metrics.stage("record_results", len(suggestions)):
+        identified, suggestions_made, csv_data = write_suggestions(txtfile, suggestions, k)
+        write_totals(txtfile, identified, suggestions_made)
         
     writer = csv.DictWriter(csvfile, fieldnames = fields)
     writer.writeheader()
@@ -210,6 +689,160 @@ def record_results(suggestions : dict[str : dict], tumestamp, k : int,
     print(f"> Results have been saved to {root}")
 
 
+def read_samples(sample_sentences : str, offset : int = 0):
+    """
+    Lazily reads sentences from the samples file, starting at a byte offset.
+
+    YIELDS : (sentence, byte offset of the next sentence)
+    """
+    with open(sample_sentences, "rb") as data:
+        data.seek(offset)
+
+        for line in iter(data.readline, b""):
+            offset += len(line)
+            yield (line.decode("utf-8").rstrip(), offset)
+
+
+def read_checkpoint(root : str) -> dict:
+    """
+    Returns the checkpoint of a streamed run (see stream_results); None if the
+    run hasn't been started.
+    """
+    if (not os.path.exists(f"{root}.checkpoint.json")):
+        return None
+
+    with open(f"{root}.checkpoint.json", "r") as data:
+        return json.load(data)
+
+
+def write_checkpoint(root : str, checkpoint : dict):
+    # write to a temporary file first so a crash never leaves half a checkpoint
+    with open(f"{root}.checkpoint.json.tmp", "w") as data:
+        json.dump(checkpoint, data)
+
+    os.replace(f"{root}.checkpoint.json.tmp", f"{root}.checkpoint.json")
+
+
+def different_run(checkpoint : dict, run : dict) -> bool:
+    """
+    RETURNS : True if the checkpoint was written by a run with other samples or
+    settings (those it records - checkpoints of older runs only have samples)
+    """
+    if (os.path.abspath(checkpoint["samples"]) != run["samples"]):
+        return True
+
+    return any(checkpoint.get(key, value) != value for key, value in run.items()
+               if key != "samples")
+
+
+def stream_results(sample_sentences : str, root : str, search, k : int, search_1 : str,
+                   search_2 : str, sort_by : str, chunk_size : int = CHUNK_SIZE):
+    """
+    Streaming run : reads the samples lazily and searches, scores and appends
+    the results of each chunk of sentences to {root}.txt / {root}.csv as soon
+    as it completes. After each chunk, the byte offset reached in the samples
+    file is saved to {root}.checkpoint.json; rerunning with the same root
+    resumes from there (output written after the last checkpoint is dropped),
+    unless the samples file, search / sort methods or k differ from the
+    checkpoint's. After each chunk, the records of its sentences are appended to
+    {root}.sentences.jsonl and the totals of the run so far are rewritten to
+    {root}.metrics.json.
+
+    - search : function taking a list of sentences and returning their scored
+      suggestions (as find_suggestions + add_scores)
+    """
+    fields = ["WORD", "SUGGESTIONS"]
+    checkpoint : dict = read_checkpoint(root)
+    previous : dict = None      # metrics of the run before it was resumed
+
+    run : dict = {"samples" : os.path.abspath(sample_sentences),
+                  "methods" : [search_1, search_2, sort_by], "k" : k}
+
+    if (checkpoint is None):
+        checkpoint = {**run, "offset" : 0, "sentences" : 0, "identified" : 0,
+                      "suggestions_made" : 0, "complete" : False}
+
+        with open(f"{root}.txt", "w") as txtfile:
+            write_header(txtfile, datetime.datetime.now(), search_1, search_2, sort_by)
+        with open(f"{root}.csv", "w") as csvfile:
+            csv.DictWriter(csvfile, fieldnames = fields).writeheader()
+        open(f"{root}.sentences.jsonl", "w").close()
+    elif (checkpoint["complete"]):
+        print(f"> Run {root} is already complete")
+        return
+    elif (different_run(checkpoint, run)):
+        # the offset would point into other data / the results would be mixed
+        print(f"> [NOTE] {root} was started with {checkpoint['samples']} "
+              f"({'-'.join(checkpoint.get('methods', []))}, k = {checkpoint.get('k')}); "
+              f"not resuming it with {sample_sentences} ({search_1}-{search_2}-{sort_by}, "
+              f"k = {k}) - use another --root")
+        return
+    else:
+        print(f"> Resuming {root} after {checkpoint['sentences']} sentences")
+        previous = metrics.read_metrics(root)
+
+        # drop anything written after the last checkpoint
+        os.truncate(f"{root}.txt", checkpoint["txt_size"])
+        os.truncate(f"{root}.csv", checkpoint["csv_size"])
+        if (os.path.exists(f"{root}.sentences.jsonl")):
+            os.truncate(f"{root}.sentences.jsonl", checkpoint.get("sentences_size", 0))
+
+    samples = read_samples(sample_sentences, checkpoint["offset"])
+    finished : bool = False
+
+    # progress is measured in bytes of the samples file read
+    total_bytes : int = os.path.getsize(sample_sentences)
+    start_offset : int = checkpoint["offset"]
+    started : float = time.time()
+
+    while (not finished):
+        chunk : list[str] = []
+        offset : int = checkpoint["offset"]
+
+        for sentence, offset in samples:
+            chunk.append(sentence)
+            if (len(chunk) == chunk_size):
+                break
+        finished = (len(chunk) < chunk_size)
+
+        if (len(chunk) > 0):
+            suggestions = search(chunk)
+
+            with open(f"{root}.txt", "a") as txtfile, open(f"{root}.csv", "a") as csvfile:
+                identified, suggestions_made, csv_data = write_suggestions(txtfile, suggestions, k)
+                csv.DictWriter(csvfile, fieldnames = fields).writerows(csv_data)
+
+            checkpoint["offset"] = offset
+            checkpoint["sentences"] += len(chunk)
+            checkpoint["identified"] += identified
+            checkpoint["suggestions_made"] += suggestions_made
+
+        checkpoint["txt_size"] = os.path.getsize(f"{root}.txt")
+        checkpoint["csv_size"] = os.path.getsize(f"{root}.csv")
+        if (metrics.ENABLED):
+            metrics.write_sentences(root)
+            checkpoint["sentences_size"] = os.path.getsize(f"{root}.sentences.jsonl")
+
+        write_checkpoint(root, checkpoint)
+        if (metrics.ENABLED):
+            metrics.write_metrics(root, previous, summary = False, per_sentence = False)
+
+        print(f"> {checkpoint['sentences']} sentences saved to {root}")
+        if (metrics.PROGRESS):
+            print(metrics.progress_line(checkpoint["offset"] / 1024, total_bytes / 1024, started,
+                                        "KB of samples", start_offset / 1024))
+
+    with open(f"{root}.txt", "a") as txtfile:
+        write_totals(txtfile, checkpoint["identified"], checkpoint["suggestions_made"])
+
+    checkpoint["complete"] = True
+    write_checkpoint(root, checkpoint)
+    if (metrics.ENABLED):
+        metrics.write_metrics(root, previous, per_sentence = False)
+    
+    print(f"> Results have been saved to {root}")
+
+
 def arg_parse(arg : str, arg_idx : int) -> str:
     if (arg.upper() == "GLOVE"):
         return "GLOVE"
@@ -224,6 +857,9 @@ def arg_parse(arg : str, arg_idx : int) -> str:
         return "BIOBERT"
     if (arg.upper() == "NONE"):
         return "NONE"
+    # MLM only ranks alternatives (sort_by)
+    if (arg.upper() == "MLM" and arg_idx == 3):
+        return "MLM"
 
     # ELSE:
     if (arg_idx == 1):
@@ -235,6 +871,36 @@ def arg_parse(arg : str, arg_idx : int) -> str:
         return "BERT"
     
 
+def parse_options(argv : list[str]) -> tuple[list[str], dict[str : str]]:
+    """
+    Splits the command line into positional arguments and --options.
+
+    RETURNS : list of positional arguments, dictionary of option -> value
+    (True for options without a value)
+    """
+    args : list[str] = []
+    options : dict[str : str] = {}
+    i : int = 0
+
+    while (i < len(argv)):
+        arg : str = argv[i]
+
+        if (not arg.startswith("--")):
+            args.append(arg)
+        elif ("=" in arg):
+            name, value = arg.split("=", 1)
+            options[name.lower()] = value
+        elif (arg.lower() in VALUE_OPTIONS and i + 1 < len(argv)):
+            options[arg.lower()] = argv[i + 1]
+            i += 1
+        else:
+            options[arg.lower()] = True
+
+        i += 1
+
+    return (args, options)
+
+
 def get_samples(sample_sentences : str) -> list :
     sentences : list = []
 
@@ -244,13 +910,31 @@ def get_samples(sample_sentences : str) -> list :
     return sentences
 
 
-# python3 find_suggestions.py [glove/wordnet/bert] [glove/wordnet/bert] [glove/bert]
+# python3 find_suggestions.py [glove/wordnet/bert] [glove/wordnet/bert] [glove/bert/mlm] 
+#                            [--offline] [--workers N] [--stream [--root ROOT] [--chunk-size N]] [--no-cache]
+#                            [--progress] [--no-metrics] [--backend fp32/int8/onnx] [--concurrent]
 # specify none for search_2 if you want to skip it !!!
 if __name__ == "__main__":
-    # Load in relevant items:
-    glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
-    ngsl : list[str] = filters.get_freq().keys()
-    sentences = get_samples(SAMPLES)
+    # Options (--offline : only use models / corpora already downloaded,
+    #          --workers : number of worker processes,
+    #          --stream : write results per chunk, resumable with the same --root,
+    #          --no-cache : don't use the candidate cache / precomputed table,
+    #          --progress : print the throughput / ETA as sentences are searched,
+    #          --no-metrics : don't write {results}.metrics.json,
+    #          --backend : inference backend of the BERT models, see models.BACKENDS,
+    #          --concurrent : run the stages concurrently, see stages.py)
+    args, options = parse_options(sys.argv[1:])
+    metrics.PROGRESS = ("--progress" in options)
+    metrics.ENABLED = ("--no-metrics" not in options)
+    use_cache : bool = ("--no-cache" not in options)
+    workers : int = int(options.get("--workers", WORKERS))
+    chunk_size : int = int(options.get("--chunk-size", CHUNK_SIZE))
+
+    if ("--offline" in options):
+        models.set_offline(True)
+    if ("--backend" in options):
+        models.set_backend(options["--backend"])
+
     timestamp = datetime.datetime.now()    # Timestamp for recording results
 
 
@@ -260,18 +944,73 @@ if __name__ == "__main__":
     sort_by : str = "BERT"
 
     # At least 2 args;
-    if (len(sys.argv) > 1):
-        search_1 : str = arg_parse(sys.argv[1], 1)
+    if (len(args) > 0):
+        search_1 : str = arg_parse(args[0], 1)
     # At least 3 args;
-    if (len(sys.argv) > 2):
-        search_2 : str = arg_parse(sys.argv[2], 2)
-    if (len(sys.argv) > 3):
-        sort_by : str = arg_parse(sys.argv[3], 3)
-
-    suggestions = find_suggestions(glove_data, ngsl, sentences, 
-                                   search_1, search_2)
+    if (len(args) > 1):
+        search_2 : str = arg_parse(args[1], 2)
+    if (len(args) > 2):
+        sort_by : str = arg_parse(args[2], 3)
+
+    if ("--concurrent" in options):
+        glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
+        table = features.get_features(GLOVE_VECTORS, glove_data[1])
+        ngsl : list[str] = filters.get_freq().keys()
+        open_stores = None
+
+        if (use_cache):
+            open_stores = lambda : (open_cache(GLOVE_VECTORS), open_table(GLOVE_VECTORS))
+
+        samples = (sentence for sentence, offset in read_samples(SAMPLES))
+        stages.run_pipeline(samples, glove_data, ngsl, search_1, search_2, sort_by, timestamp,
+                            15, table, open_stores,
+                            int(options.get("--chunk-size", stages.CHUNK_SIZE)))
+
+        if (metrics.ENABLED):
+            metrics.write_metrics(results_root(timestamp, search_1, search_2))
+
+    elif ("--stream" in options):
+        root : str = options.get("--root", results_root(timestamp, search_1, search_2))
+
+        if (workers > 1):
+            with open_pool(GLOVE_VECTORS, workers, use_cache, search_1, sort_by) as pool:
+                search = lambda chunk : run_shards(pool, chunk, search_1, search_2, sort_by, workers)
+                stream_results(SAMPLES, root, search, 15, search_1, search_2, sort_by, chunk_size)
+        else:
+            glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
+            table = features.get_features(GLOVE_VECTORS, glove_data[1])
+            ngsl : list[str] = filters.get_freq().keys()
+            candidates = open_cache(GLOVE_VECTORS) if (use_cache) else None
+            precomputed = open_table(GLOVE_VECTORS) if (use_cache) else None
+
+            def search(chunk : list[str]) -> dict:
+                suggestions = find_suggestions(glove_data, ngsl, chunk, search_1, search_2,
+                                               table, candidates, precomputed)
+                add_scores(suggestions, glove_data[1], sort_by)
+                return suggestions
+
+            stream_results(SAMPLES, root, search, 15, search_1, search_2, sort_by, chunk_size)
+
+    else:
+        sentences = get_samples(SAMPLES)
+
+        if (workers > 1):
+            suggestions = find_suggestions_parallel(GLOVE_VECTORS, sentences, search_1,
+                                                    search_2, sort_by, workers, use_cache)
+        else:
+            glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
+            table = features.get_features(GLOVE_VECTORS, glove_data[1])
+            ngsl : list[str] = filters.get_freq().keys()
+            candidates = open_cache(GLOVE_VECTORS) if (use_cache) else None
+            precomputed = open_table(GLOVE_VECTORS) if (use_cache) else None
+
+            suggestions = find_suggestions(glove_data, ngsl, sentences, 
+                                           search_1, search_2, table, candidates, precomputed)
+
+            add_scores(suggestions, glove_data[1], sort_by)
+        
+        # RECORD THE TOP 15 WORDS
+        record_results(suggestions, timestamp, 15, search_1, search_2, sort_by)
 
-    add_scores(suggestions, glove_data[1], sort_by)
-    
-    # RECORD THE TOP 15 WORDS
-    record_results(suggestions, timestamp, 15, search_1, search_2, sort_by)
+        if (metrics.ENABLED):
+            metrics.write_metrics(results_root(timestamp, search_1, search_2))
@@ -1,13 +1,53 @@
 import numpy as np
 import datetime
 import faiss
+import json
+import os
+import sys
+import uuid
 from scipy import spatial
 
 import filters
+import metrics
 from word import Word
+from embeddings import Embeddings
 
 GLOVE_VECTORS : str = "./data_files/commoncrawl.840B.300d.txt"
 
+# Bump whenever the layout of the binary cache files changes:
+CACHE_VERSION : int = 3
+
+# FAISS INDEX SETTINGS (FLAT = exact search; IVF / HNSW / IVFPQ = approximate;
+# SQ8 / SQ16 / PQ = exhaustive search over compressed vectors):
+INDEX_TYPE : str = "FLAT"
+INDEX_TYPES : list[str] = ["FLAT", "IVF", "HNSW", "IVFPQ", "SQ8", "SQ16", "PQ"]
+NLIST : int = 4096      # IVF: number of clusters the vectors are split into
+NPROBE : int = 16       # IVF: number of clusters visited per query
+HNSW_M : int = 32       # HNSW: number of links per node in the graph
+EF_SEARCH : int = 128   # HNSW: size of the candidate queue per query
+PQ_M : int = 50         # IVFPQ / PQ: number of sub-quantizers (must divide depth)
+TRAIN_SIZE : int = 262144   # max vectors sampled to train IVF / PQ indexes
+
+# Storage of the vectors looked up for queries / scoring (FLOAT16 = half, SQ8 =
+# a quarter of the FLOAT32 memory; decoded to float32 on lookup). Combine with a
+# compressed index type, as a FLAT index holds its own float32 copy:
+STORAGE : str = "FLOAT32"
+STORAGE_TYPES : list[str] = ["FLOAT32", "FLOAT16", "SQ8"]
+
+# Search only words that could ever be suggested (see filters.is_candidate);
+# the full vocabulary is still used to look up the vectors of query words
+CANDIDATES_ONLY : bool = False
+
+# SEARCH SETTINGS:
+K_FIRST : int = 50          # neighbours fetched per word by word_search
+K_SECOND : int = 25         # neighbours fetched per suggestion by list_search
+SEARCH_THREADS : int = 0    # threads used by FAISS for batched search (0 = all cores)
+
+# MULTI-HOP EXPANSION (list_search):
+EXPAND_DEPTH : int = 1          # hops beyond the first search
+BEAM_WIDTH : int = 100          # closest new words expanded further per hop (0 = all)
+MAX_DISTANCE : float = None     # ignore neighbours further than this (None = no limit)
+
 def get_depth(filepath : str) -> int:
     """
     Returns the expected depth of vectors from given file based on filename
@@ -49,21 +89,131 @@ def validate_data(filepath : str = "./data_files/commoncrawl.840B.300d.txt") ->
 
     print(f"TOTAL WORDS : {count}")
 
-def get_faiss_vectors(filepath : str = GLOVE_VECTORS) -> tuple[dict]:
+def cache_paths(filepath : str) -> dict[str : str]:
+    """
+    Returns the filepaths of the binary cache files kept next to the given
+    GloVe text file.
     """
-    Given filepath of GloVe vector file, parses and stores vectors.
+    return {
+        "vectors" : f"{filepath}.vectors",  # raw float32, one row per word
+        "vocab" : f"{filepath}.vocab",      # one word per line, same order
+        "index" : f"{filepath}.index",      # serialised FAISS index
+        "meta" : f"{filepath}.meta.json"    # source fingerprint + shape + build id
+    }
 
-    RETURNS : FAISS index for searching and word embedding & id dictionaries 
-    to access the words + vectors.
+
+def storage_paths(filepath : str) -> dict[str : str]:
     """
-    print(f"> Creating FAISS index from {filepath}")
+    Returns the filepaths of the compressed copies of the cached vectors (see
+    convert_storage).
+    """
+    return {
+        "FLOAT16" : f"{filepath}.vectors16",        # raw float16, one row per word
+        "SQ8" : f"{filepath}.vectors8",             # uint8 codes, one row per word
+        "SQ8_PARAMS" : f"{filepath}.vectors8.npy"   # offset + scale per dimension
+    }
+
+
+def source_fingerprint(filepath : str) -> dict:
+    """
+    Returns the size and modification time of the given file, used to tell
+    whether a cache built from it is still up to date.
+    """
+    stats = os.stat(filepath)
+
+    return {"size" : stats.st_size, "mtime" : int(stats.st_mtime)}
+
+
+def cache_is_valid(filepath : str) -> bool:
+    """
+    Checks whether the binary cache for the given GloVe file exists and was
+    built from the current version of the file.
+
+    RETURNS : True if the cache can be memory-mapped, False otherwise.
+    """
+    paths : dict = cache_paths(filepath)
+
+    for path in paths.values():
+        if (not os.path.exists(path)):
+            return False
+
+    with open(paths["meta"], "r") as data:
+        meta : dict = json.load(data)
+
+    if (meta.get("version") != CACHE_VERSION):
+        return False
+
+    # Cache can still be used if the text file has since been removed
+    if (not os.path.exists(filepath)):
+        return True
+
+    return (meta.get("source") == source_fingerprint(filepath))
+
+
+def build_stamp(filepath : str, ngsl : bool = False) -> dict:
+    """
+    Returns the fingerprint of the inputs a file derived from the binary cache
+    (index, candidate rows, compressed vectors, feature table) is built from :
+    the id of the conversion that wrote the cache, and the NGSL file's
+    fingerprint if ngsl is set.
+    """
+    with open(cache_paths(filepath)["meta"], "r") as data:
+        stamp : dict = {"build" : json.load(data).get("build")}
+
+    if (ngsl):
+        stamp["ngsl"] = source_fingerprint(filters.FREQ_FILE)
+
+    return stamp
+
+
+def is_built(path : str, stamp : dict) -> bool:
+    """
+    Checks whether the derived file exists and was built from the inputs in
+    the given stamp (saved next to it as {path}.built.json by mark_built).
+    """
+    if (not os.path.exists(path) or not os.path.exists(f"{path}.built.json")):
+        return False
+
+    with open(f"{path}.built.json", "r") as data:
+        return (json.load(data) == stamp)
 
-    depth : int = get_depth(filepath)   # find expected depth of vectors
-    idx : int = 1                        # initialise id count for index
 
-    # process GloVe data
-    word_embeddings : dict = {}  # word -> vector for search
-    word_id : dict = {}          # id -> word to retrieve correct word
+def mark_built(path : str, stamp : dict):
+    write_atomic(f"{path}.built.json", lambda temp : write_json(temp, stamp))
+
+
+def write_json(path : str, data : dict):
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+
+def write_array(path : str, arr):
+    with open(path, "wb") as file:
+        np.save(file, arr)
+
+
+def write_atomic(path : str, write):
+    """
+    Calls write with a temporary filepath, then moves the file into place, so
+    a partial file (or one being written by another process) is never read.
+    """
+    temp : str = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        write(temp)
+        os.replace(temp, path)
+    finally:
+        if (os.path.exists(temp)):
+            os.remove(temp)
+
+
+def parse_vectors(filepath : str):
+    """
+    Given filepath of GloVe vector file, yields each (word, vector) pair with
+    the expected depth - duplicate words are only yielded the first time.
+    """
+    depth : int = get_depth(filepath)   # find expected depth of vectors
+    seen : set[str] = set()
 
     with open(filepath, "r") as data:
         for line in data:
@@ -71,52 +221,539 @@ def get_faiss_vectors(filepath : str = GLOVE_VECTORS) -> tuple[dict]:
             word = values[0]
             vector = values[1:]
 
-            if (len(vector) == depth):
+            if (len(vector) == depth and word not in seen):
                 try:
-                    arr = np.array(values[1:], "float32")
+                    arr = np.array(vector, "float32")
                 # IN CASE OF ERROR VALUES -> skip (temp measure)
                 except:
                     continue
 
-                # add to dictionary IFF word hasn't been added already
-                if (word not in word_embeddings.keys()):
-                    word_embeddings[word] = arr
-                    word_id[idx] = word
-                    idx += 1
-    
-    # SETUP FOR FAISS INDEX:
-    faiss_index = faiss.IndexFlatL2(depth)
-    faiss_index = faiss.IndexIDMap(faiss_index)
+                seen.add(word)
+                yield (word, arr)
+
+
+def candidates_path(filepath : str) -> str:
+    """
+    Returns the filepath of the saved rows of the candidate vocabulary.
+    """
+    return f"{filepath}.candidates{filters.CANDIDATE_SYLLABLES}.npy"
+
+
+def index_path(filepath : str, index_type : str = INDEX_TYPE, candidates : bool = False) -> str:
+    """
+    Returns the filepath of the serialised FAISS index of the given type; the
+    build parameters are part of the name so changing them forces a rebuild.
+    """
+    index_type = index_type.upper()
+    name : str = "flat"
+
+    if (index_type == "IVF"):
+        name = f"ivf{NLIST}"
+    elif (index_type == "HNSW"):
+        name = f"hnsw{HNSW_M}"
+    elif (index_type == "IVFPQ"):
+        name = f"ivfpq{NLIST}x{PQ_M}"
+    elif (index_type == "SQ8"):
+        name = "sq8"
+    elif (index_type == "SQ16"):
+        name = "sq16"
+    elif (index_type == "PQ"):
+        name = f"pq{PQ_M}"
+
+    if (candidates):
+        return f"{candidates_path(filepath)[:-4]}.{name}.index"
+
+    # Flat index over the full vocabulary is written by convert_vectors
+    if (index_type == "FLAT"):
+        return cache_paths(filepath)["index"]
 
-    embedding_arr = np.array(list(word_embeddings.values()))
-    id_arr = np.array(list(word_id.keys()))
+    return f"{filepath}.{name}.index"
 
+
+def build_index(embedding_arr, id_arr, depth : int, index_type : str = INDEX_TYPE):
+    """
+    Builds a FAISS index of the given type over the provided vectors. Every
+    index is wrapped in an IndexIDMap so search results are always GloVe ids.
+
+    RETURNS : FAISS index ready for searching.
+    """
+    index_type = index_type.upper()
+    print(f"> Building {index_type} FAISS index over {len(id_arr)} vectors")
+
+    if (index_type == "IVF"):
+        quantizer = faiss.IndexFlatL2(depth)
+        inner = faiss.IndexIVFFlat(quantizer, depth, NLIST)
+    elif (index_type == "HNSW"):
+        inner = faiss.IndexHNSWFlat(depth, HNSW_M)
+    elif (index_type == "IVFPQ"):
+        quantizer = faiss.IndexFlatL2(depth)
+        inner = faiss.IndexIVFPQ(quantizer, depth, NLIST, PQ_M, 8)
+    elif (index_type == "SQ8"):
+        inner = faiss.IndexScalarQuantizer(depth, faiss.ScalarQuantizer.QT_8bit)
+    elif (index_type == "SQ16"):
+        inner = faiss.IndexScalarQuantizer(depth, faiss.ScalarQuantizer.QT_fp16)
+    elif (index_type == "PQ"):
+        inner = faiss.IndexPQ(depth, PQ_M, 8)
+    elif (index_type == "FLAT"):
+        inner = faiss.IndexFlatL2(depth)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    # IVF / SQ / PQ indexes need to learn their clusters / ranges from a sample first
+    if (not inner.is_trained):
+        rng = np.random.default_rng(0)
+        sample_size : int = min(len(embedding_arr), TRAIN_SIZE)
+        sample = np.sort(rng.choice(len(embedding_arr), sample_size, replace = False))
+        inner.train(np.ascontiguousarray(embedding_arr[sample]))
+
+    faiss_index = faiss.IndexIDMap(inner)
     faiss_index.add_with_ids(embedding_arr, id_arr)
+    set_search_params(faiss_index)
 
-    print("> FAISS index created from GloVe data")
+    return faiss_index
+
+
+def exact_distances(faiss_index) -> bool:
+    """
+    Checks whether the distances the index reports are the exact distances
+    between the vectors : indexes storing the float32 vectors (FLAT, and IVF /
+    HNSW, which only approximate which neighbours are found) and SQ16, whose
+    float16 codes are within the tolerance of the rounded scores. PQ / SQ8 /
+    IVFPQ only estimate them from their codes.
+    """
+    inner = faiss_index
+    if (isinstance(inner, faiss.IndexIDMap)):
+        inner = faiss.downcast_index(inner.index)
+
+    if (isinstance(inner, (faiss.IndexFlat, faiss.IndexIVFFlat, faiss.IndexHNSWFlat))):
+        return True
 
-    return (faiss_index, word_embeddings, word_id)
+    return (isinstance(inner, faiss.IndexScalarQuantizer)
+            and inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16)
 
 
-def find_k_closest(index, embeddings : dict, ids : dict, word : str, k : int) -> list:
+def set_search_params(faiss_index, nprobe : int = NPROBE, ef_search : int = EF_SEARCH):
     """
-    Given a word and value k, returns the k closest neighbours to the word
-    based on GloVe embeddings.
+    Sets the speed / accuracy trade-off of an approximate index; has no effect
+    on a flat index.
     """
-    
-    closest : list = []
-    
+    inner = faiss_index
+    if (isinstance(inner, faiss.IndexIDMap)):
+        inner = faiss.downcast_index(inner.index)
+
+    if (isinstance(inner, faiss.IndexIVF)):
+        inner.nprobe = nprobe
+    elif (isinstance(inner, faiss.IndexHNSW)):
+        inner.hnsw.efSearch = ef_search
+
+
+def read_index(path : str):
+    """
+    Reads a serialised FAISS index, memory-mapping it where FAISS supports it
+    for the index type (so worker processes share its pages). IO_FLAG_MMAP
+    alone still copies the vectors of flat indexes into private memory; the
+    IFC flag maps them too.
+    """
+    flag : int = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
     try:
-        # +1 to account for the fact that the word itself will always be closest
-        result = index.search(np.atleast_2d(embeddings[word]), k + 1)[1]
-        
-        for i in result[0]:
-            closest.append(ids[i])
+        faiss_index = faiss.read_index(path, flag)
+    except RuntimeError:
+        faiss_index = faiss.read_index(path)
+
+    set_search_params(faiss_index)
+
+    return faiss_index
+
+
+def load_index(filepath : str, embedding_arr, depth : int, index_type : str = INDEX_TYPE,
+               rows = None):
+    """
+    Loads the index of the given type from disk if it was built from the
+    current cache, otherwise builds it and saves it for the next run.
+
+    - rows : if given, only these rows of the matrix are indexed (see
+      get_candidate_rows)
+    """
+    candidates : bool = rows is not None
+    path : str = index_path(filepath, index_type, candidates)
+
+    stamp : dict = build_stamp(filepath, candidates)
+
+    if (is_built(path, stamp)):
+        return read_index(path)
+
+    if (candidates):
+        faiss_index = build_index(embedding_arr[rows], rows, depth, index_type)
+    else:
+        id_arr = np.arange(len(embedding_arr), dtype = "int64")
+        faiss_index = build_index(embedding_arr, id_arr, depth, index_type)
+    write_atomic(path, lambda temp : faiss.write_index(faiss_index, temp))
+    mark_built(path, stamp)
+    print(f"> {index_type.upper()} FAISS index saved to {path}")
+
+    return faiss_index
+
+
+def find_candidate_rows(words : list[str], ngsl : list[str]):
+    """
+    Returns the rows (in order) of every word that could be suggested as a
+    simpler alternative, as per filters.is_candidate.
+    """
+    print(f"> Selecting simplification candidates from {len(words)} words")
+    rows : list[int] = [row for row in range(len(words)) if filters.is_candidate(words[row], ngsl)]
+    print(f"> {len(rows)} candidates selected")
+
+    return np.array(rows, "int64")
+
+
+def get_candidate_rows(filepath : str, words : list[str]):
+    """
+    Loads the candidate rows saved next to the binary cache, reselecting them
+    if the cache or NGSL file has changed since they were saved.
+    """
+    path : str = candidates_path(filepath)
+    stamp : dict = build_stamp(filepath, True)
+
+    if (is_built(path, stamp)):
+        return np.load(path)
+
+    rows = find_candidate_rows(words, filters.get_freq(filters.FREQ_FILE).keys())
+    write_atomic(path, lambda temp : write_array(temp, rows))
+    mark_built(path, stamp)
+
+    return rows
+
+
+def convert_vectors(filepath : str = GLOVE_VECTORS):
+    """
+    [ONE-TIME STEP] Converts the GloVe text file into binary cache files that
+    can be memory-mapped on later runs: a contiguous float32 matrix, a
+    vocabulary file and a serialised FAISS index.
+    """
+    print(f"> Converting {filepath} into binary cache files")
+
+    paths : dict = cache_paths(filepath)
+    depth : int = get_depth(filepath)
+    count : int = 0
+
+    # Stream vectors straight to disk so the text file is never held in memory
+    with open(paths["vectors"], "wb") as vectors, open(paths["vocab"], "w") as vocab:
+        for word, arr in parse_vectors(filepath):
+            vectors.write(arr.tobytes())
+            vocab.write(f"{word}\n")
+            count += 1
+
+    embedding_arr = np.memmap(paths["vectors"], dtype = "float32", mode = "r",
+                              shape = (count, depth))
+    id_arr = np.arange(count, dtype = "int64")
+
+    # Files derived from the cache are stamped with the id of this conversion
+    build : str = uuid.uuid4().hex
+
+    faiss_index = build_index(embedding_arr, id_arr, depth, "FLAT")
+    write_atomic(paths["index"], lambda temp : faiss.write_index(faiss_index, temp))
+    mark_built(paths["index"], {"build" : build})
+
+    # Meta file is written last; a partial conversion is never seen as valid
+    meta : dict = {
+        "version" : CACHE_VERSION,
+        "source" : source_fingerprint(filepath),
+        "depth" : depth,
+        "count" : count,
+        "build" : build
+    }
+    write_atomic(paths["meta"], lambda temp : write_json(temp, meta))
+
+    print(f"> Cached {count} vectors to {paths['vectors']}")
+
+
+def flat_matrix(faiss_index):
+    """
+    Returns the vectors stored inside a flat FAISS index as a numpy matrix
+    that shares the index's memory, or None for any other index type.
+    """
+    inner = faiss_index
+    if (isinstance(inner, faiss.IndexIDMap)):
+        inner = faiss.downcast_index(inner.index)
+
+    if (not isinstance(inner, faiss.IndexFlat)):
+        return None
+
+    matrix = faiss.rev_swig_ptr(inner.get_xb(), inner.ntotal * inner.d)
+
+    return matrix.reshape(inner.ntotal, inner.d)
+
+
+def convert_storage(filepath : str, embedding_arr, storage : str = STORAGE,
+                    chunk_size : int = 65536):
+    """
+    Writes a compressed copy of the cached float32 vectors next to the cache,
+    chunk by chunk : float16 values, or uint8 codes with the offset and scale
+    of each dimension (8-bit scalar quantization over its min / max).
+    """
+    paths : dict = storage_paths(filepath)
+    storage = storage.upper()
+    print(f"> Converting cached vectors to {storage}")
 
-    except KeyError:
-        return []
+    if (storage == "SQ8"):
+        low = np.full(embedding_arr.shape[1], np.inf, "float32")
+        high = np.full(embedding_arr.shape[1], -np.inf, "float32")
+
+        for start in range(0, len(embedding_arr), chunk_size):
+            chunk = np.asarray(embedding_arr[start : start + chunk_size])
+            low = np.minimum(low, chunk.min(axis = 0))
+            high = np.maximum(high, chunk.max(axis = 0))
+
+        scale = np.maximum((high - low) / 255, np.finfo("float32").tiny).astype("float32")
+        write_atomic(paths["SQ8_PARAMS"], lambda temp : write_array(temp, np.stack([low, scale])))
+
+    def write(path : str):
+        with open(path, "wb") as data:
+            for start in range(0, len(embedding_arr), chunk_size):
+                chunk = np.asarray(embedding_arr[start : start + chunk_size])
+
+                if (storage == "SQ8"):
+                    codes = np.rint((chunk - low) / scale)
+                    data.write(np.clip(codes, 0, 255).astype("uint8").tobytes())
+                else:
+                    data.write(chunk.astype("float16").tobytes())
+
+    write_atomic(paths[storage], write)
+
+
+def load_storage(filepath : str, embedding_arr, storage : str = STORAGE) -> tuple:
+    """
+    Memory-maps the compressed copy of the cached vectors (see convert_storage),
+    converting them first if they are missing or were built from another
+    version of the cache.
+
+    RETURNS : stored matrix, and the SQ8 offset + scale (None otherwise)
+    """
+    paths : dict = storage_paths(filepath)
+    storage = storage.upper()
+
+    if (storage not in STORAGE_TYPES):
+        raise ValueError(f"Unknown storage '{storage}', expected one of {STORAGE_TYPES}")
+
+    path : str = paths[storage]
+    stamp : dict = build_stamp(filepath)
+    if (not is_built(path, stamp)):
+        convert_storage(filepath, embedding_arr, storage)
+        mark_built(path, stamp)
+
+    dtype : str = "uint8" if (storage == "SQ8") else "float16"
+    matrix = np.memmap(path, dtype = dtype, mode = "r", shape = embedding_arr.shape)
+
+    if (storage == "SQ8"):
+        offset, scale = np.load(paths["SQ8_PARAMS"])
+        return (matrix, offset, scale)
+
+    return (matrix, None, None)
+
+
+def prepare_cache(filepath : str, index_type : str = INDEX_TYPE,
+                  candidates : bool = CANDIDATES_ONLY, storage : str = STORAGE):
+    """
+    Builds (once) every file get_faiss_vectors would otherwise build on first
+    use - the binary cache, the index, the candidate rows and the compressed
+    vectors - so processes started afterwards only read / memory-map them.
+    """
+    if (not cache_is_valid(filepath)):
+        convert_vectors(filepath)
+
+    with open(cache_paths(filepath)["meta"], "r") as data:
+        meta : dict = json.load(data)
+
+    embedding_arr = np.memmap(cache_paths(filepath)["vectors"], dtype = "float32", mode = "r",
+                              shape = (meta["count"], meta["depth"]))
+
+    rows = None
+    if (candidates):
+        rows = get_candidate_rows(filepath, read_vocab(filepath))
+
+    if (not is_built(index_path(filepath, index_type, candidates), build_stamp(filepath, candidates))):
+        load_index(filepath, embedding_arr, meta["depth"], index_type, rows)
+
+    if (storage.upper() != "FLOAT32"):
+        load_storage(filepath, embedding_arr, storage)
+
+
+def read_vocab(filepath : str) -> list[str]:
+    """
+    Returns the words of the binary cache in row order.
+    """
+    with open(cache_paths(filepath)["vocab"], "r") as data:
+        return [line.rstrip("\n") for line in data]
+
+
+def load_cached_vectors(filepath : str, index_type : str = INDEX_TYPE,
+                        candidates : bool = CANDIDATES_ONLY, storage : str = STORAGE) -> tuple:
+    """
+    Memory-maps the binary cache files written by convert_vectors, loading (or
+    building once) the FAISS index of the given type - over the candidate
+    vocabulary only if candidates is set - and the vectors in the given
+    storage (see STORAGE).
+
+    RETURNS : FAISS index for searching, the embedding matrix and the list of
+    words by id (= row of the matrix).
+    """
+    print(f"> Loading cached {index_type.upper()} FAISS index for {filepath}")
+    paths : dict = cache_paths(filepath)
+
+    with open(paths["meta"], "r") as data:
+        meta : dict = json.load(data)
+
+    embedding_arr = np.memmap(paths["vectors"], dtype = "float32", mode = "r",
+                              shape = (meta["count"], meta["depth"]))
+    words : list[str] = read_vocab(filepath)
+
+    rows = None
+    if (candidates):
+        rows = get_candidate_rows(filepath, words)
+
+    faiss_index = load_index(filepath, embedding_arr, meta["depth"], index_type, rows)
+
+    if (storage.upper() != "FLOAT32"):
+        matrix, offset, scale = load_storage(filepath, embedding_arr, storage)
+        embeddings = Embeddings(matrix, words, faiss_index, offset, scale)
+    else:
+        # the memory-mapped cache, not the index's vectors (which FAISS may
+        # have read into private memory)
+        embeddings = Embeddings(embedding_arr, words, faiss_index)
+
+    print("> FAISS index loaded from cache")
+
+    return (faiss_index, embeddings, embeddings.words)
+
+
+def count_lines(filepath : str) -> int:
+    count : int = 0
+
+    with open(filepath, "rb") as data:
+        for block in iter(lambda : data.read(1 << 24), b""):
+            count += block.count(b"\n")
+
+    return count + 1
+
+
+def get_faiss_vectors(filepath : str = GLOVE_VECTORS, index_type : str = INDEX_TYPE,
+                      candidates : bool = CANDIDATES_ONLY, storage : str = STORAGE) -> tuple:
+    """
+    Given filepath of GloVe vector file, parses and stores vectors. If the
+    binary cache (see convert_vectors) is up to date it is memory-mapped
+    instead of parsing the text file.
+
+    - index_type : one of INDEX_TYPES; approximate indexes are only saved to
+      disk once the binary cache exists
+    - candidates : search only the words that could be suggested as simpler
+      alternatives (the returned embeddings still cover every word)
+    - storage : one of STORAGE_TYPES; compressed storage needs the binary cache
+
+    RETURNS : FAISS index for searching, the embedding matrix (with a word ->
+    row mapping) and the list of words by id (= row of the matrix).
+    """
+    if (cache_is_valid(filepath)):
+        return load_cached_vectors(filepath, index_type, candidates, storage)
+
+    if (storage.upper() != "FLOAT32"):
+        print(f"> [NOTE] {storage} storage needs the binary cache; using FLOAT32")
+
+    print(f"> Creating FAISS index from {filepath}")
+    print(f"> [NOTE] run 'python3 glove.py convert' once to cache the vectors")
+
+    depth : int = get_depth(filepath)   # find expected depth of vectors
+    row : int = 0
+
+    # process GloVe data straight into one preallocated matrix
+    embedding_arr = np.empty((count_lines(filepath), depth), "float32")
+    words : list[str] = []       # row -> word to retrieve correct word
+
+    for word, arr in parse_vectors(filepath):
+        embedding_arr[row] = arr
+        words.append(word)
+        row += 1
+
+    embedding_arr = embedding_arr[:row]
     
+    # SETUP FOR FAISS INDEX:
+    matrix = None
+    if (candidates):
+        rows = find_candidate_rows(words, filters.get_freq(filters.FREQ_FILE).keys())
+        faiss_index = build_index(embedding_arr[rows], rows, depth, index_type)
+    else:
+        id_arr = np.arange(row, dtype = "int64")
+        faiss_index = build_index(embedding_arr, id_arr, depth, index_type)
+
+        # Once copied into a flat index, share the index's copy of the vectors
+        # so the parsed matrix can be freed
+        matrix = flat_matrix(faiss_index)
+
+    if (matrix is None):
+        matrix = embedding_arr
+
+    embeddings = Embeddings(matrix, words, faiss_index)
+
+    print("> FAISS index created from GloVe data")
+
+    return (faiss_index, embeddings, embeddings.words)
+
+
+def search_batch(index, embeddings : Embeddings, ids : list[str], words : list[str],
+                 k : int) -> dict[str : list[tuple[str, float]]]:
+    """
+    Given a list of words and value k, finds the k closest neighbours of every
+    word with a single (multi-threaded) FAISS search, keeping the distances
+    FAISS computed along the way.
+
+    RETURNS : dictionary of word -> list of (neighbour, distance); words
+    without a GloVe vector map to an empty list.
+    """
+    closest : dict[str : list[tuple[str, float]]] = {word : [] for word in words}
+    to_search : list[str] = [word for word in closest.keys() if word in embeddings]
+
+    if (len(to_search) == 0):
+        return closest
+
+    if (SEARCH_THREADS > 0):
+        faiss.omp_set_num_threads(SEARCH_THREADS)
+
+    queries = np.ascontiguousarray(embeddings.get_vectors(to_search), "float32")
+
+    # +1 to account for the fact that the word itself will always be closest
+    with metrics.stage("faiss.search", len(to_search)):
+        distances, result = index.search(queries, k + 1)
+
+    # FAISS L2 indexes return squared distances
+    distances = np.sqrt(np.maximum(distances, 0))
+
+    for word, row, dists in zip(to_search, result, distances):
+        # approximate indexes pad with -1 when fewer than k + 1 are found
+        closest[word] = [(ids[i], round(float(dist), 3)) for i, dist in zip(row, dists) if i != -1]
+
     return closest
+
+
+def find_k_closest_batch(index, embeddings : Embeddings, ids : list[str], words : list[str],
+                         k : int) -> dict[str : list[str]]:
+    """
+    Given a list of words and value k, finds the k closest neighbours of every
+    word with a single (multi-threaded) FAISS search.
+
+    RETURNS : dictionary of word -> list of neighbours; words without a GloVe
+    vector map to an empty list.
+    """
+    results = search_batch(index, embeddings, ids, words, k)
+
+    return {word : [pair[0] for pair in closest] for word, closest in results.items()}
+
+
+def find_k_closest(index, embeddings : Embeddings, ids : list[str], word : str, k : int) -> list:
+    """
+    Given a word and value k, returns the k closest neighbours to the word
+    based on GloVe embeddings.
+    """
+    return find_k_closest_batch(index, embeddings, ids, [word], k)[word]
         
 
 def get_score(a, b) -> float:
@@ -132,64 +769,174 @@ def get_score(a, b) -> float:
     return round(dist, 3)
 
 
-def word_search(glove_data : tuple, ngsl : list[str], original : Word) -> tuple[list[Word]]:
+def get_scores(embeddings : Embeddings, original : str, alts : list[str]) -> list[float]:
+    """
+    Vectorised get_score : calculates the distance between the original word
+    and every alternative with one numpy operation over the stacked vectors.
+
+    RETURNS : list of distances (rounded to three d.p.) in the same order as
+    alts; -1 for any word without a GloVe vector.
+    """
+    scores : list[float] = [-1] * len(alts)
+
+    if (original not in embeddings):
+        return scores
+
+    known : list[int] = [i for i in range(len(alts)) if alts[i] in embeddings]
+    if (len(known) == 0):
+        return scores
+
+    # float64 to match the precision of scipy's euclidean distance
+    candidates = embeddings.get_vectors([alts[i] for i in known]).astype("float64")
+    dists = np.linalg.norm(candidates - np.asarray(embeddings[original], "float64"), axis = 1)
+
+    for i, dist in zip(known, dists):
+        scores[i] = round(float(dist), 3)
+
+    return scores
+
+
+def word_search(glove_data : tuple, ngsl : list[str], original : Word,
+                neighbours : list[tuple[str, float]] = None, table = None) -> tuple[list[Word]]:
     """
     [FIRST SEARCH] Using GloVe, do an initial search for alternatives for a
     given word; returns a list of suggested alternatives simpler than the
     original.
 
-    - glove_data : tuple containing FAISS index, word embeddings and IDs
+    - glove_data : tuple containing FAISS index, word embeddings and words by ID
     - ngsl : list of words in NGSL
     - original : tuple containing original word (token[0]) and type (token[1])
+    - neighbours : (neighbour, distance) pairs already found by search_batch
+      (optional)
+    - table : lexical FeatureTable to filter with (optional, see features.py)
 
-    RETURNS : list of simpler alternatives for original.
+    RETURNS : list of simpler alternatives for original, with GloVe scores
+    set from the search distances (or, if the index only estimates them, from
+    the stored vectors).
     """
     index = glove_data[0]
     embeddings = glove_data[1]
     ids = glove_data[2]
-    k : int = 50
 
-    neighbours : list[str] = find_k_closest(index, embeddings, ids, original.word, k)
+    if (neighbours is None):
+        neighbours = search_batch(index, embeddings, ids, [original.word], K_FIRST)[original.word]
 
     # Filter the neighbours found:
-    filtered : tuple[list[Word]] = filters.sort_suggestions(neighbours, ngsl, original)
+    words : list[str] = [pair[0] for pair in neighbours]
+    filtered : tuple[list[Word]] = filters.sort_suggestions(words, ngsl, original, table)
+
+    # Reuse FAISS distances as GloVe scores; cased neighbours are left for
+    # add_scores since Word stores (and is scored by) the lowercase form
+    distances : dict[str : float] = dict(neighbours)
+    scored : list[Word] = [alt for alt in filtered[0] if alt.word in distances]
+
+    if (not exact_distances(index)):
+        alts : list[str] = [alt.word for alt in scored]
+        distances = dict(zip(alts, get_scores(embeddings, original.word, alts)))
+
+    for alt in scored:
+        alt.set_g_score(distances[alt.word])
 
     return filtered
 
 
 def list_search(glove_data : tuple, ngsl : list[str], current : list[Word], 
-                original : Word):
+                original : Word, table = None, depth : int = EXPAND_DEPTH,
+                beam : int = BEAM_WIDTH, max_distance : float = MAX_DISTANCE) -> list[Word]:
     """
     [SECOND SEARCH] Given a list of words from a first search, finds further
-    alternatives by branching off from initial suggestions given.
+    alternatives by branching off from initial suggestions given. Each hop
+    searches the neighbours of the whole frontier at once, and only the beam
+    closest new alternatives are branched off from in the next hop.
 
-    - glove_data : tuple containing FAISS index, word embeddings and IDs
+    - glove_data : tuple containing FAISS index, word embeddings and words by ID
     - ngsl : list of words in NGSL
     - original : tuple containing original word (token[0]) and type (token[1])
     - current : list of current alternatives suggested
+    - table : lexical FeatureTable to filter with (optional, see features.py)
+    - depth : number of hops to branch off for
+    - beam : number of new alternatives branched off from per hop (0 = all);
+      every alternative found is still returned
+    - max_distance : neighbours further than this from the word they were found
+      from are ignored (None = no limit)
+
+    RETURNS : list of additional simpler alternatives, in the order found
+    """
+    return list_search_batch(glove_data, ngsl, [(current, original)], table, depth, beam,
+                             max_distance)[0]
+
+
+def list_search_batch(glove_data : tuple, ngsl : list[str], searches : list[tuple[list[Word], Word]],
+                      table = None, depth : int = EXPAND_DEPTH, beam : int = BEAM_WIDTH,
+                      max_distance : float = MAX_DISTANCE) -> list[list[Word]]:
+    """
+    [SECOND SEARCH] list_search for several words at once : each hop searches
+    the frontiers of every word with one batched FAISS search (each word's
+    frontier, filtering and beam are still its own).
+
+    - searches : (current alternatives, original) of each word
 
-    RETURNS : list of additional simpler alternatives
+    RETURNS : list of additional simpler alternatives of each word, as
+    list_search
     """
     index = glove_data[0]
-    embeddings : dict = glove_data[1]
-    ids : dict = glove_data[2]
+    embeddings : Embeddings = glove_data[1]
+    ids : list[str] = glove_data[2]
 
-    new : list[Word] = []
+    new : list[list[Word]] = [[] for search in searches]
+    seen : list[set[str]] = [set(word.word for word in current)     # alternatives so far
+                             for current, original in searches]
+    checked : list[set[str]] = [set() for search in searches]       # neighbours filtered so far
 
-    for word in current:
-        k : int = 25
+    frontiers : list[list[str]] = [[word.word for word in current] for current, original in searches]
 
-        neighbours : list[str] = find_k_closest(index, embeddings, ids, word.word, k)
-        filtered : list[Word] = filters.sort_suggestions(neighbours, ngsl, original)
+    for hop in range(depth):
+        to_search : list[str] = list(dict.fromkeys(word for frontier in frontiers for word in frontier))
+        if (len(to_search) == 0):
+            break
 
-        old_suggestions = [word.word for word in current]
-        new_suggestions = [word.word for word in new]
+        closest = search_batch(index, embeddings, ids, to_search, K_SECOND)
+
+        for i, (current, original) in enumerate(searches):
+            if (len(frontiers[i]) == 0):
+                continue
+
+            # Unchecked neighbours of the whole frontier (in order), with the
+            # distance to the closest frontier word that found them
+            to_check : dict[str : float] = {}
+            for word in frontiers[i]:
+                for neighbour, distance in closest[word]:
+                    if (neighbour in checked[i] or
+                        (max_distance is not None and distance > max_distance)):
+                        continue
+
+                    to_check[neighbour] = min(distance, to_check.get(neighbour, distance))
+
+            checked[i].update(to_check.keys())
+            filtered : tuple[list[Word]] = filters.sort_suggestions(list(to_check.keys()), ngsl,
+                                                                    original, table)
+
+            # Word stores the lowercase form of the neighbour
+            distances : dict[str : float] = {}
+            for neighbour, distance in to_check.items():
+                key : str = neighbour.lower()
+                distances[key] = min(distance, distances.get(key, distance))
+
+            found : list[Word] = []
+            for valid in filtered[0]:
+                if (valid.word not in seen[i]):
+                    seen[i].add(valid.word)
+                    found.append(valid)
+
+            new[i] += found
+
+            # Branch off from the closest new alternatives only
+            frontier : list[str] = [valid.word for valid in found]
+            if (beam > 0 and len(frontier) > beam):
+                frontier.sort(key = lambda word : distances[word])
+                frontier = frontier[:beam]
+            frontiers[i] = frontier
 
-        for valid in filtered[0]:
-            # Only add to suggestions IFF it
-            if (valid.word not in old_suggestions and valid.word not in new_suggestions):
-                new.append(valid)
-    
     return new
 
 def search(glove_data : tuple) :
@@ -198,27 +945,68 @@ def search(glove_data : tuple) :
     ids = glove_data[2]
 
     freq : dict = filters.get_freq()
-    print("TO QUIT ENTER Q")
+    print("TO QUIT ENTER Q (separate several words with commas or spaces)")
     while (True):
-        to_check : str = input("WORD: ").strip().lower()
-        if (to_check == "q"):
+        to_check : list[str] = input("WORD(S): ").replace(",", " ").lower().split()
+        if (to_check == ["q"]):
             break
+        elif (len(to_check) == 0):
+            continue
         else:
             to_get : int = int(input("NO. OF TERMS TO GET: ").strip().lower())
 
-            if (to_check in freq.keys()):
-                print("This word is COMMON as per the NGSL.")
-            else:
-                print("This word is UNCOMMON as per the NGSL")
-            
-            print(f"Finding {to_get} closest terms to {to_check}...")
-            closest = find_k_closest(index, embeddings, ids, to_check, to_get)
+            # One batched search for every word entered
+            results = find_k_closest_batch(index, embeddings, ids, to_check, to_get)
+
+            for word, closest in results.items():
+                if (word in freq.keys()):
+                    print(f"{word.upper()} is COMMON as per the NGSL.")
+                else:
+                    print(f"{word.upper()} is UNCOMMON as per the NGSL")
+
+                print(f"Closest {to_get} terms to {word}...")
+                for val in closest:
+                    dist = get_score(embeddings[word], embeddings[val])
+                    print(f"> {val.upper()} || {dist}")
+
+
+def get_option(args : list[str], name : str, default : str, choices : list[str]) -> str:
+    """
+    Removes an option given as '--name value' or '--name=value' from the
+    command line arguments.
+
+    RETURNS : its value (upper case), the default if it isn't given
+    """
+    value : str = default
+
+    for i, arg in enumerate(args):
+        if (arg.lower() == name and i + 1 < len(args)):
+            value = args.pop(i + 1)
+            args.pop(i)
+            break
+        if (arg.lower().startswith(f"{name}=")):
+            value = args.pop(i).split("=", 1)[1]
+            break
+
+    if (value.upper() not in choices):
+        raise ValueError(f"Unknown {name} '{value}', expected one of {choices}")
 
-            for val in closest:
-                dist = get_score(embeddings[to_check], embeddings[val])
-                print(f"> {val.upper()} || {dist}")
+    return value.upper()
 
 
+# python3 glove.py [convert] [--index flat/ivf/hnsw/ivfpq/sq8/sq16/pq]
+#                  [--storage float32/float16/sq8]
 if __name__ == "__main__":
-    glove_data : tuple = get_faiss_vectors(GLOVE_VECTORS)
-    search(glove_data)
+    args : list[str] = sys.argv[1:]
+    # sq8 is both an index and a storage type, hence the separate options
+    index_type : str = get_option(args, "--index", INDEX_TYPE, INDEX_TYPES)
+    storage : str = get_option(args, "--storage", STORAGE, STORAGE_TYPES)
+
+    if (len(args) > 0 and args[0].lower() == "convert"):
+        convert_vectors(GLOVE_VECTORS)
+        # Build + save the requested approximate index / storage straight away
+        if (index_type != "FLAT" or storage != "FLOAT32"):
+            get_faiss_vectors(GLOVE_VECTORS, index_type, storage = storage)
+    else:
+        glove_data : tuple = get_faiss_vectors(GLOVE_VECTORS, index_type, storage = storage)
+        search(glove_data)
@@ -0,0 +1,308 @@
+import numpy as np
+import json
+import os
+
+# Order of the POS tags in the tag bitmask / synonym adjacency arrays
+TAG_ORDER : list[str] = ["NOUN", "VERB", "ADJ", "ADV", "X"]
+
+# WordNet POS of morphy (satellite adjectives are adjectives), with the name of
+# their exception list in the corpus (e.g. noun.exc)
+POS_ORDER : list[str] = ["n", "v", "a", "r"]
+EXCEPTION_FILES : dict[str : str] = {"n" : "noun", "v" : "verb", "a" : "adj", "r" : "adv"}
+
+# WordNet's morphy suffix rules : (inflected ending, base ending)
+SUBSTITUTIONS : dict[str : list[tuple[str, str]]] = {
+    "n" : [("s", ""), ("ses", "s"), ("ves", "f"), ("xes", "x"), ("zes", "z"), ("ches", "ch"),
+           ("shes", "sh"), ("men", "man"), ("ies", "y")],
+    "v" : [("s", ""), ("ies", "y"), ("es", "e"), ("es", ""), ("ed", "e"), ("ed", ""),
+           ("ing", "e"), ("ing", "")],
+    "a" : [("er", ""), ("est", ""), ("er", "e"), ("est", "e")],
+    "r" : []
+}
+
+class Lexicon:
+    """
+    WordNet compiled into flat arrays: every lemma (lowercase) has an id, a POS
+    tag bitmask, a lexname bitmask and, per POS tag, a list of synonym ids
+    stored as adjacency arrays (indptr / indices, as in a CSR matrix). Also
+    holds WordNet's morphy exception lists, so base forms are found without
+    the corpus (see morphy).
+    """
+    lemmas : list[str]              # lemma id -> lowercase lemma
+    ids : dict[str : int]           # lowercase lemma -> lemma id
+    tags : np.ndarray               # lemma id -> bitmask of TAG_ORDER
+    lexnames : np.ndarray           # lemma id -> bitmask of lexname_list
+    lexname_list : list[str]
+    names : list[str]               # synonym id -> lemma name as in WordNet
+    name_keys : np.ndarray          # synonym id -> lemma id of its lowercase form
+    synonyms : dict[str : tuple]    # tag -> (indptr by lemma id, synonym ids)
+    lemma_pos : np.ndarray          # lemma id -> bitmask of POS_ORDER it is a lemma of
+    exceptions : dict[str : dict]   # WordNet POS -> inflected form -> base forms
+    source : dict                   # corpus the lexicon was compiled from (see save_lexicon)
+
+    def __init__(self, lemmas : list[str], names : list[str], lexname_list : list[str],
+                 arrays : dict[str : np.ndarray], exceptions : dict[str : dict] = None,
+                 source : dict = None):
+        self.lemmas = lemmas
+        self.ids = {lemma : i for i, lemma in enumerate(lemmas)}
+        self.names = names
+        self.lexname_list = lexname_list
+        self.tags = arrays["tags"]
+        self.lexnames = arrays["lexnames"]
+        self.name_keys = arrays["name_keys"]
+        self.synonyms = {tag : (arrays[f"{tag}_indptr"], arrays[f"{tag}_indices"])
+                         for tag in TAG_ORDER}
+        # lexicons saved before lemma_pos : the tags of its synsets (same order)
+        self.lemma_pos = arrays.get("lemma_pos", self.tags & 0b1111)
+        self.exceptions = exceptions if (exceptions is not None) else {pos : {} for pos in POS_ORDER}
+        self.source = source
+
+    # SETTERS & GETTERS
+    def get_id(self, lemma : str) -> int:
+        """
+        Returns the id of a lemma (case-insensitive); -1 if not in WordNet.
+        """
+        return self.ids.get(lemma.lower(), -1)
+
+    def get_tags(self, id : int) -> list[str]:
+        mask : int = int(self.tags[id])
+
+        return [tag for i, tag in enumerate(TAG_ORDER) if (mask >> i) & 1]
+
+    def get_lexnames(self, id : int) -> list[str]:
+        mask : int = int(self.lexnames[id])
+
+        return [name for i, name in enumerate(self.lexname_list) if (mask >> i) & 1]
+
+    def get_synonym_ids(self, id : int, tag : str) -> np.ndarray:
+        indptr, indices = self.synonyms[tag]
+
+        return indices[indptr[id] : indptr[id + 1]]
+
+    def get_synonyms(self, id : int, tag : str) -> list[str]:
+        """
+        Returns every lemma name sharing a synset of the given POS tag with the
+        lemma, in WordNet's synset order (including the lemma itself).
+        """
+        return [self.names[i] for i in self.get_synonym_ids(id, tag)]
+
+    def morphy(self, form : str, pos : str) -> list[str]:
+        """
+        WordNet's morphy : every base form of a (lowercase) word for the given
+        WordNet POS (n / v / a / r) - from the exception list if the word is in
+        it, otherwise by the suffix rules - that is a lemma of that POS. The
+        word itself counts if it is one. Same as the corpus' _morphy, which
+        wordnet.synsets() uses (morphy() only returns the first).
+        """
+        forms : list[str] = [form]
+
+        if (form in self.exceptions[pos]):
+            forms += self.exceptions[pos][form]
+        else:
+            forms += [form[:-len(old)] + new for old, new in SUBSTITUTIONS[pos] if form.endswith(old)]
+
+        found : list[str] = []
+        for candidate in forms:
+            id : int = self.get_id(candidate)
+
+            if (id != -1 and (int(self.lemma_pos[id]) >> POS_ORDER.index(pos)) & 1
+                and candidate not in found):
+                found.append(candidate)
+
+        return found
+
+    def expand(self, ids : list[int], tag : str, depth : int = 1,
+               exclude : list[int] = []) -> list[str]:
+        """
+        Multi-hop synonym expansion as an array walk: each hop gathers the
+        synonyms of the whole frontier at once and keeps the ones whose
+        (lowercase) lemma hasn't been seen yet.
+
+        - ids : lemma ids to start from
+        - exclude : lemma ids never to return
+
+        RETURNS : list of new lemma names, in the order they were reached.
+        """
+        indptr, indices = self.synonyms[tag]
+        seen = np.zeros(len(self.lemmas), "bool")
+        seen[np.array(exclude, "int64")] = True
+
+        frontier = np.array(ids, "int64")
+        found : list[int] = []
+
+        for hop in range(depth):
+            if (len(frontier) == 0):
+                break
+
+            parts = [indices[indptr[i] : indptr[i + 1]] for i in frontier]
+            reached = np.concatenate(parts) if (len(parts) > 0) else np.array([], "int64")
+
+            # keep first occurrence of each unseen lemma, in order reached
+            keys = self.name_keys[reached]
+            unique, first = np.unique(keys, return_index = True)
+            first = np.sort(first[~seen[unique]])
+
+            new = reached[first]
+            seen[self.name_keys[new]] = True
+            found += new.tolist()
+
+            frontier = self.name_keys[new]
+
+        return [self.names[i] for i in found]
+
+    def __contains__(self, lemma : str) -> bool:
+        return lemma.lower() in self.ids
+
+    def __len__(self) -> int:
+        return len(self.lemmas)
+
+
+def join_strings(strings : list[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(strings).encode("utf-8"), "uint8")
+
+
+def split_strings(blob : np.ndarray) -> list[str]:
+    if (len(blob) == 0):
+        return []
+
+    return blob.tobytes().decode("utf-8").split("\n")
+
+
+def build_lexicon(corpus, tags : dict[str : str]) -> Lexicon:
+    """
+    Compiles the lexicon from the NLTK WordNet corpus. Each lemma gets the
+    synsets wordnet.synsets(lemma) returns, so lookups give the same answers
+    as the corpus.
+
+    - corpus : nltk.corpus.wordnet
+    - tags : WordNet POS -> Spacy POS tag mapping (see wordnet.TAGS)
+    """
+    print("> Compiling WordNet lexicon")
+
+    lemmas : list[str] = sorted(set(lemma.lower() for lemma in corpus.all_lemma_names()))
+    ids : dict[str : int] = {lemma : i for i, lemma in enumerate(lemmas)}
+
+    names : list[str] = []
+    name_ids : dict[str : int] = {}
+    lexname_list : list[str] = []
+    lexname_ids : dict[str : int] = {}
+
+    tag_masks = np.zeros(len(lemmas), "uint8")
+    pos_masks = np.zeros(len(lemmas), "uint8")
+    lexname_masks = np.zeros(len(lemmas), "uint64")
+    adjacency : dict[str : list[list[int]]] = {tag : [] for tag in TAG_ORDER}
+
+    for lemma in lemmas:
+        i : int = ids[lemma]
+        lists : dict[str : list[int]] = {tag : [] for tag in TAG_ORDER}
+        added : dict[str : set[int]] = {tag : set() for tag in TAG_ORDER}
+
+        for synset in corpus.synsets(lemma):
+            tag : str = tags.get(synset.pos(), "X")
+            tag_masks[i] |= (1 << TAG_ORDER.index(tag))
+
+            lexname : str = synset.lexname()
+            if (lexname not in lexname_ids):
+                lexname_ids[lexname] = len(lexname_list)
+                lexname_list.append(lexname)
+            lexname_masks[i] |= np.uint64(1 << lexname_ids[lexname])
+
+            for name in synset.lemma_names():
+                # safety measure: every name should lowercase to a lemma
+                if (name.lower() not in ids):
+                    continue
+
+                pos : str = "a" if (synset.pos() == "s") else synset.pos()
+                if (pos in POS_ORDER):
+                    pos_masks[ids[name.lower()]] |= (1 << POS_ORDER.index(pos))
+
+                if (name not in name_ids):
+                    name_ids[name] = len(names)
+                    names.append(name)
+
+                name_id : int = name_ids[name]
+                if (name_id not in added[tag]):
+                    added[tag].add(name_id)
+                    lists[tag].append(name_id)
+
+        for tag in TAG_ORDER:
+            adjacency[tag].append(lists[tag])
+
+    name_keys = np.array([ids[name.lower()] for name in names], "int64")
+
+    arrays : dict[str : np.ndarray] = {
+        "tags" : tag_masks,
+        "lexnames" : lexname_masks,
+        "name_keys" : name_keys,
+        "lemma_pos" : pos_masks
+    }
+
+    for tag in TAG_ORDER:
+        lengths = np.array([len(neighbours) for neighbours in adjacency[tag]], "int64")
+        arrays[f"{tag}_indptr"] = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+        arrays[f"{tag}_indices"] = np.array([n for neighbours in adjacency[tag] for n in neighbours], "int32")
+
+    # Exception lists of morphy (lines of 'inflected base [base ...]')
+    exceptions : dict[str : dict[str : list[str]]] = {pos : {} for pos in POS_ORDER}
+    for pos, name in EXCEPTION_FILES.items():
+        for line in corpus.open(f"{name}.exc"):
+            terms : list[str] = line.split()
+            if (len(terms) > 1):
+                exceptions[pos][terms[0]] = terms[1:]
+
+    print(f"> WordNet lexicon compiled ({len(lemmas)} lemmas)")
+
+    return Lexicon(lemmas, names, lexname_list, arrays, exceptions)
+
+
+def save_lexicon(lexicon : Lexicon, filepath : str, source : dict = None):
+    """
+    Saves the lexicon, stamped with the corpus it was compiled from (source,
+    e.g. the path and modification time of the corpus; see load_lexicon).
+    """
+    arrays : dict[str : np.ndarray] = {
+        "lemmas" : join_strings(lexicon.lemmas),
+        "names" : join_strings(lexicon.names),
+        "lexname_list" : join_strings(lexicon.lexname_list),
+        "tags" : lexicon.tags,
+        "lexnames" : lexicon.lexnames,
+        "name_keys" : lexicon.name_keys,
+        "lemma_pos" : lexicon.lemma_pos,
+        "source" : join_strings([json.dumps(source, sort_keys = True)])
+    }
+
+    for pos in POS_ORDER:
+        arrays[f"{pos}_exceptions"] = join_strings([" ".join([form] + bases) for form, bases
+                                                    in lexicon.exceptions[pos].items()])
+
+    for tag in TAG_ORDER:
+        arrays[f"{tag}_indptr"], arrays[f"{tag}_indices"] = lexicon.synonyms[tag]
+
+    # Written to a temporary file first, so a partial lexicon is never loaded
+    temp : str = f"{filepath}.{os.getpid()}.tmp"
+    with open(temp, "wb") as data:
+        np.savez_compressed(data, **arrays)
+    os.replace(temp, filepath)
+
+    print(f"> WordNet lexicon saved to {filepath}")
+
+
+def load_lexicon(filepath : str) -> Lexicon:
+    """
+    Loads a saved lexicon; its source is None if it wasn't stamped.
+    """
+    with np.load(filepath) as data:
+        arrays : dict[str : np.ndarray] = {name : data[name] for name in data.files}
+
+    exceptions : dict[str : dict[str : list[str]]] = {pos : {} for pos in POS_ORDER}
+    for pos in POS_ORDER:
+        for line in split_strings(arrays.pop(f"{pos}_exceptions", np.array([], "uint8"))):
+            terms : list[str] = line.split()
+            exceptions[pos][terms[0]] = terms[1:]
+
+    source : dict = None
+    if ("source" in arrays):
+        source = json.loads(split_strings(arrays.pop("source"))[0])
+
+    return Lexicon(split_strings(arrays.pop("lemmas")), split_strings(arrays.pop("names")),
+                   split_strings(arrays.pop("lexname_list")), arrays, exceptions, source)
@@ -0,0 +1,125 @@
+import numpy as np
+import asyncio
+import datetime
+import json
+import sys
+import time
+
+import find_suggestions
+import server
+
+# FILEPATH VARIABLES FOR EASE:
+SAMPLES : str = "./datafiles/all_samples.csv"
+
+REQUESTS : int = 500        # requests sent in total
+CONCURRENCY : int = 16      # connections sending requests at once
+SENTENCES : int = 1         # sentences per request
+
+async def post(reader : asyncio.StreamReader, writer : asyncio.StreamWriter, host : str,
+               sentences : list[str]) -> dict:
+    """
+    Sends one /simplify request on an open (keep-alive) connection.
+
+    RETURNS : the decoded response
+    """
+    body : bytes = json.dumps({"sentences" : sentences}).encode("utf-8")
+    writer.write(f"POST /simplify HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+    status : str = (await reader.readline()).decode("latin-1")
+    headers : dict[str : str] = {}
+
+    while (True):
+        header : str = (await reader.readline()).decode("latin-1").strip()
+        if (header == ""):
+            break
+
+        name, value = header.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+
+    data : dict = json.loads(await reader.readexactly(int(headers["content-length"])))
+
+    if (" 200 " not in status):
+        raise RuntimeError(f"{status.strip()} : {data.get('error')}")
+
+    return data
+
+
+async def client(host : str, port : int, queries : asyncio.Queue, latencies : list[float]):
+    """
+    Sends queued requests one after another over a single connection, timing
+    each.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        while (not queries.empty()):
+            sentences : list[str] = queries.get_nowait()
+            start : float = time.perf_counter()
+
+            await post(reader, writer, host, sentences)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def load_test(sentences : list[str], host : str = server.HOST, port : int = server.PORT,
+                    requests : int = REQUESTS, concurrency : int = CONCURRENCY,
+                    per_request : int = SENTENCES) -> dict:
+    """
+    Sends requests of per_request sample sentences (cycling through the
+    samples) from concurrency connections at once.
+
+    RETURNS : latencies (p50 / p99 / mean / max, in ms) and throughput
+    """
+    queries : asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        start : int = (i * per_request) % len(sentences)
+        queries.put_nowait([sentences[(start + j) % len(sentences)] for j in range(per_request)])
+
+    latencies : list[float] = []
+    print(f"> Sending {requests} requests of {per_request} sentences from {concurrency} connections")
+
+    start : float = time.perf_counter()
+    await asyncio.gather(*[client(host, port, queries, latencies) for i in range(concurrency)])
+    elapsed : float = time.perf_counter() - start
+
+    times = np.array(latencies) * 1000
+
+    return {"REQUESTS" : len(latencies), "CONCURRENCY" : concurrency, "SENTENCES" : per_request,
+            "P50" : float(np.percentile(times, 50)), "P99" : float(np.percentile(times, 99)),
+            "MEAN" : float(times.mean()), "MAX" : float(times.max()),
+            "REQUESTS / S" : len(latencies) / elapsed,
+            "SENTENCES / S" : len(latencies) * per_request / elapsed}
+
+
+def record_load_test(result : dict, host : str, port : int):
+    timestamp = datetime.datetime.now()
+
+    with open(f"./output/LOAD-TEST-{timestamp}.txt", "a") as log:
+        log.write(f"TIMESTAMP : {timestamp}\n")
+        log.write(f"SERVER : http://{host}:{port}\n")
+
+        for name, value in result.items():
+            unit : str = " ms" if (name in ["P50", "P99", "MEAN", "MAX"]) else ""
+            line : str = f"{name:<16}{value:>12.1f}{unit}" if (type(value) == float) else f"{name:<16}{value:>12}"
+            print(line)
+            log.write(f"{line}\n")
+
+
+# python3 load_test.py [--port N] [--requests N] [--concurrency N] [--sentences N]
+# (start the server first : python3 server.py ...)
+if __name__ == "__main__":
+    args, options = find_suggestions.parse_options(sys.argv[1:])
+    port : int = int(options.get("--port", server.PORT))
+
+    sentences : list[str] = [sentence for sentence in find_suggestions.get_samples(SAMPLES)
+                             if sentence != ""]
+
+    result : dict = asyncio.run(load_test(sentences, server.HOST, port,
+                                          int(options.get("--requests", REQUESTS)),
+                                          int(options.get("--concurrency", CONCURRENCY)),
+                                          int(options.get("--sentences", SENTENCES))))
+    record_load_test(result, server.HOST, port)
@@ -0,0 +1,287 @@
+import datetime
+import sys
+
+from word import Word
+import cache
+import features
+import filters
+import find_suggestions
+import glove
+import metrics
+import models
+
+# FILEPATH VARIABLES FOR EASE:
+GLOVE_VECTORS : str = find_suggestions.GLOVE_VECTORS
+SAMPLES : str = find_suggestions.SAMPLES
+
+# Combinations run by default : every search (search_1-search_2) sorted by
+# every method
+SEARCHES : list[str] = ["GLOVE-GLOVE", "WORDNET-NONE", "MODERNBERT-NONE"]
+SORTS : list[str] = ["GLOVE", "BERT"]
+
+K : int = 15    # suggestions recorded per word (as find_suggestions.py)
+
+def plan_candidates(glove_data : tuple, ngsl : list[str], parsed : list[tuple],
+                    searches : list[tuple[str, str]],
+                    stores : list[cache.CandidateCache] = []) -> tuple[dict, dict]:
+    """
+    [PLANNING PASS] Runs the batched GloVe neighbour search / BERT fill-mask
+    once for every first search method, however many searches share it. A
+    word is only left out of the GloVe search if every search starting with
+    GloVe has it in one of the stores.
+
+    RETURNS : GloVe neighbours and BERT suggestions of each first search
+    method (see find_suggestions.plan_search)
+    """
+    neighbours : dict[str : dict] = {}
+    fills : dict[str : dict] = {}
+
+    for search_1 in dict.fromkeys(search_1 for search_1, search_2 in searches):
+        if (search_1 == "GLOVE"):
+            cached : set[tuple[str, str]] = None
+
+            for key in [find_suggestions.cache_key(search_1, search_2)
+                        for first, search_2 in searches if first == search_1]:
+                found : set[tuple[str, str]] = set()
+                for store in stores:
+                    found |= {(original.word, original.type) for sentence, words, formatted in parsed
+                              for original in words
+                              if store.contains(key[0], original.word, original.type, key[1])}
+
+                cached = found if (cached is None) else (cached & found)
+
+            with metrics.stage("plan.glove", len(parsed)):
+                neighbours[search_1] = find_suggestions.plan_glove_search(glove_data, ngsl, parsed,
+                                                                          cached)
+
+        if (search_1 == "MODERNBERT" or search_1 == "BIOBERT"):
+            with metrics.stage("plan.bert", len(parsed)):
+                fills[search_1] = find_suggestions.plan_bert_search(
+                    ngsl, parsed, find_suggestions.search_model(search_1))
+
+    return (neighbours, fills)
+
+
+def get_pool(results : dict[tuple : dict]) -> tuple[dict, int]:
+    """
+    Merges the alternatives every search found into one pool : for each
+    sentence and complex word, one Word per distinct alternative.
+
+    RETURNS : pool (in the format of find_suggestions, so it can be scored by
+    add_scores), and the number of alternatives of all searches
+    """
+    pool : dict[str : tuple[dict]] = {}
+    total : int = 0
+
+    for suggestions in results.values():
+        for sentence, (valid_alts, invalid_alts) in suggestions.items():
+            pooled : dict[Word : list[Word]] = pool.setdefault(sentence, ({}, {}))[0]
+
+            for original, alts in valid_alts.items():
+                # Words w/o alternatives have a str indicating why - skip
+                if (len(alts) == 0 or type(alts[0]) != Word):
+                    continue
+
+                total += len(alts)
+                seen : set[str] = {alt.word for alt in pooled.setdefault(original, [])}
+                for alt in alts:
+                    if (alt.word not in seen):
+                        pooled[original].append(alt)
+                        seen.add(alt.word)
+
+    return (pool, total)
+
+
+def share_scores(results : dict[tuple : dict], pool : dict[str : tuple[dict]]):
+    """
+    Copies the scores of the pooled alternatives to the same alternatives of
+    every search (bar scores an alternative already had).
+    """
+    for suggestions in results.values():
+        for sentence, (valid_alts, invalid_alts) in suggestions.items():
+            for original, alts in valid_alts.items():
+                if (len(alts) == 0 or type(alts[0]) != Word):
+                    continue
+
+                scored : dict[str : Word] = {alt.word : alt for alt in pool[sentence][0][original]}
+                for alt in alts:
+                    if (alt.get_g_score() == 99):
+                        alt.set_g_score(scored[alt.word].get_g_score())
+                    if (alt.get_b_score() == -1):
+                        alt.set_b_score(scored[alt.word].get_b_score())
+                    if (alt.get_m_score() is None):
+                        alt.set_m_score(scored[alt.word].get_m_score())
+
+
+def summarise(suggestions : dict[str : tuple[dict]]) -> tuple[int, int, int]:
+    """
+    Counts what a search found; the results aren't annotated (yet), so unlike
+    analysis.overall_stats this says nothing about how good the alternatives are.
+
+    RETURNS : number of complex words identified, number of them with
+    alternatives, and number of alternatives found for them in total
+    """
+    identified : int = 0
+    suggested : int = 0
+    alternatives : int = 0
+
+    for sentence, (valid_alts, invalid_alts) in suggestions.items():
+        for original, alts in valid_alts.items():
+            identified += 1
+
+            # Words w/o alternatives have a str indicating why
+            if (len(alts) > 0 and type(alts[0]) == Word):
+                suggested += 1
+                alternatives += len(alts)
+
+    return (identified, suggested, alternatives)
+
+
+def record_summary(summaries : dict[str : tuple[int, int, int]], timestamp) -> str:
+    """
+    Writes the counts of every combination (see summarise) to
+    ./output/MATRIX-{timestamp}.txt.
+
+    RETURNS : filepath of the summary
+    """
+    path : str = f"./output/MATRIX-{timestamp}.txt"
+
+    with open(path, "w") as log:
+        log.write(f"TIMESTAMP : {timestamp}\n")
+        log.write(f"{'COMBINATION':<36}{'IDENTIFIED':>12}{'SUGGESTED':>12}{'PER WORD':>12}\n")
+
+        for combination, (identified, suggested, alternatives) in summaries.items():
+            per_word : float = alternatives / suggested if (suggested > 0) else 0
+            line = f"{combination:<36}{identified:>12}{suggested:>12}{per_word:>12.1f}"
+            print(line)
+            log.write(f"{line}\n")
+
+    return path
+
+
+def run_matrix(glove_data : tuple, ngsl : list[str], sentences : list[str],
+               searches : list[tuple[str, str]], sorts : list[str], timestamp, k : int = K,
+               table = None, candidates : cache.CandidateCache = None,
+               precomputed : cache.CandidateCache = None) -> list[str]:
+    """
+    Runs every search sorted by every method in one pass : the corpus is parsed
+    once, the candidates of each search are generated once (sharing the
+    neighbour search / fill-mask of searches with the same first method), and
+    the union of all candidates is scored once - so the cost grows with the
+    number of distinct candidates rather than of combinations. Each combination
+    is then sorted and recorded (as record_results), and what each found is
+    summarised in ./output/MATRIX-{timestamp}.txt (see summarise).
+
+    - candidates, precomputed : see find_suggestions.find_suggestions
+
+    RETURNS : root of the results files of each combination
+    """
+    print(f"> Running {len(searches) * len(sorts)} combinations "
+          f"({', '.join(f'{s_1}-{s_2}' for s_1, s_2 in searches)} sorted by {', '.join(sorts)})")
+
+    parsed : list[tuple] = list(metrics.timed_iter("spacy.parse", filters.parse_sentences(sentences)))
+    neighbours, fills = plan_candidates(glove_data, ngsl, parsed, searches,
+                                        [store for store in [precomputed, candidates]
+                                         if store is not None])
+
+    results : dict[tuple : dict] = {}
+    for search_1, search_2 in searches:
+        print(f"> Suggestions will be found using {search_1}-{search_2}")
+        use_stores : bool = (find_suggestions.cache_key(search_1, search_2) is not None)
+        stores : list[cache.CandidateCache] = [store for store in [precomputed, candidates]
+                                               if store is not None and use_stores]
+
+        results[(search_1, search_2)] = find_suggestions.search_sentences(
+            glove_data, ngsl, parsed, search_1, search_2, table,
+            candidates if (use_stores) else None, stores, neighbours.get(search_1, {}),
+            fills.get(search_1, {}), 1, len(parsed))
+
+    if (candidates is not None):
+        candidates.commit()
+
+    # SCORE THE UNION : GloVe + BERTScore (needed for GloVe / BERT sorts), MLM
+    pool, total = get_pool(results)
+    unique : int = sum(len(alts) for valid_alts, invalid_alts in pool.values()
+                       for alts in valid_alts.values())
+    metrics.count("matrix.candidates", total)
+    metrics.count("matrix.unique", unique)
+    print(f"> Scoring {unique} distinct alternatives ({total} over all searches)")
+
+    for sort_by in dict.fromkeys("MLM" if (sort_by == "MLM") else "BERT" for sort_by in sorts):
+        find_suggestions.add_scores(pool, glove_data[1], sort_by)
+    share_scores(results, pool)
+
+    # RECORD EVERY COMBINATION
+    roots : list[str] = []
+    summaries : dict[str : tuple[int, int, int]] = {}
+    for (search_1, search_2), suggestions in results.items():
+        for sort_by in sorts:
+            # sort copies of the lists, so ties keep the order the search found them in
+            ranked : dict[str : tuple[dict]] = {}
+            for sentence, (valid_alts, invalid_alts) in suggestions.items():
+                ranked[sentence] = ({original : list(alts) for original, alts in valid_alts.items()},
+                                    invalid_alts)
+                find_suggestions.sort_alternatives(ranked[sentence][0], sort_by)
+
+            root : str = find_suggestions.results_root(timestamp, search_1, search_2, sort_by)
+            find_suggestions.record_results(ranked, timestamp, k, search_1, search_2,
+                                            sort_by, root)
+            summaries[f"{search_1}-{search_2} (SORTED BY {sort_by})"] = summarise(ranked)
+            roots.append(root)
+
+    print(f"> Summary of every combination saved to {record_summary(summaries, timestamp)}")
+
+    return roots
+
+
+def get_combinations(args : list[str]) -> tuple[list[tuple[str, str]], list[str]]:
+    """
+    RETURNS : searches (search_1-search_2 arguments, e.g. glove-glove) and sort
+    methods (other arguments) given, as named in find_suggestions.py; the
+    defaults for those not given
+    """
+    searches : list[tuple[str, str]] = []
+    sorts : list[str] = []
+
+    for arg in args:
+        if ("-" in arg):
+            search_1, search_2 = arg.split("-", 1)
+            searches.append((find_suggestions.arg_parse(search_1, 1),
+                             find_suggestions.arg_parse(search_2, 2)))
+        else:
+            sorts.append(find_suggestions.arg_parse(arg, 3))
+
+    if (len(searches) == 0):
+        searches = [tuple(search.split("-")) for search in SEARCHES]
+    if (len(sorts) == 0):
+        sorts = SORTS
+
+    return (list(dict.fromkeys(searches)), list(dict.fromkeys(sorts)))
+
+
+# python3 matrix.py [glove-glove] [wordnet-none] [bert-none] ... [glove] [bert] [mlm]
+#                   [--offline] [--backend fp32/int8/onnx] [--no-cache] [--no-metrics]
+if __name__ == "__main__":
+    args, options = find_suggestions.parse_options(sys.argv[1:])
+    metrics.ENABLED = ("--no-metrics" not in options)
+    use_cache : bool = ("--no-cache" not in options)
+
+    if ("--offline" in options):
+        models.set_offline(True)
+    if ("--backend" in options):
+        models.set_backend(options["--backend"])
+
+    searches, sorts = get_combinations(args)
+    timestamp = datetime.datetime.now()
+
+    glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
+    table = features.get_features(GLOVE_VECTORS, glove_data[1])
+    ngsl : list[str] = filters.get_freq().keys()
+    candidates = find_suggestions.open_cache(GLOVE_VECTORS) if (use_cache) else None
+    precomputed = find_suggestions.open_table(GLOVE_VECTORS) if (use_cache) else None
+
+    run_matrix(glove_data, ngsl, find_suggestions.get_samples(SAMPLES), searches, sorts,
+               timestamp, K, table, candidates, precomputed)
+
+    if (metrics.ENABLED):
+        metrics.write_metrics(f"./output/MATRIX-{timestamp}")
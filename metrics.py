@@ -0,0 +1,245 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages are timed with `with metrics.stage(name, items):` and written next to
+# each run's results as {root}.metrics.json. Turn ENABLED off to skip timing:
+ENABLED : bool = True
+
+# Keep a record of every sentence (off for long-lived processes such as server.py,
+# where only the stage / counter totals are of use):
+SENTENCES : bool = True
+
+# Progress lines of the search path (each sentence searched / scored, each batch
+# of BERT or GloVe searches); off for server.py, where they'd flood the output:
+VERBOSE : bool = True
+
+# Live throughput / ETA line (--progress), printed every PROGRESS_EVERY sentences:
+PROGRESS : bool = False
+PROGRESS_EVERY : int = 10
+
+stages : dict[str : dict] = {}      # stage -> {"calls", "items", "seconds"}
+counters : dict[str : int] = {}     # counter -> total (e.g. cache hits)
+sentences : list[dict] = []         # per sentence : {"sentence", "words", "complex", "seconds"}
+started : float = time.time()
+
+lock = threading.Lock()             # stages may be timed from several threads
+
+def reset():
+    """
+    Drops everything recorded so far (e.g. at the start of each worker shard).
+    """
+    global started
+
+    with lock:
+        stages.clear()
+        counters.clear()
+        sentences.clear()
+        started = time.time()
+
+
+def add(name : str, seconds : float, items : int = 0, calls : int = 1):
+    """
+    Adds a timed call of a stage (see stage for timing a block of code).
+    """
+    if (not ENABLED):
+        return
+
+    with lock:
+        totals : dict = stages.setdefault(name, {"calls" : 0, "items" : 0, "seconds" : 0.0})
+        totals["calls"] += calls
+        totals["items"] += items
+        totals["seconds"] += seconds
+
+
+@contextmanager
+def stage(name : str, items : int = 0):
+    """
+    Times the block of code under the given stage name.
+
+    - items : number of items (words, sentences, pairs ...) the block processes
+    """
+    start : float = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - start, items)
+
+
+def timed_iter(name : str, iterable):
+    """
+    Times a lazy iterable (e.g. filters.parse_sentences) under the given stage,
+    one call / item per element produced.
+
+    YIELDS : the elements of the iterable
+    """
+    iterator = iter(iterable)
+
+    while (True):
+        start : float = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+
+        add(name, time.perf_counter() - start, 1)
+        yield item
+
+
+def count(name : str, amount : int = 1):
+    if (not ENABLED):
+        return
+
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def add_sentence(sentence : str, words : int, complex : int, seconds : float):
+    if (not ENABLED or not SENTENCES):
+        return
+
+    with lock:
+        sentences.append({"sentence" : sentence, "words" : words, "complex" : complex,
+                          "seconds" : round(seconds, 6)})
+
+
+def get_metrics() -> dict:
+    """
+    RETURNS : everything recorded since the last reset, as a JSON-friendly
+    dictionary
+    """
+    with lock:
+        return {
+            "started" : str(datetime.datetime.fromtimestamp(started)),
+            "wall_seconds" : round(time.time() - started, 3),
+            "stages" : {name : dict(totals) for name, totals in stages.items()},
+            "counters" : dict(counters),
+            "sentences" : list(sentences)
+        }
+
+
+def merge(other : dict):
+    """
+    Adds the metrics recorded in another process (e.g. a worker of the pool) to
+    the ones recorded here.
+    """
+    for name, totals in other["stages"].items():
+        add(name, totals["seconds"], totals["items"], totals["calls"])
+
+    for name, amount in other["counters"].items():
+        count(name, amount)
+
+    with lock:
+        sentences.extend(other["sentences"])
+
+
+def summarise(data : dict) -> list[str]:
+    """
+    RETURNS : a line per stage (slowest first) with its calls, items, total
+    time and throughput
+    """
+    lines : list[str] = []
+    ranked = sorted(data["stages"].items(), key = lambda stage : stage[1]["seconds"], reverse = True)
+
+    for name, totals in ranked:
+        rate : float = totals["items"] / totals["seconds"] if (totals["seconds"] > 0) else 0
+        lines.append(f"{name:<32}{totals['calls']:>10}{totals['items']:>10}"
+                     f"{totals['seconds']:>10.3f}s{rate:>12.1f} / s")
+
+    return lines
+
+
+def write_sentences(root : str):
+    """
+    Appends the per-sentence records made since the last call to
+    {root}.sentences.jsonl (one JSON object per line) and drops them from
+    memory, so streamed runs never hold the records of the whole corpus.
+    """
+    with lock:
+        records : list[dict] = list(sentences)
+        sentences.clear()
+
+    with open(f"{root}.sentences.jsonl", "a") as output:
+        for record in records:
+            output.write(f"{json.dumps(record)}\n")
+
+
+def write_metrics(root : str, previous : dict = None, summary : bool = True,
+                  per_sentence : bool = True):
+    """
+    Writes the metrics to {root}.metrics.json (next to {root}.txt / .csv) and
+    prints the per-stage summary.
+
+    - previous : metrics of an earlier part of the same run, added to these
+    - summary : False to skip printing the summary
+    - per_sentence : False to leave the per-sentence records out (streamed runs
+      write them to {root}.sentences.jsonl instead, see write_sentences)
+    """
+    data : dict = get_metrics()
+    if (not per_sentence):
+        data.pop("sentences")
+
+    if (previous is not None):
+        data["wall_seconds"] = round(data["wall_seconds"] + previous["wall_seconds"], 3)
+        data["started"] = previous["started"]
+
+        for name, totals in previous["stages"].items():
+            merged : dict = data["stages"].setdefault(name, {"calls" : 0, "items" : 0, "seconds" : 0.0})
+            for field in ["calls", "items", "seconds"]:
+                merged[field] += totals[field]
+
+        for name, amount in previous["counters"].items():
+            data["counters"][name] = data["counters"].get(name, 0) + amount
+
+        if (per_sentence):
+            data["sentences"] = previous.get("sentences", []) + data["sentences"]
+
+    for totals in data["stages"].values():
+        totals["seconds"] = round(totals["seconds"], 6)
+
+    # write to a temporary file first, as streamed runs rewrite it per chunk
+    with open(f"{root}.metrics.json.tmp", "w") as output:
+        json.dump(data, output, indent = 2)
+    os.replace(f"{root}.metrics.json.tmp", f"{root}.metrics.json")
+
+    print(f"> Metrics have been saved to {root}.metrics.json")
+    if (summary):
+        for line in summarise(data):
+            print(f">   {line}")
+
+
+def read_metrics(root : str) -> dict:
+    """
+    RETURNS : the metrics saved for a run, or None if there are none
+    """
+    if (not os.path.exists(f"{root}.metrics.json")):
+        return None
+
+    with open(f"{root}.metrics.json", "r") as data:
+        return json.load(data)
+
+
+def progress_line(done : float, total : float, since : float, unit : str = "sentences",
+                  start : float = 0) -> str:
+    """
+    RETURNS : a live progress line with the throughput and, if the total is
+    known, the estimated time left
+
+    - since : time.time() the work started (or resumed) at
+    - start : amount already done by then (e.g. before a resumed run)
+    """
+    elapsed : float = max(time.time() - since, 1e-9)
+    rate : float = (done - start) / elapsed
+    line : str = f"> {done:.0f}"
+
+    if (total is None):
+        return f"{line} {unit} ({rate:.1f} / s)"
+
+    left : float = (total - done) / rate if (rate > 0) else 0
+    eta : datetime.timedelta = datetime.timedelta(seconds = int(left))
+
+    return f"{line} / {total:.0f} {unit} ({done / max(total, 1):.1%}, {rate:.1f} / s, ETA {eta})"
@@ -0,0 +1,291 @@
+import os
+import shutil
+import threading
+
+# Models are only loaded the first time they are used (see get_model). Set
+# OFFLINE (or SIMPLIFY_OFFLINE=1) to only read models / corpora already in the
+# local caches, without ever contacting the network:
+OFFLINE : bool = (os.environ.get("SIMPLIFY_OFFLINE", "0") == "1")
+
+SPACY_MODEL : str = "en_core_web_trf"
+MODERN_BERT : str = "answerdotai/ModernBERT-large"
+BIO_BERT : str = "dmis-lab/biobert-base-cased-v1.2"
+
+# Model used by BERTScore for English (and the layer its embeddings are taken from)
+BERTSCORE_MODEL : str = "roberta-large"
+BERTSCORE_LAYERS : int = 17
+
+# Inference backend of the transformer models (set_backend / SIMPLIFY_BACKEND) :
+# FP32 = plain PyTorch, INT8 = PyTorch with dynamically int8-quantized linear
+# layers, ONNX = graph exported to ONNX Runtime (fill-mask only; BERTScore uses
+# INT8 with it)
+BACKEND : str = os.environ.get("SIMPLIFY_BACKEND", "FP32").upper()
+BACKENDS : list[str] = ["FP32", "INT8", "ONNX"]
+
+if (BACKEND not in BACKENDS):
+    raise ValueError(f"Unknown SIMPLIFY_BACKEND '{BACKEND}', expected one of {BACKENDS}")
+
+# Models are loaded from MODEL_DIR/<name> (e.g. ./models/ModernBERT-large) when
+# that directory exists, otherwise from the Hugging Face cache / hub; exported
+# ONNX graphs are saved to MODEL_DIR/<name>-onnx
+MODEL_DIR : str = "./models"
+
+# Environment variables read by the Hugging Face libraries when first imported
+OFFLINE_VARIABLES : list[str] = ["HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE",
+                                 "HF_DATASETS_OFFLINE", "HF_EVALUATE_OFFLINE"]
+
+loaders : dict[str : callable] = {}     # model name -> function loading it
+loaded : dict[str : object] = {}        # model name -> loaded model
+lock = threading.Lock()                 # models are loaded once, whichever thread asks first
+
+def set_offline(offline : bool = True):
+    """
+    Turns strict offline mode on / off. Must be called before the first
+    transformer model is loaded, as the Hugging Face libraries only read the
+    setting when they are imported.
+    """
+    global OFFLINE
+    OFFLINE = offline
+
+    for variable in OFFLINE_VARIABLES:
+        if (offline):
+            os.environ[variable] = "1"
+        else:
+            os.environ.pop(variable, None)
+
+    print(f"> Offline mode {'on' if offline else 'off'}")
+
+
+def register(name : str, loader : callable):
+    """
+    Registers (or replaces) the function used to load a model; a model which
+    was already loaded is dropped so the new loader is used next time.
+    """
+    loaders[name] = loader
+    loaded.pop(name, None)
+
+
+def get_model(name : str):
+    """
+    Returns the named model, loading it on first use.
+    """
+    if (name in loaded):
+        return loaded[name]
+
+    with lock:
+        if (name not in loaded):
+            if (name not in loaders):
+                raise KeyError(f"No model registered as '{name}'")
+
+            print(f"> Loading {name}{' (offline)' if OFFLINE else ''}")
+            loaded[name] = loaders[name]()
+
+    return loaded[name]
+
+
+def is_loaded(name : str) -> bool:
+    return name in loaded
+
+
+def load_spacy():
+    import spacy
+
+    return spacy.load(SPACY_MODEL)
+
+
+def model_path(model : str) -> str:
+    """
+    RETURNS : the local directory of the model if there is one, otherwise its
+    Hugging Face name
+    """
+    local : str = os.path.join(MODEL_DIR, model.split("/")[-1])
+
+    return local if (os.path.isdir(local)) else model
+
+
+def quantize(model):
+    """
+    Dynamically quantizes the linear layers of a PyTorch model to int8 (weights
+    stored as int8, activations quantized on the fly), for faster CPU inference.
+    """
+    import torch
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype = torch.qint8)
+
+
+def export_onnx(model : str) -> str:
+    """
+    Exports a masked language model to ONNX in MODEL_DIR/<name>-onnx, unless it
+    already has been. The graph is saved to a temporary directory which is then
+    renamed into place, so an interrupted export is never loaded (and processes
+    exporting at once don't write into the same directory).
+
+    RETURNS : directory of the exported graph
+    """
+    exported : str = os.path.join(MODEL_DIR, f"{model.split('/')[-1]}-onnx")
+
+    if (os.path.isdir(exported)):
+        return exported
+
+    from optimum.onnxruntime import ORTModelForMaskedLM
+
+    print(f"> Exporting {model} to ONNX ({exported})")
+    temp : str = f"{exported}.{os.getpid()}.tmp"
+    onnx_model = ORTModelForMaskedLM.from_pretrained(model_path(model), export = True,
+                                                     local_files_only = OFFLINE)
+    onnx_model.save_pretrained(temp)
+
+    try:
+        os.rename(temp, exported)
+    except OSError:
+        # exported by another process in the meantime
+        if (not os.path.isdir(exported)):
+            raise
+        shutil.rmtree(temp)
+
+    return exported
+
+
+def load_onnx(model : str):
+    """
+    Loads the ONNX Runtime graph of a masked language model, exporting it first
+    if it hasn't been (see export_onnx).
+    """
+    from optimum.onnxruntime import ORTModelForMaskedLM
+
+    return ORTModelForMaskedLM.from_pretrained(export_onnx(model))
+
+
+def load_fill_mask(model : str, backend : str = None):
+    """
+    Returns the fill-mask pipeline of the model run with the given backend
+    (BACKEND by default).
+    """
+    from transformers import pipeline
+
+    backend = (backend or BACKEND).upper()
+    path : str = model_path(model)
+
+    if (backend == "FP32"):
+        return pipeline("fill-mask", model = path,
+                        model_kwargs = {"local_files_only" : OFFLINE})
+
+    from transformers import AutoModelForMaskedLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(path, local_files_only = OFFLINE)
+
+    if (backend == "ONNX"):
+        return pipeline("fill-mask", model = load_onnx(model), tokenizer = tokenizer)
+
+    masked_lm = AutoModelForMaskedLM.from_pretrained(path, local_files_only = OFFLINE)
+
+    return pipeline("fill-mask", model = quantize(masked_lm.eval()), tokenizer = tokenizer)
+
+
+class BERTScorer:
+    """
+    BERTScore with int8-quantized embeddings, answering compute() like the
+    evaluate metric does (only the scores bert.get_scores reads).
+    """
+    scorer : object
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+
+    def compute(self, predictions : list[str], references : list[str], lang : str = "en",
+                batch_size : int = 64) -> dict:
+        precision, recall, f1 = self.scorer.score(predictions, references, batch_size = batch_size)
+
+        return {"precision" : precision.tolist(), "recall" : recall.tolist(), "f1" : f1.tolist()}
+
+
+def load_bertscore(backend : str = None):
+    """
+    Returns the BERTScore metric run with the given backend (BACKEND by default;
+    ONNX isn't available for BERTScore, which reads an inner layer of the model,
+    so INT8 is used instead).
+    """
+    backend = (backend or BACKEND).upper()
+
+    if (backend == "FP32"):
+        from evaluate import load
+
+        return load("bertscore")
+
+    from bert_score import BERTScorer as Scorer
+
+    scorer = Scorer(model_type = model_path(BERTSCORE_MODEL), num_layers = BERTSCORE_LAYERS,
+                    lang = "en", device = "cpu")
+    scorer._model = quantize(scorer._model.eval())
+
+    return BERTScorer(scorer)
+
+
+def load_wordnet():
+    """
+    Returns the NLTK WordNet corpus, downloading it first if it isn't installed
+    (unless in offline mode).
+    """
+    import nltk
+    from nltk.corpus import wordnet
+
+    try:
+        wordnet.ensure_loaded()
+    except LookupError:
+        if (OFFLINE):
+            raise LookupError("WordNet corpus not installed; run nltk.download('wordnet') "
+                              "or turn offline mode off")
+
+        nltk.download("wordnet")
+        wordnet.ensure_loaded()
+
+    return wordnet
+
+
+def set_backend(backend : str):
+    """
+    Selects the inference backend (one of BACKENDS) of the fill-mask pipelines
+    and BERTScore; models already loaded are reloaded with it on next use.
+    """
+    global BACKEND
+    backend = backend.upper()
+
+    if (backend not in BACKENDS):
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    BACKEND = backend
+    register("modern_bert", lambda : load_fill_mask(MODERN_BERT, backend))
+    register("bio_bert", lambda : load_fill_mask(BIO_BERT, backend))
+    register("bertscore", lambda : load_bertscore(backend))
+
+    print(f"> Inference backend : {backend}")
+
+
+register("spacy", load_spacy)
+register("modern_bert", lambda : load_fill_mask(MODERN_BERT))
+register("bio_bert", lambda : load_fill_mask(BIO_BERT))
+register("bertscore", load_bertscore)
+register("wordnet", load_wordnet)
+
+
+def get_nlp():
+    return get_model("spacy")
+
+
+def get_fill_mask(model : str = "MODERN"):
+    if (model.upper().strip() == "BIO"):
+        return get_model("bio_bert")
+
+    return get_model("modern_bert")
+
+
+def get_bertscore():
+    return get_model("bertscore")
+
+
+def get_wordnet():
+    return get_model("wordnet")
+
+
+if (OFFLINE):
+    set_offline(True)
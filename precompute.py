@@ -0,0 +1,125 @@
+import sys
+
+from word import Word
+import cache
+import features
+import filters
+import find_suggestions
+import glove
+import wordnet
+
+# FILEPATH VARIABLES FOR EASE:
+GLOVE_VECTORS : str = "./data_files/commoncrawl.840B.300d.txt"
+
+# Searches precomputed by default (search_1-search_2, as in find_suggestions.py)
+METHODS : list[str] = ["GLOVE-GLOVE", "WORDNET-NONE"]
+
+# POS tags words are precomputed for (the tags WordNet gives words)
+TAGS : list[str] = ["NOUN", "VERB", "ADJ", "ADV"]
+
+BATCH_SIZE : int = 4096     # words searched per batched GloVe search
+
+def get_vocabulary(words : list[str], ngsl : list[str], limit : int = 0) -> list[Word]:
+    """
+    Given the GloVe vocabulary (most frequent first), finds every (word, POS)
+    find_suggestions could be asked to simplify : lowercase, validly formatted
+    words with a WordNet POS tag which filters.skip wouldn't skip.
+
+    - limit : only consider the first limit words of the vocabulary (0 = all)
+
+    RETURNS : list of Words to precompute
+    """
+    vocabulary : list[Word] = []
+    seen : set[str] = set()
+
+    if (limit > 0):
+        words = words[:limit]
+
+    for word in words:
+        key : str = word.lower()
+        if (key in seen or not filters.valid_format(key)):
+            continue
+        seen.add(key)
+
+        for tag in wordnet.get_word_tags(key):
+            original = Word(key, tag)
+
+            if (tag in TAGS and not filters.skip(original, ngsl)):
+                vocabulary.append(original)
+
+    return vocabulary
+
+
+def precompute(glove_data : tuple, ngsl : list[str], vocabulary : list[Word], method : str,
+               store : cache.CandidateCache, table = None, batch_size : int = BATCH_SIZE):
+    """
+    Finds the alternatives of every word in the vocabulary with the given
+    searches and saves them in the table. GloVe neighbours are found batch by
+    batch, with one search for the first search and one per hop of the second
+    (see glove.list_search_batch); words already in the table are skipped, so
+    an interrupted run carries on where it stopped.
+    """
+    search_1, search_2 = method.upper().split("-")
+    key : tuple[str, str] = find_suggestions.cache_key(search_1, search_2)
+
+    if (key is None):
+        print(f"> [NOTE] {method} depends on the sentence and can't be precomputed")
+        return
+
+    print(f"> Precomputing {method} alternatives for {len(vocabulary)} words")
+
+    for start in range(0, len(vocabulary), batch_size):
+        batch : list[Word] = [original for original in vocabulary[start : start + batch_size]
+                              if not store.contains(key[0], original.word, original.type, key[1])]
+
+        neighbours : dict[str : list[tuple]] = {}
+        if (search_1 == "GLOVE" and len(batch) > 0):
+            neighbours = glove.search_batch(glove_data[0], glove_data[1], glove_data[2],
+                                            [original.word for original in batch], glove.K_FIRST)
+
+        # First search word by word (from the batched neighbours), then the second
+        # GloVe search of the whole batch hop by hop (one FAISS search per hop)
+        second_glove : bool = (search_2 in ["GLOVE", "MODERNBERT", "BIOBERT"])
+        results : list[tuple[list, list]] = [
+            find_suggestions.search_word(glove_data, ngsl, original, search_1,
+                                         "NONE" if (second_glove) else search_2, table,
+                                         neighbours.get(original.word))
+            for original in batch]
+
+        if (second_glove and len(batch) > 0):
+            found = glove.list_search_batch(glove_data, ngsl,
+                                            [(valid, original) for (valid, invalid), original
+                                             in zip(results, batch)], table)
+            for (valid, invalid), second in zip(results, found):
+                valid += second
+
+        for original, (valid, invalid) in zip(batch, results):
+            store.put(key[0], original.word, original.type, key[1], valid, invalid)
+
+        store.commit()
+        print(f"> ({min(start + batch_size, len(vocabulary))} / {len(vocabulary)}) words precomputed")
+
+    print(f"> {method} alternatives saved to {store.filepath}")
+
+
+# python3 precompute.py [glove-glove] [wordnet-none] [...] [--limit N]
+if __name__ == "__main__":
+    args, options = find_suggestions.parse_options(sys.argv[1:])
+    methods : list[str] = [arg.upper() for arg in args]
+    limit : int = int(options.get("--limit", 0))
+
+    if (len(methods) == 0):
+        methods = METHODS
+
+    glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
+    table = features.get_features(GLOVE_VECTORS, glove_data[1])
+    ngsl : list[str] = filters.get_freq(filters.FREQ_FILE).keys()
+
+    store : cache.CandidateCache = find_suggestions.open_cache(GLOVE_VECTORS, cache.TABLE_FILE, 0)
+
+    vocabulary : list[Word] = get_vocabulary(glove_data[2], ngsl, limit)
+
+    for method in methods:
+        precompute(glove_data, ngsl, vocabulary, method, store, table)
+
+    store.close()
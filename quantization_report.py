@@ -0,0 +1,155 @@
+import numpy as np
+import datetime
+import os
+import sys
+
+import glove
+from benchmark_index import get_query_words, recall
+
+# FILEPATH VARIABLES FOR EASE:
+GLOVE_VECTORS : str = "./data_files/commoncrawl.840B.300d.txt"
+SAMPLES : str = "./datafiles/all_samples.csv"
+
+K : int = 50    # same number of neighbours as glove.word_search
+
+# Compressed options compared against the FLAT index / FLOAT32 vectors:
+INDEX_TYPES : list[str] = ["SQ16", "SQ8", "PQ", "IVFPQ"]
+STORAGE_TYPES : list[str] = ["FLOAT16", "SQ8"]
+
+def file_size(path : str) -> int:
+    return os.path.getsize(path) if (os.path.exists(path)) else 0
+
+
+def exact_distances(embeddings, queries, found) -> np.ndarray:
+    """
+    Returns the exact (float32) distance between each query and every neighbour
+    found for it; nan for missing neighbours (-1).
+    """
+    distances = np.full(found.shape, np.nan)
+
+    for i in range(len(found)):
+        valid = found[i] >= 0
+        vectors = embeddings.decode(embeddings.matrix[found[i][valid]]).astype("float64")
+        distances[i][valid] = np.linalg.norm(vectors - queries[i], axis = 1)
+
+    return distances
+
+
+def compare_indexes(filepath : str, embeddings, words : list[str], queries, truth,
+                    index_types : list[str], k : int = K) -> list[dict]:
+    """
+    Compares each compressed index with the flat index : how many of the exact
+    k nearest neighbours it finds (recall@k) and how far the distances it
+    reports are from the exact distances of the neighbours it found.
+    """
+    rows : list[dict] = []
+
+    for index_type in index_types:
+        faiss_index = glove.get_faiss_vectors(filepath, index_type)[0]
+        distances, found = faiss_index.search(queries, k + 1)
+
+        # FAISS reports squared L2 distances
+        error = np.abs(np.sqrt(np.maximum(distances, 0)) - exact_distances(embeddings, queries, found))
+
+        rows.append({"OPTION" : f"INDEX {index_type}", "RECALL" : recall(found, truth),
+                     "SAME RANK" : None,
+                     "ERROR" : float(np.nanmean(error)), "MAX ERROR" : float(np.nanmax(error)),
+                     "BYTES" : file_size(glove.index_path(filepath, index_type))})
+
+    return rows
+
+
+def compare_storage(filepath : str, embeddings, words : list[str], truth,
+                    storage_types : list[str]) -> list[dict]:
+    """
+    Compares each compressed storage with the float32 vectors : the error of
+    the GloVe scores (glove.get_scores) between every query word and its exact
+    neighbours, and how many neighbours keep their rank order.
+    """
+    rows : list[dict] = []
+    exact : list[list[float]] = [glove.get_scores(embeddings, word, [embeddings.get_word(id) for id in ids])
+                                 for word, ids in zip(words, truth)]
+
+    for storage in storage_types:
+        stored = glove.get_faiss_vectors(filepath, "FLAT", storage = storage)[1]
+        errors : list[float] = []
+        same_order : int = 0
+
+        for word, ids, scores in zip(words, truth, exact):
+            decoded = glove.get_scores(stored, word, [stored.get_word(id) for id in ids])
+            errors += [abs(a - b) for a, b in zip(decoded, scores)]
+            same_order += sum(np.argsort(decoded, kind = "stable") == np.argsort(scores, kind = "stable"))
+
+        rows.append({"OPTION" : f"STORAGE {storage}", "RECALL" : None,
+                     "SAME RANK" : same_order / truth.size,
+                     "ERROR" : float(np.mean(errors)), "MAX ERROR" : float(np.max(errors)),
+                     "BYTES" : stored.get_nbytes()})
+
+    return rows
+
+
+def report(filepath : str, samples : str, index_types : list[str] = INDEX_TYPES,
+           storage_types : list[str] = STORAGE_TYPES, k : int = K) -> list[dict]:
+    """
+    Compares every compressed index / storage option with the float32 baseline
+    for the words in the samples.
+
+    RETURNS : list of result rows (option, recall (indexes) / share of
+    neighbours keeping their rank (storage), mean + max distance error, bytes
+    on disk / in memory).
+    """
+    flat_data : tuple = glove.get_faiss_vectors(filepath, "FLAT")
+    embeddings = flat_data[1]
+
+    words : list[str] = get_query_words(samples, embeddings)
+    queries = np.ascontiguousarray(embeddings.get_vectors(words), "float32")
+    print(f"> Comparing quantization options with {len(words)} query words from {samples}")
+
+    truth = flat_data[0].search(queries, k + 1)[1]
+    rows : list[dict] = [{"OPTION" : "FLAT / FLOAT32", "RECALL" : 1.0, "SAME RANK" : 1.0,
+                          "ERROR" : 0.0, "MAX ERROR" : 0.0, "BYTES" : embeddings.get_nbytes()}]
+
+    rows += compare_indexes(filepath, embeddings, words, queries, truth, index_types, k)
+    rows += compare_storage(filepath, embeddings, words, truth, storage_types)
+
+    return rows
+
+
+def format_share(share : float) -> str:
+    return "-" if (share is None) else f"{share:.4f}"
+
+
+def record_report(rows : list[dict], k : int):
+    timestamp = datetime.datetime.now()
+
+    with open(f"./output/QUANTIZATION-REPORT-{timestamp}.txt", "a") as log:
+        log.write(f"TIMESTAMP : {timestamp}\n")
+        log.write(f"(RECALL : recall@{k} of indexes, SAME RANK : neighbours keeping their rank "
+                  f"with the storage)\n")
+        log.write(f"{'OPTION':<20}{'RECALL':>10}{'SAME RANK':>12}{'ERROR':>12}{'MAX ERROR':>12}"
+                  f"{'MB':>12}\n")
+
+        for row in rows:
+            line = (f"{row['OPTION']:<20}{format_share(row['RECALL']):>10}"
+                    f"{format_share(row['SAME RANK']):>12}{row['ERROR']:>12.5f}"
+                    f"{row['MAX ERROR']:>12.5f}{row['BYTES'] / 2**20:>12.1f}")
+            print(line)
+            log.write(f"{line}\n")
+
+
+# python3 quantization_report.py [sq16/sq8/pq/ivfpq ...] [float16/sq8 ...]
+if __name__ == "__main__":
+    index_types : list[str] = [arg.upper() for arg in sys.argv[1:] if arg.upper() in glove.INDEX_TYPES]
+    storage_types : list[str] = [arg.upper() for arg in sys.argv[1:]
+                                 if arg.upper() in glove.STORAGE_TYPES and arg.upper() != "SQ8"]
+
+    # sq8 names both an index and a storage type : given once, compare both
+    if ("SQ8" in [arg.upper() for arg in sys.argv[1:]]):
+        storage_types.append("SQ8")
+
+    if (len(index_types) == 0 and len(storage_types) == 0):
+        index_types = INDEX_TYPES
+        storage_types = STORAGE_TYPES
+
+    rows = report(GLOVE_VECTORS, SAMPLES, index_types, storage_types)
+    record_report(rows, K)
@@ -0,0 +1,317 @@
+import asyncio
+import concurrent.futures
+import json
+import sys
+import time
+
+from word import Word
+import features
+import filters
+import find_suggestions
+import glove
+import metrics
+import models
+
+# FILEPATH VARIABLES FOR EASE:
+GLOVE_VECTORS : str = find_suggestions.GLOVE_VECTORS
+
+HOST : str = "127.0.0.1"
+PORT : int = 8765
+
+# Micro-batching : sentences of concurrent requests are searched together, a
+# batch closing once it holds MAX_BATCH sentences or MAX_WAIT seconds after its
+# first sentence arrived (whichever comes first)
+MAX_BATCH : int = 64
+MAX_WAIT : float = 0.02
+
+K : int = 15    # suggestions returned per word (as record_results)
+MAX_BODY : int = 1 << 20    # largest request body accepted (bytes)
+
+class Batcher:
+    """
+    Collects the sentences of concurrent requests into micro-batches and runs
+    each batch through the pipeline (Spacy, FAISS / fill-mask, filters, scoring)
+    on a single background thread, so the event loop keeps accepting requests
+    while a batch runs - and the next batch fills up meanwhile.
+    """
+    search : callable
+    max_batch : int
+    max_wait : float
+    pending : asyncio.Queue
+    executor : concurrent.futures.ThreadPoolExecutor
+
+    def __init__(self, search : callable, max_batch : int = MAX_BATCH, max_wait : float = MAX_WAIT):
+        self.search = search
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = asyncio.Queue()
+        self.executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix = "batch")
+
+    # BASIC FUNCTIONALITIES
+    async def submit(self, sentences : list[str]) -> dict[str : tuple[dict]]:
+        """
+        Queues the sentences for the next batch(es).
+
+        RETURNS : suggestions of each sentence, as find_suggestions + add_scores
+        """
+        loop = asyncio.get_running_loop()
+        futures : list[asyncio.Future] = []
+
+        for sentence in sentences:
+            future = loop.create_future()
+            await self.pending.put((sentence, future))
+            futures.append(future)
+
+        results : list[tuple] = await asyncio.gather(*futures)
+
+        return dict(zip(sentences, results))
+
+    async def next_batch(self) -> list[tuple[str, asyncio.Future]]:
+        """
+        Waits for a sentence, then collects more until the batch is full or
+        max_wait has passed since the first one.
+        """
+        batch : list[tuple] = [await self.pending.get()]
+        deadline : float = time.monotonic() + self.max_wait
+
+        while (len(batch) < self.max_batch):
+            left : float = deadline - time.monotonic()
+            if (left <= 0):
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.pending.get(), left))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run(self):
+        """
+        Runs batches for as long as the server is up.
+        """
+        loop = asyncio.get_running_loop()
+
+        while (True):
+            batch : list[tuple] = await self.next_batch()
+            sentences : list[str] = list(dict.fromkeys(sentence for sentence, future in batch))
+
+            try:
+                with metrics.stage("server.batch", len(sentences)):
+                    suggestions = await loop.run_in_executor(self.executor, self.search, sentences)
+            except Exception as error:
+                for sentence, future in batch:
+                    if (not future.done()):
+                        future.set_exception(error)
+                continue
+
+            for sentence, future in batch:
+                if (not future.done()):
+                    future.set_result(suggestions[sentence])
+
+    def warm_up(self, sentences : list[str]):
+        """
+        Runs the sentences through the pipeline once (on the batch thread), so
+        every model is loaded before the first request.
+        """
+        self.executor.submit(self.search, sentences).result()
+
+
+def to_json(suggestions : dict[str : tuple[dict]], k : int = K) -> list[dict]:
+    """
+    Converts suggestions into JSON-friendly results : for each word of each
+    sentence, the first k ranked alternatives (as written by record_results),
+    or a note of why there are none.
+    """
+    results : list[dict] = []
+
+    for sentence, (valid_alts, invalid_alts) in suggestions.items():
+        words : list[dict] = []
+
+        for original, alts in valid_alts.items():
+            entry : dict = {"word" : original.word, "type" : original.type, "suggestions" : []}
+
+            if (len(alts) == 0):
+                entry["note"] = "No simpler alternatives were found for this word"
+            elif (type(alts[0]) != Word):
+                entry["note"] = alts[0]
+            else:
+                entry["suggestions"] = [{"word" : alt.word, "type" : alt.type,
+                                         "bert_score" : alt.bert_score,
+                                         "glove_score" : alt.glove_score,
+                                         "mlm_score" : alt.mlm_score,
+                                         "text" : alt.get_str()} for alt in alts[:k]]
+            words.append(entry)
+
+        results.append({"sentence" : sentence, "words" : words})
+
+    return results
+
+
+async def read_request(reader : asyncio.StreamReader) -> tuple[str, str, dict, bytes]:
+    """
+    Reads one HTTP/1.1 request.
+
+    RETURNS : method, path, headers (lowercase names) and body; None once the
+    client has closed the connection
+    """
+    line : bytes = await reader.readline()
+    if (len(line) == 0):
+        return None
+
+    method, path, version = line.decode("latin-1").split(" ", 2)
+    headers : dict[str : str] = {}
+
+    while (True):
+        header : str = (await reader.readline()).decode("latin-1").strip()
+        if (header == ""):
+            break
+
+        name, value = header.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+
+    length : int = int(headers.get("content-length", 0))
+    if (length > MAX_BODY):
+        raise ValueError(f"Request body over {MAX_BODY} bytes")
+
+    body : bytes = await reader.readexactly(length) if (length > 0) else b""
+
+    return (method.upper(), path, headers, body)
+
+
+def respond(writer : asyncio.StreamWriter, status : int, data : dict):
+    reasons : dict[int : str] = {200 : "OK", 400 : "Bad Request", 404 : "Not Found",
+                                 500 : "Internal Server Error"}
+    body : bytes = json.dumps(data).encode("utf-8")
+
+    writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+
+
+async def handle(batcher : Batcher, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+    """
+    Serves the requests of one (keep-alive) connection :
+
+    - POST /simplify {"sentences" : [...]} (or {"sentence" : "..."}) : ranked
+      suggestions of every word (see to_json)
+    - GET /health : {"status" : "ok"}
+    - GET /metrics : stage timings and counters since the server started
+    """
+    try:
+        while (True):
+            try:
+                request = await read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError) as error:
+                respond(writer, 400, {"error" : str(error)})
+                break
+
+            if (request is None):
+                break
+            method, path, headers, body = request
+
+            if (method == "GET" and path == "/health"):
+                respond(writer, 200, {"status" : "ok"})
+            elif (method == "GET" and path == "/metrics"):
+                data : dict = metrics.get_metrics()
+                data.pop("sentences")
+                respond(writer, 200, data)
+            elif (method == "POST" and path == "/simplify"):
+                try:
+                    query : dict = json.loads(body or b"{}")
+                    sentences : list[str] = None
+
+                    # anything but a JSON object (e.g. a list) is rejected below
+                    if (isinstance(query, dict)):
+                        sentences = query.get("sentences", [])
+                        if ("sentence" in query):
+                            sentences = [query["sentence"]]
+
+                    if (type(sentences) != list or not all(type(s) == str for s in sentences)):
+                        raise ValueError("expected {\"sentences\" : [str, ...]}")
+                except ValueError as error:
+                    respond(writer, 400, {"error" : str(error)})
+                else:
+                    try:
+                        suggestions = await batcher.submit(sentences)
+                        respond(writer, 200, {"results" : to_json(suggestions)})
+                    except Exception as error:
+                        respond(writer, 500, {"error" : repr(error)})
+            else:
+                respond(writer, 404, {"error" : f"No route for {method} {path}"})
+
+            await writer.drain()
+
+            if (headers.get("connection", "").lower() == "close"):
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def get_search(search_1 : str, search_2 : str, sort_by : str, use_cache : bool = True) -> callable:
+    """
+    Loads GloVe, the feature table and NGSL once.
+
+    RETURNS : function finding and scoring the suggestions of a list of
+    sentences (as find_suggestions + add_scores); it must always be called
+    from the same thread (it opens the candidate cache on first use)
+    """
+    glove_data : tuple = glove.get_faiss_vectors(GLOVE_VECTORS)
+    table = features.get_features(GLOVE_VECTORS, glove_data[1])
+    ngsl : list[str] = filters.get_freq(filters.FREQ_FILE).keys()
+    stores : list = []
+
+    def search(sentences : list[str]) -> dict[str : tuple[dict]]:
+        if (use_cache and len(stores) == 0):
+            stores.extend([find_suggestions.open_cache(GLOVE_VECTORS),
+                           find_suggestions.open_table(GLOVE_VECTORS)])
+
+        candidates, precomputed = stores if (use_cache) else (None, None)
+        suggestions = find_suggestions.find_suggestions(glove_data, ngsl, sentences, search_1,
+                                                        search_2, table, candidates, precomputed)
+        find_suggestions.add_scores(suggestions, glove_data[1], sort_by)
+
+        return suggestions
+
+    return search
+
+
+async def serve(search : callable, host : str = HOST, port : int = PORT,
+                max_batch : int = MAX_BATCH, max_wait : float = MAX_WAIT):
+    batcher = Batcher(search, max_batch, max_wait)
+    batcher.warm_up(["The girl had an abrasion on her knee."])
+
+    server = await asyncio.start_server(lambda reader, writer : handle(batcher, reader, writer),
+                                        host, port)
+    print(f"> Serving on http://{host}:{port} (batches of up to {max_batch}, "
+          f"waiting up to {max_wait * 1000:.0f} ms)")
+
+    async with server:
+        await asyncio.gather(server.serve_forever(), batcher.run())
+
+
+# python3 server.py [glove/wordnet/bert] [glove/wordnet/bert] [glove/bert/mlm]
+#                   [--port N] [--max-batch N] [--max-wait MS] [--offline] [--backend B] [--no-cache]
+if __name__ == "__main__":
+    args, options = find_suggestions.parse_options(sys.argv[1:])
+    metrics.reset()
+    metrics.SENTENCES = False   # /metrics only serves the totals; don't grow per request
+    metrics.VERBOSE = False     # no progress line per sentence / batch searched
+
+    if ("--offline" in options):
+        models.set_offline(True)
+    if ("--backend" in options):
+        models.set_backend(options["--backend"])
+
+    # Same defaults as find_suggestions.py
+    search_1 : str = find_suggestions.arg_parse(args[0], 1) if (len(args) > 0) else "GLOVE"
+    search_2 : str = find_suggestions.arg_parse(args[1], 2) if (len(args) > 1) else "GLOVE"
+    sort_by : str = find_suggestions.arg_parse(args[2], 3) if (len(args) > 2) else "BERT"
+
+    search = get_search(search_1, search_2, sort_by, "--no-cache" not in options)
+
+    asyncio.run(serve(search, HOST, int(options.get("--port", PORT)),
+                      int(options.get("--max-batch", MAX_BATCH)),
+                      float(options.get("--max-wait", MAX_WAIT * 1000)) / 1000))
@@ -0,0 +1,219 @@
+import csv
+import queue
+import threading
+import time
+
+import filters
+import find_suggestions
+import metrics
+
+# Sentences flow through the stages in chunks of CHUNK_SIZE; each queue between
+# two stages holds at most QUEUE_SIZE chunks, so a fast stage waits for a slow
+# one instead of piling up results in memory:
+CHUNK_SIZE : int = 32
+QUEUE_SIZE : int = 2
+
+DONE = None     # put on a queue after the last chunk
+
+def get_chunks(sentences, chunk_size : int = CHUNK_SIZE):
+    """
+    YIELDS : lists of up to chunk_size sentences (read lazily)
+    """
+    chunk : list[str] = []
+
+    for sentence in sentences:
+        chunk.append(sentence)
+
+        if (len(chunk) == chunk_size):
+            yield chunk
+            chunk = []
+
+    if (len(chunk) > 0):
+        yield chunk
+
+
+def run_stage(name : str, function, inbox : queue.Queue, outbox : queue.Queue,
+              errors : list, finish = None):
+    """
+    Body of a stage's thread : applies the function to each chunk from the
+    inbox and puts the result on the outbox (if any), until DONE. Once any stage
+    has failed, chunks are only drained (so no stage blocks on a full queue).
+    Time spent waiting for chunks is recorded as pipeline.{name} (wait).
+
+    - finish : called in the stage's thread once the chunks run out
+    """
+    while (True):
+        start : float = time.perf_counter()
+        item = inbox.get()
+        metrics.add(f"pipeline.{name} (wait)", time.perf_counter() - start)
+
+        if (item is DONE):
+            break
+        if (len(errors) > 0):
+            continue
+
+        try:
+            with metrics.stage(f"pipeline.{name}", 1):
+                result = function(item)
+
+            if (outbox is not None):
+                outbox.put(result)
+        except BaseException as error:
+            errors.append(error)
+
+    try:
+        if (finish is not None):
+            finish()
+    except BaseException as error:
+        errors.append(error)
+
+    if (outbox is not None):
+        outbox.put(DONE)
+
+
+def run_pipeline(sentences, glove_data : tuple, ngsl : list[str], search_1 : str,
+                 search_2 : str, sort_by : str, timestamp, k : int = 15, table = None,
+                 open_stores = None, chunk_size : int = CHUNK_SIZE,
+                 queue_size : int = QUEUE_SIZE) -> tuple[int, int]:
+    """
+    Concurrent run : sentences flow through five stages, each in its own thread
+    and joined by bounded queues, so Spacy, FAISS, the lexical filters, the
+    transformer models and the output files are all busy at once (FAISS and
+    torch release the GIL while they work) :
+
+        parse -> candidates -> filter -> score -> write
+
+    - parse : Spacy tags a chunk of sentences (Spacy calls of every stage are
+      serialised by filters.nlp_lock)
+    - candidates : GloVe neighbours / BERT fill-mask of its complex words, in
+      one batch (see find_suggestions.plan_search)
+    - filter : lookups in the cache / precomputed table, filtering and second
+      searches (see find_suggestions.search_sentences)
+    - score : GloVe + BERTScore / MLM scores (see find_suggestions.add_scores)
+    - write : appends the chunk to the results files (as record_results), in
+      sentence order; a sentence already written by an earlier chunk is
+      skipped, as a sequential run only records it once
+
+    - sentences : any iterable of sentences (read lazily)
+    - open_stores : function returning the (candidate cache, precomputed table)
+      (optional); each stage using them opens its own connections
+
+    RETURNS : number of words identified as complex, and of those with
+    alternatives
+    """
+    print(f"> Running {search_1}-{search_2} (sorted by {sort_by}) as a concurrent pipeline")
+    root : str = find_suggestions.results_root(timestamp, search_1, search_2)
+
+    use_stores : bool = (open_stores is not None and
+                         find_suggestions.cache_key(search_1, search_2) is not None)
+    stores : dict[str : tuple] = {}     # stage -> (candidates, precomputed), per thread
+    totals : dict[str : int] = {"sentences" : 0, "identified" : 0, "suggestions_made" : 0}
+    written : set[str] = set()      # sentences already in the results files
+
+    def get_stores(stage : str) -> tuple:
+        if (stage not in stores):
+            stores[stage] = open_stores() if (use_stores) else (None, None)
+
+        return stores[stage]
+
+    def close_stores(stage : str):
+        for store in stores.get(stage, []):
+            if (store is not None):
+                store.close()
+
+    # STAGES (each only ever runs in its own thread):
+    def parse(chunk : list[str]) -> list[tuple]:
+        return list(metrics.timed_iter("spacy.parse", filters.parse_sentences(chunk)))
+
+    def find_candidates(parsed : list[tuple]) -> tuple:
+        stored : list = [store for store in get_stores("candidates") if store is not None]
+        neighbours, fills = find_suggestions.plan_search(glove_data, ngsl, parsed, search_1,
+                                                         search_2, stored)
+        return (parsed, neighbours, fills)
+
+    def filter_candidates(planned : tuple) -> dict:
+        parsed, neighbours, fills = planned
+        candidates, precomputed = get_stores("filter")
+        stored : list = [store for store in [precomputed, candidates] if store is not None]
+
+        suggestions = find_suggestions.search_sentences(glove_data, ngsl, parsed, search_1,
+                                                        search_2, table, candidates, stored,
+                                                        neighbours, fills, totals["sentences"] + 1)
+        totals["sentences"] += len(parsed)
+
+        if (candidates is not None):
+            candidates.commit()
+
+        return suggestions
+
+    def score(suggestions : dict) -> dict:
+        find_suggestions.add_scores(suggestions, glove_data[1], sort_by)
+
+        return suggestions
+
+    def write(suggestions : dict):
+        suggestions = {sentence : alts for sentence, alts in suggestions.items()
+                       if sentence not in written}
+        written.update(suggestions.keys())
+
+        identified, suggestions_made, csv_data = find_suggestions.write_suggestions(txtfile,
+                                                                                    suggestions, k)
+        csv.DictWriter(csvfile, fieldnames = ["WORD", "SUGGESTIONS"]).writerows(csv_data)
+        txtfile.flush()
+        csvfile.flush()
+
+        totals["identified"] += identified
+        totals["suggestions_made"] += suggestions_made
+        print(f"> {totals['sentences']} sentences searched; {len(suggestions)} more written to {root}")
+
+    def finish_filter():
+        candidates, precomputed = stores.get("filter", (None, None))
+
+        if (precomputed is not None):
+            print(f"> Precomputed table : {precomputed.get_stats()}")
+        if (candidates is not None):
+            print(f"> Candidate cache : {candidates.get_stats()}")
+
+        close_stores("filter")
+
+    # Queue i feeds stage i; the last stage has no outbox
+    steps : list[tuple] = [
+        ("parse", parse, None),
+        ("candidates", find_candidates, lambda : close_stores("candidates")),
+        ("filter", filter_candidates, finish_filter),
+        ("score", score, None),
+        ("write", write, None)
+    ]
+    queues : list[queue.Queue] = [queue.Queue(queue_size) for step in steps]
+    errors : list = []
+
+    with open(f"{root}.txt", "w") as txtfile, open(f"{root}.csv", "w") as csvfile:
+        find_suggestions.write_header(txtfile, timestamp, search_1, search_2, sort_by)
+        csv.DictWriter(csvfile, fieldnames = ["WORD", "SUGGESTIONS"]).writeheader()
+
+        threads : list[threading.Thread] = []
+        for i, (name, function, finish) in enumerate(steps):
+            outbox : queue.Queue = queues[i + 1] if (i + 1 < len(steps)) else None
+            thread = threading.Thread(target = run_stage, name = f"stage-{name}", daemon = True,
+                                      args = (name, function, queues[i], outbox, errors, finish))
+            thread.start()
+            threads.append(thread)
+
+        # Feed the first stage (blocks while it is QUEUE_SIZE chunks behind)
+        for chunk in get_chunks(sentences, chunk_size):
+            if (len(errors) > 0):
+                break
+            queues[0].put(chunk)
+        queues[0].put(DONE)
+
+        for thread in threads:
+            thread.join()
+
+        if (len(errors) > 0):
+            raise errors[0]
+
+        find_suggestions.write_totals(txtfile, totals["identified"], totals["suggestions_made"])
+
+    print(f"> Results have been saved to {root}")
+
+    return (totals["identified"], totals["suggestions_made"])
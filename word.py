@@ -3,12 +3,14 @@ class Word:
     type : str
     bert_score : float
     glove_score : float
+    mlm_score : float
 
     def __init__(self, word : str, type : str):
         self.word = word.lower()
         self.type = type.upper()
         self.bert_score = -1    # higher val = better -> default -ve value
         self.glove_score = 99 # lower val = better -> default high value 
+        self.mlm_score = None   # log-probability (sort_by MLM); None until scored
 
     # SETTERS & GETTERS
     def get_word(self) -> str:
@@ -22,6 +24,9 @@ class Word:
     
     def get_g_score(self) -> float:
         return self.glove_score
+
+    def get_m_score(self) -> float:
+        return self.mlm_score
     
     def set_word(self, word : str):
         self.word = word.lower()
@@ -35,16 +40,21 @@ class Word:
     def set_g_score(self, glove_score : float):
         self.glove_score = glove_score
 
+    def set_m_score(self, mlm_score : float):
+        self.mlm_score = mlm_score
+
     def get_str(self) -> str:
         str_rep = f"> {self.word.lower()} <{self.type.upper()}> || B: {self.bert_score} | G: {self.glove_score}"
 
+        # MLM score only shown once scored (sort_by MLM)
+        if (self.mlm_score is not None):
+            str_rep += f" | M: {self.mlm_score}"
+
         return str_rep
     
     # BASIC FUNCTIONALITIES
     def __str__(self):
-        str_rep = f"> {self.word.lower()} <{self.type.upper()}> || B: {self.bert_score} | G: {self.glove_score}"
-
-        return str_rep
+        return self.get_str()
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -1,10 +1,12 @@
 from word import Word
 import filters
+import lexicon
+import models
 
-import nltk
-from nltk.corpus import wordnet
+import os
 
-nltk.download('wordnet')
+# Compiled WordNet lexicon (built from the NLTK corpus on first use):
+LEXICON : str = "./datafiles/wordnet.lexicon.npz"
 
 TAGS : dict[str : str] = {
     "n" : "NOUN",
@@ -15,6 +17,17 @@ TAGS : dict[str : str] = {
     "u" : "X"
 }
 
+# WordNet lexname prefix (e.g. noun.body -> noun) -> Spacy POS
+LEXNAME_TAGS : dict[str : str] = {
+    "noun" : "NOUN",
+    "verb" : "VERB",
+    "adj" : "ADJ",
+    "adv" : "ADV"
+}
+
+compiled : lexicon.Lexicon = None   # loaded by get_lexicon()
+entries : dict[str : dict] = {}     # word -> {tag : lemma ids} (see get_entries)
+
 def convert_tags(tags : list[str]) -> list[str]:
     """
     Given a list of POS tags from WordNet, converts them into Spacy POS format 
@@ -40,14 +53,98 @@ def convert_tag(tag : str) -> str:
     except KeyError:
         return "X"
 
-def get_word_tags(word : str) -> list[str]:
-    synsets = wordnet.synsets(word)
-    possible = []
+def get_lexicon(filepath : str = LEXICON) -> lexicon.Lexicon:
+    """
+    Returns the compiled WordNet lexicon, loading it on first use (and
+    compiling + saving it the first time, or whenever the installed corpus
+    differs from the one it was compiled from).
+    """
+    global compiled
+
+    if (compiled is None):
+        stamp : dict = corpus_stamp()
+
+        if (os.path.exists(filepath)):
+            compiled = lexicon.load_lexicon(filepath)
+
+            # without the corpus, the lexicon saved is the best there is
+            if (stamp is not None and compiled.source != stamp):
+                print(f"> WordNet corpus has changed since {filepath} was compiled")
+                compiled = None
+
+        if (compiled is None):
+            compiled = lexicon.build_lexicon(models.get_wordnet(), TAGS)
+            lexicon.save_lexicon(compiled, filepath, stamp)
+
+    return compiled
+
+def corpus_path() -> str:
+    """
+    RETURNS : path of the installed NLTK WordNet corpus (the zip, or the
+    directory it was extracted to) which the lexicon is compiled from; None if
+    it isn't installed
+    """
+    import nltk
+
+    try:
+        found = nltk.data.find("corpora/wordnet")
+    except LookupError:
+        return None
+
+    zipped = getattr(found, "zipfile", None)
+
+    return zipped.filename if (zipped is not None) else str(found)
+
+def corpus_stamp() -> dict:
+    """
+    RETURNS : path, size and modification time of the installed WordNet
+    corpus (see corpus_path), which the lexicon is stamped with; None if it
+    isn't installed
+    """
+    path : str = corpus_path()
+    if (path is None):
+        return None
+
+    stats = os.stat(path)
+
+    return {"path" : path, "size" : stats.st_size, "mtime" : int(stats.st_mtime)}
+
+def get_entries(word : str) -> dict[str : list[int]]:
+    """
+    Given a word, finds the lexicon entries to answer from for each POS tag :
+    the word itself if it is a WordNet lemma, otherwise every base form found
+    by WordNet's morphy (e.g. knees -> knee), as wordnet.synsets() would (see
+    Lexicon.morphy).
+
+    RETURNS : dictionary of POS tag -> lemma ids
+    """
+    key : str = word.lower()
+    if (key in entries):
+        return entries[key]
+
+    lex : lexicon.Lexicon = get_lexicon()
+    found : dict[str : list[int]] = {}
+    id : int = lex.get_id(key)
+
+    if (id != -1):
+        for tag in lex.get_tags(id):
+            found[tag] = [id]
+    else:
+        for pos in ["n", "v", "a", "r"]:
+            tag : str = convert_tag(pos)
+
+            for form in lex.morphy(key, pos):
+                form_id : int = lex.get_id(form)
 
-    for set in synsets:
-        possible.append(set.pos())
+                if (form_id not in found.get(tag, [])):
+                    found.setdefault(tag, []).append(form_id)
 
-    return convert_tags(possible)
+    entries[key] = found
+
+    return found
+
+def get_word_tags(word : str) -> list[str]:
+    return list(get_entries(word).keys())
 
 
 def get_word_types(word : str) -> list[str]:
@@ -55,90 +152,76 @@ def get_word_types(word : str) -> list[str]:
     Given a word, returns the type of word it is.
     """
     word_types : list[str] = []
-    synsets = wordnet.synsets(word)
+    lex : lexicon.Lexicon = get_lexicon()
 
-    for set in synsets:
-        type : str = set.lexname().split(".")[0]
-        
-        if (type not in word_types):
-            word_types.append(type.lower())
+    for tag, ids in get_entries(word).items():
+        for id in ids:
+            for lexname in lex.get_lexnames(id):
+                type : str = lexname.split(".")[0].lower()
+
+                if (LEXNAME_TAGS.get(type) == tag and type not in word_types):
+                    word_types.append(type)
     
     return word_types
 
-def get_lemmas(word : str, type : str) -> list[str]:
-    lemmas : list[str] = []
-    synsets = wordnet.synsets(word)
+def merge_synonyms(word : str, tag : str) -> list[str]:
+    """
+    Given a word and a POS tag, returns the synonyms of each of its lexicon
+    entries (see get_entries) in order, without duplicates or the word itself.
+    """
+    synonyms : list[str] = []
+    lex : lexicon.Lexicon = get_lexicon()
 
-    for set in synsets:
-        lemma_type : str = set.lexname().split(".")[0]
+    for id in get_entries(word).get(tag, []):
+        synonyms += [lemma for lemma in lex.get_synonyms(id, tag)
+                     if lemma not in synonyms and lemma.lower() != word.lower()]
 
-        if (lemma_type.lower() == type.lower()):
-            to_add = [lemma for lemma in set.lemma_names() if 
-                      lemma not in lemmas and lemma.lower() != word.lower()]
-            lemmas += to_add
-    
-    return lemmas
+    return synonyms
+
+def get_lemmas(word : str, type : str) -> list[str]:
+    return merge_synonyms(word, LEXNAME_TAGS.get(type.lower(), "X"))
+
+def get_synonyms(original : Word) -> list[str]:
+    """
+    Given a word, returns its WordNet synonyms of the same POS (excluding the
+    word itself).
+    """
+    return merge_synonyms(original.word, original.type.upper())
 
 def word_search(ngsl : list[str], original : Word) -> list[Word]:
     """
     [FIRST SEARCH] Given a word, returns a list of synonymous words from WordNet.
     """
-    synonyms : list[str] = []
-    synsets = wordnet.synsets(original.word)
-
-    for set in synsets:
-        pos_tag : str = convert_tag(set.pos())
-        if (pos_tag.upper() == original.type.upper()):
-            # Only add word if it hasn't already been added
-            parsed : list[str] = [lemma for lemma in set.lemma_names() if
-                                  lemma.lower() not in synonyms and 
-                                  lemma.lower() != original.word.lower()]
-            
-            synonyms += parsed
+    synonyms : list[str] = get_synonyms(original)
     
     filtered : tuple[list[Word]] = filters.sort_suggestions(synonyms, ngsl, original)
 
     return filtered[0]
 
-def word_search_no_filter(original : Word) -> list[str]:
-    synonyms : list[str] = []
-    synsets = wordnet.synsets(original.word)
-
-    for set in synsets:
-        pos_tag : str = convert_tag(set.pos())
-        if (pos_tag.upper() == original.type.upper()):
-            synonymous_words = [word.word.lower() for word in synonyms]
-
-            # Only add word if it hasn't already been added
-            parsed : list[str] = [Word(lemma, pos_tag) for lemma in set.lemma_names() if
-                                  lemma.lower() not in synonymous_words and 
-                                  lemma.lower() != original.word.lower()]
-            
-            synonyms += parsed
+def word_search_no_filter(original : Word) -> list[Word]:
+    pos_tag : str = original.type.upper()
 
-    return synonyms
+    return [Word(lemma, pos_tag) for lemma in get_synonyms(original)]
 
 
-def list_search(ngsl : list[str], current : list[Word], original : Word) -> list[Word]:
+def list_search(ngsl : list[str], current : list[Word], original : Word, 
+                depth : int = 1) -> list[Word]:
     """
     [SECOND SEARCH] Given a list of existing suggestions, finds more synonyms 
     from WordNet
+
+    - depth : number of further synonym hops to take from the suggestions
     """
-    new : list[str] = []
+    tag : str = original.type.upper()
+    lex : lexicon.Lexicon = get_lexicon()
 
+    start : list[int] = []
     for word in current:
-        synsets = wordnet.synsets(word.word)
-        for set in synsets:
-            pos_tag : str = convert_tag(set.pos())
-
-            if (pos_tag.upper() == original.type.upper()):
-                old_suggestions : list[str] =  [word.word.lower() for word in current]
-
-                parsed : list[str] = [lemma for lemma in set.lemma_names() if
-                                      lemma.lower() not in old_suggestions and 
-                                      lemma.lower() not in new]
-                
-                new += parsed
+        start += [id for id in get_entries(word.word).get(tag, []) if id not in start]
+
+    # existing suggestions (even those WordNet can't find) are never re-added
+    exclude : list[int] = [lex.get_id(word.word) for word in current if word.word in lex]
+    new : list[str] = lex.expand(start, tag, depth, exclude)
     
     filtered : tuple[list[Word]] = filters.sort_suggestions(new, ngsl, original)
 
@@ -154,7 +237,7 @@ if __name__ == "__main__" :
             print("> Exiting program.")
             break
 
-        synsets = wordnet.synsets(word)
+        synsets = models.get_wordnet().synsets(word)
         for arr in synsets:
             print(f"{arr} || {arr.definition()}")
             print(arr.lemma_names())